@@ -0,0 +1,58 @@
+"""
+Memory of a year of 5 minute bars: list of dicts vs BarSeries.
+
+    cd src
+    python -m benchmarks.bars --rows 20000
+"""
+import argparse
+import json
+import tracemalloc
+
+from decimal import Decimal
+
+from helpers.bars import BarSeries
+from helpers.clients import transform_polygon_result, transform_polygon_results_columnar
+
+from .transform import make_polygon_results
+
+
+def to_decimal_dataset(results):
+    # the shape clients and querysets hand around today
+    dataset = []
+    for result in results:
+        data = transform_polygon_result(result)
+        for key in ('open_price', 'close_price', 'high_price', 'low_price', 'volume_weighted_average'):
+            data[key] = Decimal(str(data[key]))
+        dataset.append(data)
+    return dataset
+
+
+def measure_memory(func, *args):
+    tracemalloc.start()
+    value = func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, {"retained_bytes": current, "peak_bytes": peak}
+
+
+def run(rows=20_000):
+    # ~ one year of regular-hours 5 minute bars (252 days x 78 bars)
+    results = make_polygon_results(rows=rows)
+    _, dicts = measure_memory(to_decimal_dataset, results)
+    series, columnar = measure_memory(
+        lambda r: BarSeries(transform_polygon_results_columnar(r)),
+        results
+    )
+    return {
+        "rows": rows,
+        "list_of_dicts": dicts,
+        "bar_series": {**columnar, "nbytes": series.nbytes},
+        "reduction": dicts["retained_bytes"] / max(1, columnar["retained_bytes"]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    args = parser.parse_args()
+    print(json.dumps(run(rows=args.rows), indent=2))
@@ -0,0 +1,74 @@
+"""
+Measurement helpers: latency percentiles, throughput, query counts
+and peak memory of a callable.
+"""
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def get_percentiles(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        "min": float(samples.min()),
+        "p50": float(np.percentile(samples, 50)),
+        "p90": float(np.percentile(samples, 90)),
+        "p99": float(np.percentile(samples, 99)),
+        "max": float(samples.max()),
+        "mean": float(samples.mean()),
+    }
+
+
+def count_queries(func, using="default"):
+    """
+    (result, number of queries, seconds spent in the database).
+    """
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connections[using]) as context:
+        value = func()
+    db_seconds = sum(float(query.get("time") or 0) for query in context.captured_queries)
+    return value, len(context.captured_queries), db_seconds
+
+
+def measure(func, repeat=5, warmup=1, rows=None, setup=None, track_queries=True):
+    """
+    Time `func()` `repeat` times (after `warmup` calls), then once more
+    for queries and once under tracemalloc for peak memory, so the
+    tracing does not skew the latencies. `rows` (or a callable on the
+    result) gives rows per second. `setup()` runs before every call,
+    untimed.
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        func()
+    samples = []
+    value = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        value = func()
+        samples.append(time.perf_counter() - start)
+    report = {"repeat": repeat, "seconds": get_percentiles(samples)}
+    if callable(rows):
+        rows = rows(value)
+    if rows is not None:
+        report["rows"] = rows
+        report["rows_per_second"] = rows / report["seconds"]["p50"] if report["seconds"]["p50"] > 0 else 0.0
+    if track_queries:
+        if setup is not None:
+            setup()
+        _, queries, db_seconds = count_queries(func)
+        report["queries"] = queries
+        report["db_seconds"] = db_seconds
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report["peak_memory_bytes"] = peak
+    return report
@@ -0,0 +1,258 @@
+"""
+Load test: the async indicator views on the ASGI handler vs the sync
+views on the WSGI handler.
+
+Both handlers run in-process (no HTTP server or sockets), driven by the
+same `--clients` concurrent clients sending requests back to back:
+
+- asgi: Django's ASGIHandler on one event loop, like one uvicorn
+  worker, serving `/market/async/...`.
+- wsgi: Django's WSGIHandler on a pool of `--threads` threads, like one
+  gunicorn gthread worker, serving the sync `/market/...` views.
+
+Reports requests per second, latency percentiles and the peak thread
+count. `--no-cache` disables the indicator cache so every request reads
+the database.
+
+    cd src
+    python -m benchmarks.load --clients 50 --threads 8 --requests 20 --endpoint multi --no-cache
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cfehome.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+from market.models import StockQuote  # noqa: E402
+from market.utils import batch_insert_stock_data  # noqa: E402
+
+from . import synthetic  # noqa: E402
+from .harness import get_percentiles  # noqa: E402
+from .suite import get_companies  # noqa: E402
+
+
+def seed(tickers=10, years=0.25, seed=42):
+    """
+    Synthetic bars for `tickers` BENCH companies that have none yet.
+    """
+    ticker_names = synthetic.get_tickers(count=tickers)
+    companies = get_companies(ticker_names)
+    for ticker in ticker_names:
+        if not StockQuote.objects.filter(company=companies[ticker]).exists():
+            batch_insert_stock_data(dataset=synthetic.make_bar_series(ticker, years=years, seed=seed), company_obj=companies[ticker])
+    return ticker_names
+
+
+def get_paths(tickers, endpoint="ticker", days=30):
+    """
+    (asgi path, wsgi path, query string) per request, cycled by the clients.
+    """
+    if endpoint == "multi":
+        query = f"days={days}&tickers={','.join(tickers)}"
+        return [("/market/async/indicators", "/market/indicators", query)]
+    return [
+        (f"/market/async/{ticker}/indicators", f"/market/{ticker}/indicators", f"days={days}")
+        for ticker in tickers
+    ]
+
+
+async def asgi_request(app, path, query):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = []
+
+    async def receive():
+        if len(messages) > 0:
+            return messages.pop(0)
+        # the client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def wsgi_request(app, path, query):
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update({"PATH_INFO": path, "QUERY_STRING": query, "REQUEST_METHOD": "GET", "HTTP_HOST": "localhost"})
+    status = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split()[0]))
+
+    body = app(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return status[0]
+
+
+async def drive(request, paths, clients=50, requests=20):
+    """
+    `clients` concurrent clients each sending `requests` requests;
+    `request(path, query)` is awaited for each.
+    """
+    latencies = []
+    errors = 0
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def client(index):
+        nonlocal errors
+        for i in range(requests):
+            path, query = paths[(index + i) % len(paths)]
+            start = time.perf_counter()
+            status = await request(path, query)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    sampler = asyncio.create_task(sample_threads())
+    start = time.perf_counter()
+    await asyncio.gather(*[client(index) for index in range(clients)])
+    seconds = time.perf_counter() - start
+    done.set()
+    await sampler
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds if seconds > 0 else 0.0,
+        "latency": get_percentiles(latencies),
+        "peak_threads": peak_threads,
+    }
+
+
+def run_asgi(paths, clients=50, requests=20):
+    app = get_asgi_application()
+    asgi_paths = [(asgi_path, query) for asgi_path, _, query in paths]
+
+    async def main():
+        return await drive(lambda path, query: asgi_request(app, path, query), asgi_paths, clients=clients, requests=requests)
+
+    return asyncio.run(main())
+
+
+def run_wsgi(paths, clients=50, requests=20, threads=8):
+    app = get_wsgi_application()
+    wsgi_paths = [(wsgi_path, query) for _, wsgi_path, query in paths]
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return await drive(
+                lambda path, query: loop.run_in_executor(pool, wsgi_request, app, path, query),
+                wsgi_paths,
+                clients=clients,
+                requests=requests,
+            )
+
+    return asyncio.run(main())
+
+
+def run(tickers=10, clients=50, requests=20, threads=8, endpoint="ticker", days=30, use_cache=True, verbose=False):
+    if not use_cache:
+        settings.MARKET_INDICATOR_CACHE_TIMEOUT = 0
+    ticker_names = seed(tickers=tickers)
+    paths = get_paths(ticker_names, endpoint=endpoint, days=days)
+    # warm both paths (imports, connections, url resolver)
+    run_wsgi(paths, clients=1, requests=len(paths), threads=1)
+    run_asgi(paths, clients=1, requests=len(paths))
+    results = {}
+    for name, func in (
+        ("wsgi", lambda: run_wsgi(paths, clients=clients, requests=requests, threads=threads)),
+        ("asgi", lambda: run_asgi(paths, clients=clients, requests=requests)),
+    ):
+        results[name] = func()
+        if verbose:
+            print(name, f"{results[name]['requests_per_second']:.1f} req/s", file=sys.stderr)
+    return {
+        "meta": {
+            "tickers": tickers,
+            "clients": clients,
+            "requests_per_client": requests,
+            "wsgi_threads": threads,
+            "endpoint": endpoint,
+            "days": days,
+            "cache": use_cache,
+        },
+        "results": results,
+    }
+
+
+def format_table(report):
+    lines = [f"{'handler':8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7} {'threads':>8}"]
+    for name, result in report["results"].items():
+        lines.append(
+            f"{name:8} {result['requests_per_second']:10.1f} "
+            f"{result['latency']['p50'] * 1000:10.2f} {result['latency']['p99'] * 1000:10.2f} "
+            f"{result['errors']:7d} {result['peak_threads']:8d}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+    parser.add_argument("--endpoint", choices=["ticker", "multi"], default="ticker")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    report = run(
+        tickers=args.tickers,
+        clients=args.clients,
+        requests=args.requests,
+        threads=args.threads,
+        endpoint=args.endpoint,
+        days=args.days,
+        use_cache=not args.no_cache,
+        verbose=args.verbose,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(format_table(report))
@@ -0,0 +1,161 @@
+"""
+StockQuote scans before and after hypertable compression.
+
+Seeds N synthetic tickers x M years of 5 minute bars (TimescaleDB
+required), measures the range scans behind `market.services` and the
+rollup refresh, compresses chunks older than `--compress-after-days`
+and measures again. Prints the p50 comparison and the table size
+before / after.
+
+    cd src
+    python -m benchmarks.storage --tickers 5 --years 1 --output storage.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cfehome.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from market import policies  # noqa: E402
+from market import services as market_services  # noqa: E402
+from market.models import Company, HourlyStockQuote, StockQuote  # noqa: E402
+from market.utils import batch_insert_stock_data  # noqa: E402
+
+from . import synthetic  # noqa: E402
+from .harness import measure  # noqa: E402
+from .suite import compare, get_companies, get_git_commit  # noqa: E402
+
+
+def get_hypertable_bytes():
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT hypertable_size('{policies.HYPERTABLE}')")
+        return cursor.fetchone()[0]
+
+
+def get_scans(ticker, company_ids, days=30):
+    """
+    name -> callable for the query patterns the services run.
+    """
+    now = timezone.now()
+
+    def raw_range(start_days, end_days=0):
+        # the `update_indicator_state` / bars read: one company, a time range
+        return lambda: len(list(
+            StockQuote.objects.filter(
+                company__ticker=ticker,
+                time__range=(now - timedelta(days=start_days), now - timedelta(days=end_days))
+            ).values_list('time', 'close_price', 'volume')
+        ))
+
+    return {
+        "raw_range_7d": raw_range(7),
+        "raw_range_90d_to_60d": raw_range(90, 60),
+        "raw_range_365d": raw_range(365),
+        "daily_universe_30d": lambda: len(list(
+            market_services.get_daily_quotes_queryset(
+                start_date=now - timedelta(days=days), company_id__in=company_ids
+            ).values_list('company_id', 'close_price')
+        )),
+        "hourly_range_365d": lambda: len(list(
+            HourlyStockQuote.objects.filter(
+                company__ticker=ticker, time__gte=now - timedelta(days=365)
+            ).values_list('time', 'close_price')
+        )),
+        "get_stock_indicators": lambda: market_services.get_stock_indicators(ticker, days=days),
+        "screen_universe": lambda: market_services.screen_universe(days=days, company_ids=company_ids),
+        "refresh_aggregates": lambda: policies.refresh_aggregates(connection, retention_days=0),
+    }
+
+
+def run_scans(scans, repeat=5, verbose=False):
+    results = {}
+    for name, func in scans.items():
+        results[name] = measure(func, repeat=repeat, rows=lambda value: value if isinstance(value, int) else None)
+        if verbose:
+            print(f"{name}: p50 {results[name]['seconds']['p50']:.6f}s", file=sys.stderr)
+    return results
+
+
+def run(tickers=5, years=1, days=30, repeat=5, seed=42, compress_after_days=7, keep_data=False, verbose=False):
+    if not policies.has_timescaledb(connection):
+        raise Exception("The storage benchmark needs TimescaleDB")
+    ticker_names = synthetic.get_tickers(count=tickers)
+    companies = get_companies(ticker_names)
+    StockQuote.objects.filter(company__in=companies.values()).delete()
+    rows = 0
+    for ticker in ticker_names:
+        series = synthetic.make_bar_series(ticker, years=years, seed=seed)
+        rows += batch_insert_stock_data(dataset=series, company_obj=companies[ticker])["total"]
+    policies.refresh_aggregates(connection, retention_days=0)
+    company_ids = [obj.id for obj in companies.values()]
+    scans = get_scans(ticker_names[0], company_ids, days=days)
+
+    size_before = get_hypertable_bytes()
+    before = run_scans(scans, repeat=repeat, verbose=verbose)
+    compressed_chunks = policies.compress_chunks(connection, older_than_days=compress_after_days)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {policies.HYPERTABLE}")
+    size_after = get_hypertable_bytes()
+    after = run_scans(scans, repeat=repeat, verbose=verbose)
+
+    if not keep_data:
+        Company.objects.filter(ticker__in=ticker_names).delete()
+
+    meta = {
+        "timestamp": timezone.now().isoformat(),
+        "git_commit": get_git_commit(),
+        "tickers": tickers,
+        "years": years,
+        "days": days,
+        "repeat": repeat,
+        "seed": seed,
+        "rows": rows,
+        "compress_after_days": compress_after_days,
+        "compressed_chunks": compressed_chunks,
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+    }
+    return {
+        "before": {"meta": meta, "results": before},
+        "after": {"meta": meta, "results": after},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=5)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compress-after-days", type=int, default=7)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    report = run(
+        tickers=args.tickers,
+        years=args.years,
+        days=args.days,
+        repeat=args.repeat,
+        seed=args.seed,
+        compress_after_days=args.compress_after_days,
+        keep_data=args.keep_data,
+        verbose=args.verbose,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    meta = report["after"]["meta"]
+    print(f"{meta['rows']} rows, {meta['compressed_chunks']} chunks compressed, "
+          f"{meta['bytes_before']} -> {meta['bytes_after']} bytes")
+    print(compare(report["before"], report["after"]))
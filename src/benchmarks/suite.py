@@ -0,0 +1,235 @@
+"""
+Ingest and analysis benchmark suite.
+
+Seeds N synthetic tickers x M years of 5 minute bars into the configured
+database (the compose TimescaleDB through DATABASE_URL) and measures the
+transform, insert, daily query and indicator paths: latency
+percentiles, rows per second, query counts, DB time and peak memory.
+Results are written as JSON; `--compare` prints the change against an
+earlier run. Bars end on a fixed date (`--end-date`, default
+`synthetic.END_DATE`) and `timezone.now` is pinned just after it, so
+runs on different days measure the same rows.
+
+    cd src
+    python -m benchmarks.suite --tickers 5 --years 1 --output bench.json
+    python -m benchmarks.suite --tickers 5 --years 1 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cfehome.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from helpers.clients import transform_polygon_result, transform_polygon_results_columnar  # noqa: E402
+from market import indicators as market_indicators  # noqa: E402
+from market import services as market_services  # noqa: E402
+from market.models import Company, StockQuote  # noqa: E402
+from market.utils import batch_insert_stock_data  # noqa: E402
+
+from . import synthetic  # noqa: E402
+from .harness import measure  # noqa: E402
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def get_companies(tickers):
+    # bulk_create skips Company.save, which would queue a Polygon sync
+    Company.objects.bulk_create(
+        [Company(name=f"Benchmark {ticker}", ticker=ticker) for ticker in tickers],
+        ignore_conflicts=True
+    )
+    return {obj.ticker: obj for obj in Company.objects.filter(ticker__in=tickers)}
+
+
+def refresh_daily_aggregate():
+    if not market_services.use_daily_aggregate():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CALL refresh_continuous_aggregate('market_dailystockquote', NULL, NULL)")
+
+
+def run(tickers=5, years=1, days=30, repeat=5, seed=42, end_date=None, keep_data=False, verbose=False):
+    if end_date is None:
+        end_date = synthetic.END_DATE
+    # the services' `days` windows end at timezone.now()
+    with mock.patch("django.utils.timezone.now", return_value=synthetic.get_end_time(end_date)):
+        ticker_names = synthetic.get_tickers(count=tickers)
+        companies = get_companies(ticker_names)
+        StockQuote.objects.filter(company__in=companies.values()).delete()
+        first = ticker_names[0]
+        first_company = companies[first]
+        results = {}
+
+        def log(name):
+            if verbose:
+                report = results[name]
+                print(f"{name}: p50 {report['seconds']['p50']:.6f}s", file=sys.stderr)
+
+        polygon_results = synthetic.make_polygon_results(first, years=years, seed=seed, end_date=end_date)
+        rows = len(polygon_results)
+        results["transform_polygon_result"] = measure(
+            lambda: [transform_polygon_result(result) for result in polygon_results],
+            repeat=repeat, rows=rows, track_queries=False
+        )
+        log("transform_polygon_result")
+        results["transform_polygon_results_columnar"] = measure(
+            lambda: transform_polygon_results_columnar(polygon_results),
+            repeat=repeat, rows=rows, track_queries=False
+        )
+        log("transform_polygon_results_columnar")
+
+        dataset = [transform_polygon_result(result) for result in polygon_results]
+
+        def clear_first():
+            StockQuote.objects.filter(company=first_company).delete()
+
+        results["batch_insert_stock_data"] = measure(
+            lambda: batch_insert_stock_data(dataset=dataset, company_obj=first_company),
+            repeat=min(repeat, 3), warmup=0, rows=rows, setup=clear_first
+        )
+        log("batch_insert_stock_data")
+        results["batch_insert_stock_data_conflicts"] = measure(
+            lambda: batch_insert_stock_data(dataset=dataset, company_obj=first_company),
+            repeat=min(repeat, 3), warmup=0, rows=rows
+        )
+        log("batch_insert_stock_data_conflicts")
+
+        def load_universe():
+            total = 0
+            for ticker in ticker_names[1:]:
+                series = synthetic.make_bar_series(ticker, years=years, seed=seed, end_date=end_date)
+                total += batch_insert_stock_data(dataset=series, company_obj=companies[ticker])["total"]
+            return total
+
+        results["batch_insert_stock_data_universe"] = measure(
+            load_universe, repeat=1, warmup=0, rows=lambda total: total, track_queries=False
+        )
+        log("batch_insert_stock_data_universe")
+        refresh_daily_aggregate()
+
+        results["get_daily_stock_quotes_queryset"] = measure(
+            lambda: list(market_services.get_daily_stock_quotes_queryset(first, days=days)),
+            repeat=repeat, rows=len
+        )
+        log("get_daily_stock_quotes_queryset")
+        results["get_daily_stock_quotes_arrays"] = measure(
+            lambda: market_services.get_daily_stock_quotes_arrays(first, days=days),
+            repeat=repeat, rows=lambda bars: len(bars['close'])
+        )
+        log("get_daily_stock_quotes_arrays")
+
+        bars = market_services.get_daily_stock_quotes_arrays(first, days=days)
+        indicator_functions = {
+            "compute_moving_averages": lambda: market_indicators.compute_moving_averages(bars['close']),
+            "compute_price_target": lambda: market_indicators.compute_price_target(bars['close'], bars['high'], bars['low']),
+            "compute_volume_trend": lambda: market_indicators.compute_volume_trend(bars['volume'], days=days),
+            "compute_rsi": lambda: market_indicators.compute_rsi(bars['close'], days=days, period=14),
+            "compute_stock_indicators": lambda: market_indicators.compute_stock_indicators(first, bars, days=days),
+        }
+        for name, func in indicator_functions.items():
+            results[name] = measure(func, repeat=max(repeat, 50), track_queries=False)
+            log(name)
+
+        service_functions = {
+            "get_daily_moving_averages": lambda: market_services.get_daily_moving_averages(first, days=days),
+            "get_price_target": lambda: market_services.get_price_target(first, days=days),
+            "get_volume_trend": lambda: market_services.get_volume_trend(first, days=days),
+            "calculate_rsi": lambda: market_services.calculate_rsi(first, days=days),
+            "get_stock_indicators": lambda: market_services.get_stock_indicators(first, days=days),
+            "screen_universe": lambda: market_services.screen_universe(days=days, company_ids=[obj.id for obj in companies.values()]),
+        }
+        for name, func in service_functions.items():
+            results[name] = measure(func, repeat=repeat)
+            log(name)
+
+        if not keep_data:
+            Company.objects.filter(ticker__in=ticker_names).delete()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(dt_timezone.utc).isoformat(),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": connection.vendor,
+            "tickers": tickers,
+            "years": years,
+            "days": days,
+            "repeat": repeat,
+            "seed": seed,
+            "end_date": end_date.isoformat(),
+            "rows_per_ticker": rows,
+        },
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """
+    Lines of p50 latency old vs new per benchmark (ratio > 1 is slower).
+    """
+    lines = [f"{'benchmark':40} {'before p50':>12} {'after p50':>12} {'ratio':>8}"]
+    for name, report in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        old = before["seconds"]["p50"]
+        new = report["seconds"]["p50"]
+        ratio = new / old if old > 0 else float("inf")
+        lines.append(f"{name:40} {old:12.6f} {new:12.6f} {ratio:8.2f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=5)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=synthetic.END_DATE, help="last session day of the bars")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare with")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    report = run(
+        tickers=args.tickers,
+        years=args.years,
+        days=args.days,
+        repeat=args.repeat,
+        seed=args.seed,
+        end_date=args.end_date,
+        keep_data=args.keep_data,
+        verbose=args.verbose,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report))
+    elif not args.output:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,106 @@
+"""
+Deterministic synthetic market data.
+
+Regular-hours 5 minute bars (09:30-16:00 US/Eastern, 78 per weekday)
+for N tickers over M years, ending on `end_date` (yesterday by
+default, so there are no bars in the future). The same (ticker, seed,
+end_date) always produces the same bars; the suite pins `END_DATE`
+and the clock to it so its runs compare.
+"""
+import zlib
+
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+
+from helpers.bars import BarSeries
+
+
+BAR_MINUTES = 5
+BARS_PER_DAY = 78
+# 09:30 US/Eastern (standard time) in UTC
+SESSION_OPEN_UTC = time(14, 30)
+# the benchmark suite's default last session day
+END_DATE = date(2024, 12, 31)
+
+
+def get_session_days(years=1, end_date=None):
+    """
+    Weekdays covering the last `years` years, oldest first.
+    """
+    if end_date is None:
+        end_date = datetime.now(dt_timezone.utc).date() - timedelta(days=1)
+    start_date = end_date - timedelta(days=int(365 * years))
+    days = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    weekday = (days.astype('datetime64[D]').view('int64') - 4) % 7
+    return days[weekday < 5]
+
+
+def get_end_time(end_date):
+    """
+    Midnight UTC after `end_date`'s session: a `now` that puts every
+    bar inside the services' `days` windows.
+    """
+    return datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+
+
+def get_ticker_seed(ticker, seed=42):
+    return zlib.crc32(f"{ticker}:{seed}".encode())
+
+
+def make_bar_columns(ticker="BENCH0", years=1, seed=42, end_date=None):
+    """
+    BarSeries-style columns (int64 epoch ms, float64 OHLC/VWAP,
+    int64 volume and trades) from a seeded geometric random walk.
+    """
+    rng = np.random.default_rng(get_ticker_seed(ticker, seed=seed))
+    days = get_session_days(years=years, end_date=end_date)
+    open_ms = (days.astype('datetime64[ms]').view('int64')
+               + (SESSION_OPEN_UTC.hour * 60 + SESSION_OPEN_UTC.minute) * 60_000)
+    offsets = np.arange(BARS_PER_DAY, dtype=np.int64) * BAR_MINUTES * 60_000
+    time_ms = (open_ms[:, None] + offsets[None, :]).ravel()
+    n = len(time_ms)
+    start_price = rng.uniform(20, 500)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.0015, n)))
+    open_price = np.r_[start_price, close[:-1]]
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    high = np.maximum(open_price, close) + spread
+    low = np.minimum(open_price, close) - spread
+    return {
+        'time_ms': time_ms,
+        'open': np.round(open_price, 4),
+        'high': np.round(high, 4),
+        'low': np.round(low, 4),
+        'close': np.round(close, 4),
+        'vwap': np.round((open_price + close + high + low) / 4, 4),
+        'volume': rng.integers(1_000, 200_000, n),
+        'trades': rng.integers(10, 2_000, n),
+    }
+
+
+def make_bar_series(ticker="BENCH0", years=1, seed=42, end_date=None):
+    return BarSeries.from_columns(make_bar_columns(ticker=ticker, years=years, seed=seed, end_date=end_date))
+
+
+def make_polygon_results(ticker="BENCH0", years=1, seed=42, end_date=None):
+    """
+    The same bars as a polygon aggregates `results` list.
+    """
+    columns = make_bar_columns(ticker=ticker, years=years, seed=seed, end_date=end_date)
+    return [
+        {'v': v, 'vw': vw, 'o': o, 'c': c, 'h': h, 'l': l, 't': t, 'n': n}
+        for t, o, h, l, c, vw, v, n in zip(
+            columns['time_ms'].tolist(),
+            columns['open'].tolist(),
+            columns['high'].tolist(),
+            columns['low'].tolist(),
+            columns['close'].tolist(),
+            columns['vwap'].tolist(),
+            columns['volume'].tolist(),
+            columns['trades'].tolist(),
+        )
+    ]
+
+
+def get_tickers(count=5, prefix="BENCH"):
+    return [f"{prefix}{i}" for i in range(count)]
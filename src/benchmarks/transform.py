@@ -0,0 +1,77 @@
+"""
+Polygon response transform: dict-per-row vs columnar.
+
+    cd src
+    python -m benchmarks.transform --rows 50000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from helpers.clients import transform_polygon_result, transform_polygon_results_columnar
+
+
+def make_polygon_results(rows=50_000, seed=42):
+    """
+    Deterministic, polygon-shaped 5 minute aggregate results.
+    """
+    rnd = random.Random(seed)
+    start_ms = 1704790800000
+    price = 150.0
+    results = []
+    for i in range(rows):
+        open_price = price
+        price = max(1.0, price + rnd.gauss(0, 0.2))
+        results.append({
+            'v': rnd.randint(100, 50_000),
+            'vw': round((open_price + price) / 2, 4),
+            'o': round(open_price, 4),
+            'c': round(price, 4),
+            'h': round(max(open_price, price) + 0.05, 4),
+            'l': round(min(open_price, price) - 0.05, 4),
+            't': start_ms + i * 300_000,
+            'n': rnd.randint(1, 500),
+        })
+    return results
+
+
+def measure(func, results, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(results)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    tracemalloc.start()
+    output = func(results)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del output
+    return {
+        "seconds": best,
+        "rows_per_second": len(results) / best if best > 0 else 0.0,
+        "peak_memory_bytes": peak,
+    }
+
+
+def transform_dicts(results):
+    return [transform_polygon_result(result) for result in results]
+
+
+def run(rows=50_000, repeat=3):
+    results = make_polygon_results(rows=rows)
+    return {
+        "rows": rows,
+        "dict_per_row": measure(transform_dicts, results, repeat=repeat),
+        "columnar": measure(transform_polygon_results_columnar, results, repeat=repeat),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(rows=args.rows, repeat=args.repeat), indent=2))
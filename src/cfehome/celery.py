@@ -1,5 +1,8 @@
 import os
+import time
+
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cfehome.settings")
 
@@ -9,3 +12,33 @@ app.config_from_object(
     namespace='CELERY'
 )
 app.autodiscover_tasks()
+
+# task_id -> start time, for tasks running in this worker process
+_task_starts = {}
+
+
+@before_task_publish.connect
+def add_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    from helpers import metrics
+    _task_starts[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is None:
+        published_at = (getattr(task.request, "headers", None) or {}).get("published_at")
+    if published_at is not None:
+        lag = max(time.time() - float(published_at), 0.0)
+        metrics.observe("celery_task_queue_lag_seconds", lag, task=task.name)
+
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, state=None, **kwargs):
+    from helpers import metrics
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        metrics.observe("celery_task_seconds", time.perf_counter() - start, task=task.name, state=state or "UNKNOWN")
+    metrics.flush()
@@ -0,0 +1,113 @@
+"""
+The Prometheus `/metrics` endpoint and a per-request query profiler.
+
+The profiler is off by default and toggled at runtime through the cache
+(`python manage.py query_profiler on --minutes 15`), so it can be turned
+on in production without a redeploy. While on, responses carry
+`X-Query-Count` / `X-DB-Time` headers and the slowest statements of
+each request are logged.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.http import HttpResponse, HttpResponseForbidden
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILER_CACHE_KEY = "metrics:query_profiler"
+# seconds each process trusts its last read of the flag
+PROFILER_CHECK_INTERVAL = 5
+
+_profiler_flag = {"enabled": False, "checked": 0.0}
+
+
+def metrics_view(request):
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def flush_metrics(**kwargs):
+    metrics.flush()
+
+
+request_finished.connect(flush_metrics, dispatch_uid="cfehome.metrics.flush_metrics")
+
+
+def set_query_profiler(enabled, timeout=None):
+    if enabled:
+        cache.set(PROFILER_CACHE_KEY, True, timeout=timeout)
+    else:
+        cache.delete(PROFILER_CACHE_KEY)
+    _profiler_flag["checked"] = 0.0
+
+
+def query_profiler_flag_is_fresh():
+    return time.monotonic() - _profiler_flag["checked"] < PROFILER_CHECK_INTERVAL
+
+
+def query_profiler_enabled():
+    now = time.monotonic()
+    if not query_profiler_flag_is_fresh():
+        try:
+            _profiler_flag["enabled"] = bool(cache.get(PROFILER_CACHE_KEY))
+        except Exception:
+            _profiler_flag["enabled"] = False
+        _profiler_flag["checked"] = now
+    return _profiler_flag["enabled"]
+
+
+class QueryProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_queries = getattr(settings, "QUERY_PROFILER_SLOW_QUERIES", 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not query_profiler_enabled() or request.path == "/metrics":
+            return self.get_response(request)
+        with metrics.capture_queries(keep_statements=True) as queries:
+            response = self.get_response(request)
+        return self.record(request, response, queries)
+
+    async def __acall__(self, request):
+        if query_profiler_flag_is_fresh():
+            enabled = _profiler_flag["enabled"]
+        else:
+            enabled = await sync_to_async(query_profiler_enabled)()
+        if not enabled or request.path == "/metrics":
+            return await self.get_response(request)
+        # ORM calls of an async request run in its thread-sensitive
+        # sync thread, so the query wrapper is installed there
+        capture = metrics.capture_queries(keep_statements=True)
+        queries = await sync_to_async(capture.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(capture.__exit__)(None, None, None)
+        return self.record(request, response, queries)
+
+    def record(self, request, response, queries):
+        response["X-Query-Count"] = f"{queries['count']}"
+        response["X-DB-Time"] = f"{queries['seconds']:.6f}"
+        route = getattr(request.resolver_match, "view_name", None) or "unmatched"
+        metrics.observe("http_request_queries", queries["count"], route=route)
+        metrics.observe("http_request_db_seconds", queries["seconds"], route=route)
+        slowest = sorted(queries["statements"], key=lambda item: item[0], reverse=True)
+        for duration, sql in slowest[:self.slow_queries]:
+            logger.info("%s %s %.6fs %s", request.method, request.path, duration, sql)
+        return response
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "cfehome.metrics.QueryProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "cfehome.urls"
@@ -99,6 +100,9 @@ if DATABASE_URL != "":
         )
     }
 
+# psycopg async connections per event loop for the async views (see helpers.aiodb)
+ASYNC_DB_POOL_SIZE = config("ASYNC_DB_POOL_SIZE", default=10, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -142,6 +146,45 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REDIS_URL = config("REDIS_URL", default='redis://localhost:6379')
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "cfehome",
+    }
+}
+
+# seconds an indicator result stays cached (see market.cache)
+MARKET_INDICATOR_CACHE_TIMEOUT = config("MARKET_INDICATOR_CACHE_TIMEOUT", default=300, cast=int)
+
+# calendar days of daily bars kept per company in market.IndicatorState;
+# the largest `days` the indicator endpoints accept
+MARKET_INDICATOR_STATE_DAYS = config("MARKET_INDICATOR_STATE_DAYS", default=365, cast=int)
+
+# minutes re-fetched before a company's latest stored quote (see market.tasks)
+MARKET_SYNC_OVERLAP_MINUTES = config("MARKET_SYNC_OVERLAP_MINUTES", default=30, cast=int)
+
+# seconds before a sync lock / dedupe key expires (see market.locks)
+MARKET_SYNC_LOCK_TIMEOUT = config("MARKET_SYNC_LOCK_TIMEOUT", default=15 * 60, cast=int)
+
+# TimescaleDB policies for raw quotes (see market.policies); 0 disables
+MARKET_COMPRESS_AFTER_DAYS = config("MARKET_COMPRESS_AFTER_DAYS", default=30, cast=int)
+MARKET_RAW_RETENTION_DAYS = config("MARKET_RAW_RETENTION_DAYS", default=730, cast=int)
+
+# record counters and histograms (see helpers.metrics)
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# bearer token required by /metrics when set
+METRICS_TOKEN = config("METRICS_TOKEN", default=None)
+# seconds metrics are buffered in-process before a flush to Redis,
+# and seconds Redis is skipped after a failed flush (see helpers.metrics)
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=5, cast=float)
+METRICS_FAILURE_COOLDOWN = config("METRICS_FAILURE_COOLDOWN", default=30, cast=float)
+# slowest statements logged per request while the query profiler is on
+QUERY_PROFILER_SLOW_QUERIES = config("QUERY_PROFILER_SLOW_QUERIES", default=5, cast=int)
+
+OPENAI_API_KEY = config("OPENAI_API_KEY", default=None)
+MARKET_RECOMMENDATION_MODEL = config("MARKET_RECOMMENDATION_MODEL", default="gpt-4o-mini")
+
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = "django-db"
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers.DatabaseScheduler"
@@ -0,0 +1,131 @@
+"""
+Concurrent async reads for ORM querysets on PostgreSQL.
+
+Django's async ORM (`afirst`, `async for`) runs each query through
+`sync_to_async` on the one thread sensitive thread, so concurrent
+requests on an ASGI worker queue behind each other's queries. `fetch`
+compiles the queryset to SQL instead and runs it on a psycopg
+AsyncConnection from a small per event loop pool, so independent
+queries overlap. Other databases fall back to the async ORM.
+
+    rows = await aiodb.fetch(StockQuote.objects.filter(...).values_list('time', 'close_price'))
+
+Rows are the raw database values of the selected columns (no
+`from_db_value` conversion), so use it with `values_list`. Parameters
+are bound client side (`AsyncClientCursor`), as on Django's own
+connections, so the compiled SQL runs unchanged.
+
+These reads bypass Django's connection, so its execute wrappers don't
+see them: the per-request query profiler (`cfehome.metrics`),
+`helpers.metrics.capture_queries` / `instrument` and
+`assertNumQueries` count none of them.
+"""
+import asyncio
+import weakref
+
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+
+# Django-only OPTIONS that psycopg.connect() does not take
+DJANGO_OPTIONS = ("pool", "isolation_level", "server_side_binding", "assume_role")
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool_size():
+    return getattr(settings, "ASYNC_DB_POOL_SIZE", 10)
+
+
+def get_connection_kwargs(using="default"):
+    settings_dict = connections[using].settings_dict
+    kwargs = {
+        "dbname": settings_dict.get("NAME"),
+        "user": settings_dict.get("USER"),
+        "password": settings_dict.get("PASSWORD"),
+        "host": settings_dict.get("HOST"),
+        "port": settings_dict.get("PORT"),
+    }
+    kwargs = {key: value for key, value in kwargs.items() if value not in (None, "")}
+    options = {
+        key: value for key, value in (settings_dict.get("OPTIONS") or {}).items()
+        if key not in DJANGO_OPTIONS
+    }
+    kwargs.update(options)
+    # datetimes come back in UTC, as on Django's own connections
+    kwargs["options"] = f"{kwargs.get('options', '')} -c TimeZone=UTC".strip()
+    return kwargs
+
+
+class AsyncConnectionPool:
+    """
+    Up to `size` psycopg AsyncConnections, opened on demand and reused.
+    Belongs to one event loop.
+    """
+
+    def __init__(self, using="default", size=None):
+        self.using = using
+        self.size = size or get_pool_size()
+        self.semaphore = asyncio.Semaphore(self.size)
+        self.idle = []
+
+    async def connect(self):
+        import psycopg
+        return await psycopg.AsyncConnection.connect(autocommit=True, **get_connection_kwargs(self.using))
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self.semaphore:
+            conn = None
+            while self.idle and conn is None:
+                conn = self.idle.pop()
+                if conn.closed:
+                    conn = None
+            if conn is None:
+                conn = await self.connect()
+            try:
+                yield conn
+            except BaseException:
+                # state unknown after a failed query: don't reuse it
+                await conn.close()
+                raise
+            self.idle.append(conn)
+
+    async def close(self):
+        idle, self.idle = self.idle, []
+        for conn in idle:
+            await conn.close()
+
+
+def get_pool(using="default"):
+    loop = asyncio.get_running_loop()
+    pools = _pools.setdefault(loop, {})
+    if using not in pools:
+        pools[using] = AsyncConnectionPool(using=using)
+    return pools[using]
+
+
+async def fetch(queryset):
+    """
+    All rows of a `values_list` queryset.
+    """
+    using = queryset.db
+    if connections[using].vendor != "postgresql":
+        return [row async for row in queryset]
+    try:
+        sql, params = queryset.query.get_compiler(using=using).as_sql()
+    except EmptyResultSet:
+        return []
+    import psycopg
+    async with get_pool(using).connection() as conn:
+        async with psycopg.AsyncClientCursor(conn) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+
+async def fetch_one(queryset):
+    rows = await fetch(queryset[:1])
+    return rows[0] if len(rows) > 0 else None
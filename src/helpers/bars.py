@@ -0,0 +1,277 @@
+"""
+Compact, array-backed bar storage.
+
+A `BarSeries` keeps OHLCV bars as one NumPy array per column instead of
+a list of dicts holding `Decimal`s and `datetime`s. Slicing returns
+views (no copy) and rows are exposed through a `__slots__` `Bar` view.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+BAR_DTYPE = np.dtype([
+    ('time_ms', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('vwap', np.float64),
+    ('volume', np.int64),
+    ('trades', np.int64),
+])
+
+BAR_COLUMNS = BAR_DTYPE.names
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def to_epoch_ms(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+class Bar:
+    """
+    Read-only view of one row of a BarSeries.
+    """
+    __slots__ = ('series', 'index')
+
+    def __init__(self, series, index):
+        self.series = series
+        self.index = index
+
+    @property
+    def time_ms(self):
+        return int(self.series.columns['time_ms'][self.index])
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.time_ms / 1000.0, tz=timezone.utc)
+
+    @property
+    def open(self):
+        return float(self.series.columns['open'][self.index])
+
+    @property
+    def high(self):
+        return float(self.series.columns['high'][self.index])
+
+    @property
+    def low(self):
+        return float(self.series.columns['low'][self.index])
+
+    @property
+    def close(self):
+        return float(self.series.columns['close'][self.index])
+
+    @property
+    def vwap(self):
+        return float(self.series.columns['vwap'][self.index])
+
+    @property
+    def volume(self):
+        return int(self.series.columns['volume'][self.index])
+
+    @property
+    def trades(self):
+        trades = int(self.series.columns['trades'][self.index])
+        return None if trades < 0 else trades
+
+    def to_dict(self):
+        """
+        Same keys as the client datasets (`StockQuote(**data)`).
+        """
+        return {
+            'open_price': self.open,
+            'close_price': self.close,
+            'high_price': self.high,
+            'low_price': self.low,
+            'number_of_trades': self.trades,
+            'volume': self.volume,
+            'volume_weighted_average': self.vwap,
+            'raw_timestamp': self.time_ms,
+            'time': self.time,
+        }
+
+    def __repr__(self):
+        return f"Bar(time={self.time.isoformat()}, close={self.close}, volume={self.volume})"
+
+
+class BarSeries:
+    """
+    OHLCV bars (oldest first) as typed NumPy columns:
+    int64 epoch ms, float64 OHLC/VWAP, int64 volume and trades
+    (-1 when unknown).
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = {name: np.empty(0, dtype=BAR_DTYPE[name]) for name in BAR_COLUMNS}
+        self.columns = columns
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls({name: np.asarray(columns[name], dtype=BAR_DTYPE[name]) for name in BAR_COLUMNS})
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        From an iterable of (time_ms, open, high, low, close, vwap, volume, trades).
+        """
+        rows = list(rows)
+        table = np.fromiter(rows, dtype=BAR_DTYPE, count=len(rows))
+        return cls({name: table[name] for name in BAR_COLUMNS})
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """
+        From a list of quote dicts (the clients' `get_stock_data` format).
+        """
+        def none_to(value, default):
+            return default if value is None else value
+        return cls.from_rows(
+            (
+                to_epoch_ms(data['time']),
+                float(data['open_price']),
+                float(data['high_price']),
+                float(data['low_price']),
+                float(data['close_price']),
+                float(none_to(data.get('volume_weighted_average'), data['close_price'])),
+                int(data['volume']),
+                int(none_to(data.get('number_of_trades'), -1)),
+            )
+            for data in dataset
+        )
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        """
+        From a StockQuote (or DailyStockQuote) queryset, in one query.
+        """
+        rows = queryset.order_by('time').values_list(
+            'time',
+            'open_price',
+            'high_price',
+            'low_price',
+            'close_price',
+            'volume_weighted_average',
+            'volume',
+            'number_of_trades',
+        )
+        return cls.from_dataset(
+            {
+                'time': row[0],
+                'open_price': row[1],
+                'high_price': row[2],
+                'low_price': row[3],
+                'close_price': row[4],
+                'volume_weighted_average': row[5],
+                'volume': row[6],
+                'number_of_trades': row[7],
+            }
+            for row in rows.iterator()
+        )
+
+    @classmethod
+    def concat(cls, series_list):
+        series_list = [series for series in series_list if len(series) > 0]
+        if len(series_list) == 0:
+            return cls()
+        if len(series_list) == 1:
+            return series_list[0]
+        return cls({
+            name: np.concatenate([series.columns[name] for series in series_list])
+            for name in BAR_COLUMNS
+        })
+
+    def __len__(self):
+        return len(self.columns['time_ms'])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # numpy basic slicing: views, no copy
+            return BarSeries({name: column[key] for name, column in self.columns.items()})
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("BarSeries index out of range")
+        return Bar(self, key)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Bar(self, index)
+
+    def __getattr__(self, name):
+        # series.close, series.volume, ... -> column arrays
+        if name == 'columns':
+            raise AttributeError(name)
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return f"BarSeries(len={len(self)})"
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    @property
+    def times(self):
+        return self.columns['time_ms'].astype('datetime64[ms]')
+
+    def between(self, start, end):
+        """
+        Bars with start <= time <= end (datetimes or epoch ms), as a view.
+        """
+        time_ms = self.columns['time_ms']
+        lo = np.searchsorted(time_ms, to_epoch_ms(start), side='left')
+        hi = np.searchsorted(time_ms, to_epoch_ms(end), side='right')
+        return self[lo:hi]
+
+    def to_dataset(self):
+        return [bar.to_dict() for bar in self]
+
+    def to_daily(self):
+        """
+        Daily (UTC) bars: first open, max high, min low, last close,
+        summed volume and trades, volume-weighted VWAP.
+        """
+        if len(self) == 0:
+            return BarSeries()
+        days = self.columns['time_ms'] // MS_PER_DAY
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        ends = np.r_[starts[1:], len(days)] - 1
+        volume = self.columns['volume']
+        volume_sum = np.add.reduceat(volume, starts)
+        vwap_sum = np.add.reduceat(self.columns['vwap'] * volume, starts)
+        close = self.columns['close'][ends]
+        vwap = np.divide(vwap_sum, volume_sum, out=close.copy(), where=volume_sum > 0)
+        trades = self.columns['trades']
+        return BarSeries({
+            'time_ms': days[starts] * MS_PER_DAY,
+            'open': self.columns['open'][starts],
+            'high': np.maximum.reduceat(self.columns['high'], starts),
+            'low': np.minimum.reduceat(self.columns['low'], starts),
+            'close': close,
+            'vwap': vwap,
+            'volume': volume_sum,
+            'trades': np.add.reduceat(np.where(trades < 0, 0, trades), starts),
+        })
+
+    def to_indicator_arrays(self):
+        """
+        The bar arrays `market.indicators` works on.
+        """
+        return {
+            'time': self.times,
+            'open': self.columns['open'],
+            'high': self.columns['high'],
+            'low': self.columns['low'],
+            'close': self.columns['close'],
+            'volume': self.columns['volume'].astype(np.float64),
+        }
@@ -1,7 +1,28 @@
-from ._alpha_vantage import AlphaVantageAPIClient
-from ._polygon import PolygonAPIClient
+from ._alpha_vantage import (
+    AlphaVantageAPIClient,
+    fetch_alpha_vantage_months,
+    transform_alpha_vantage_result,
+)
+from ._polygon import (
+    PolygonAPIClient,
+    PolygonGroupedDailyClient,
+    fetch_polygon_jobs,
+    transform_polygon_grouped_results,
+    transform_polygon_result,
+    transform_polygon_results_columnar,
+)
+from ._transport import HTTPTransport, get_transport
 
 __all__ = [
     "AlphaVantageAPIClient",
-    "PolygonAPIClient"
+    "fetch_alpha_vantage_months",
+    "transform_alpha_vantage_result",
+    "PolygonAPIClient",
+    "PolygonGroupedDailyClient",
+    "fetch_polygon_jobs",
+    "transform_polygon_grouped_results",
+    "transform_polygon_result",
+    "transform_polygon_results_columnar",
+    "HTTPTransport",
+    "get_transport",
 ]
\ No newline at end of file
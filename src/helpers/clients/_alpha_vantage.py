@@ -1,35 +1,86 @@
+import asyncio
 import pytz
-import requests
 
 from decouple import config
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Literal
 from urllib.parse import urlencode
 from datetime import datetime
 from decimal import Decimal
 
+from helpers import metrics
+from helpers.bars import BarSeries
+
+from ._transport import get_transport
+
 ALPHA_VANTAGE_API_KEY = config("ALPHA_VANTAGE_API_KEY", default=None, cast=str)
+ALPHA_VANTAGE_BASE_URL = config("ALPHA_VANTAGE_BASE_URL", default="https://www.alphavantage.co", cast=str)
+ALPHA_VANTAGE_REQUESTS_PER_MINUTE = config("ALPHA_VANTAGE_REQUESTS_PER_MINUTE", default=5, cast=float)
+
+EASTERN = pytz.timezone("US/Eastern")
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+VWAP_PLACES = Decimal('0.000001')
+
+
+@lru_cache(maxsize=4096)
+def get_eastern_utc_offset(date_hour):
+    """
+    UTC offset for a US/Eastern "YYYY-MM-DD HH" (cached, so
+    `localize` runs once per hour of data instead of once per row).
+    """
+    local_time = EASTERN.localize(datetime.strptime(date_hour, '%Y-%m-%d %H'))
+    return local_time.utcoffset()
+
+
+def eastern_to_utc(timestamp_str):
+    naive = datetime(
+        int(timestamp_str[0:4]),
+        int(timestamp_str[5:7]),
+        int(timestamp_str[8:10]),
+        int(timestamp_str[11:13]),
+        int(timestamp_str[14:16]),
+        int(timestamp_str[17:19]),
+    )
+    return (naive - get_eastern_utc_offset(timestamp_str[:13])).replace(tzinfo=pytz.utc)
+
 
 def transform_alpha_vantage_result(timestamp_str, result):
     # unix_timestamp = result.get('t') / 1000.0
     # utc_timestamp = datetime.fromtimestamp(unix_timestamp, tz=pytz.timezone('UTC'))
-    timestamp_format = '%Y-%m-%d %H:%M:%S' 
-    eastern = pytz.timezone("US/Eastern")
-    utc = pytz.utc
-    timestamp = eastern.localize(datetime.strptime(timestamp_str,timestamp_format)).astimezone(utc)
+    timestamp = eastern_to_utc(timestamp_str)
+    high_price = Decimal(result['2. high'])
+    low_price = Decimal(result['3. low'])
+    close_price = Decimal(result['4. close'])
+    # no VWAP from alpha vantage: use the typical price as a stand-in
+    typical_price = ((high_price + low_price + close_price) / 3).quantize(VWAP_PLACES)
     return {
         'open_price': Decimal(result['1. open']),
-        'close_price': Decimal(result['4. close']),
-        'high_price': Decimal(result['2. high']),
-        'low_price': Decimal(result['3. low']),
+        'close_price': close_price,
+        'high_price': high_price,
+        'low_price': low_price,
         'number_of_trades': None,
         'volume': int(result['5. volume']),
-        'volume_weighted_average': None,
+        'volume_weighted_average': typical_price,
         'raw_timestamp': timestamp_str,
         'time': timestamp,
     }
 
 
+def month_range(start_month, end_month):
+    """
+    "YYYY-MM" strings from start_month through end_month.
+    """
+    year, month = int(start_month[:4]), int(start_month[5:7])
+    end_year, end_month = int(end_month[:4]), int(end_month[5:7])
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append(f"{year:04d}-{month:02d}")
+        month += 1
+        if month > 12:
+            year += 1
+            month = 1
+    return months
 
 
 @dataclass
@@ -39,10 +90,21 @@ class AlphaVantageAPIClient:
     interval: Literal["1min", "5min", "15min", "30min", "60min"] = "1min"
     month: str = "2024-01"
     api_key: str = ""
+    base_url: str = ""
 
     def get_api_key(self):
         return self.api_key or ALPHA_VANTAGE_API_KEY
 
+    def get_base_url(self):
+        return self.base_url or ALPHA_VANTAGE_BASE_URL
+
+    def get_transport(self):
+        return get_transport(
+            "alpha_vantage",
+            requests_per_minute=ALPHA_VANTAGE_REQUESTS_PER_MINUTE,
+            burst=1
+        )
+
     def get_headers(self):
         api_key = self.get_api_key()
         return {}
@@ -59,7 +121,7 @@ class AlphaVantageAPIClient:
     
     def generate_url(self, pass_auth=False):
         path = "/query"
-        url = f"https://www.alphavantage.co{path}"
+        url = f"{self.get_base_url()}{path}"
         params = self.get_params()
         encoded_params = urlencode(params)
         url = f"{url}?{encoded_params}"
@@ -71,18 +133,46 @@ class AlphaVantageAPIClient:
     def fetch_data(self):
         headers = self.get_headers()
         url = self.generate_url()
-        response = requests.get(url, headers=headers)
-        response.raise_for_status() # not 200/201
-        return response.json()
+        return self.get_transport().get_json(url, headers=headers)
 
     def get_stock_data(self):
         data = self.fetch_data()
         dataset_key = [x for x in list(data.keys()) if not x.lower() == "meta data"][0]
         results = data[dataset_key]
         dataset = []
-        for timestamp_str in results.keys():
-            dataset.append(
-                transform_alpha_vantage_result(timestamp_str, results.get(timestamp_str))
-            )
+        with metrics.timer("market_transform_seconds", provider="alpha_vantage", format="dicts"):
+            for timestamp_str in results.keys():
+                dataset.append(
+                    transform_alpha_vantage_result(timestamp_str, results.get(timestamp_str))
+                )
+        metrics.inc("market_transform_rows_total", len(dataset), provider="alpha_vantage")
         return dataset
-        
\ No newline at end of file
+
+    def get_stock_series(self):
+        return BarSeries.from_dataset(self.get_stock_data())
+
+
+async def fetch_alpha_vantage_months(ticker, start_month, end_month, concurrency=4, **client_kwargs):
+    """
+    Fetch every month from start_month through end_month concurrently
+    (the shared transport keeps requests within the provider's rate limit)
+    and yield (month, dataset, error) as each one finishes.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(month):
+        client = AlphaVantageAPIClient(ticker=ticker, month=month, **client_kwargs)
+        async with semaphore:
+            try:
+                dataset = await asyncio.to_thread(client.get_stock_data)
+            except Exception as e:
+                return month, None, e
+        return month, dataset, None
+
+    tasks = [asyncio.create_task(run(month)) for month in month_range(start_month, end_month)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,5 +1,6 @@
+import asyncio
+import numpy as np
 import pytz
-import requests
 
 from dataclasses import dataclass
 from typing import Literal
@@ -7,12 +8,23 @@ from urllib.parse import urlencode
 from datetime import datetime
 from decouple import config
 
+from helpers import metrics
+from helpers.bars import BAR_DTYPE, BarSeries
+
+from ._transport import get_transport
+
 POLOGYON_API_KEY = config("POLOGYON_API_KEY", default=None, cast=str)
+POLYGON_BASE_URL = config("POLYGON_BASE_URL", default="https://api.polygon.io", cast=str)
+POLYGON_REQUESTS_PER_MINUTE = config("POLYGON_REQUESTS_PER_MINUTE", default=300, cast=float)
+
+UTC = pytz.timezone('UTC')
+
+POLYGON_COLUMNS_DTYPE = BAR_DTYPE
 
 
 def transform_polygon_result(result):
     unix_timestamp = result.get('t') / 1000.0
-    utc_timestamp = datetime.fromtimestamp(unix_timestamp, tz=pytz.timezone('UTC'))
+    utc_timestamp = datetime.fromtimestamp(unix_timestamp, tz=UTC)
     return {
         'open_price': result['o'],
         'close_price': result['c'],
@@ -26,6 +38,41 @@ def transform_polygon_result(result):
     }
 
 
+def transform_polygon_results_columnar(results):
+    """
+    Columnar transform of a polygon `results` list in one pass:
+    a dict of typed NumPy arrays (int64 epoch ms, float64 OHLC/VWAP,
+    int64 volume and trades) instead of one dict per row.
+    Like `transform_polygon_result`, a result without `vw` or `n`
+    raises KeyError.
+    """
+    rows = (
+        (r['t'], r['o'], r['h'], r['l'], r['c'], r['vw'], r['v'], r['n'])
+        for r in results
+    )
+    table = np.fromiter(rows, dtype=POLYGON_COLUMNS_DTYPE, count=len(results))
+    return {name: table[name] for name in POLYGON_COLUMNS_DTYPE.names}
+
+
+def transform_polygon_grouped_results(results, tickers=None):
+    """
+    Grouped daily `results` (one bar per ticker, ticker in `T`) to
+    {ticker: quote dict}, keeping only `tickers` when given.
+    Thinly traded tickers may come without `n` / `vw`.
+    """
+    data = {}
+    for result in results:
+        ticker = result.get('T')
+        if ticker is None or (tickers is not None and ticker not in tickers):
+            continue
+        data[ticker] = transform_polygon_result({
+            'n': None,
+            'vw': None,
+            **result,
+        })
+    return data
+
+
 @dataclass
 class PolygonAPIClient:
     ticker: str = "AAPL"
@@ -36,10 +83,21 @@ class PolygonAPIClient:
     api_key:str = ""
     adjusted: bool = True 
     sort: Literal["asc", "desc"] = "asc"
+    limit: int = 50_000
+    base_url: str = ""
 
     def get_api_key(self):
         return self.api_key or POLOGYON_API_KEY
 
+    def get_base_url(self):
+        return self.base_url or POLYGON_BASE_URL
+
+    def get_transport(self):
+        return get_transport(
+            "polygon",
+            requests_per_minute=POLYGON_REQUESTS_PER_MINUTE
+        )
+
     def get_headers(self):
         api_key = self.get_api_key()
         return {
@@ -50,13 +108,13 @@ class PolygonAPIClient:
         return {
             "adjusted": self.adjusted,
             "sort": self.sort,
-            "limit": 50_000,
+            "limit": self.limit,
         }
     
     def generate_url(self, pass_auth=False):
         ticker = f"{self.ticker}".upper()
         path = f"/v2/aggs/ticker/{ticker}/range/{self.multiplier}/{self.timespan}/{self.from_date}/{self.to_date}"
-        url = f"https://api.polygon.io{path}"
+        url = f"{self.get_base_url()}{path}"
         params = self.get_params()
         encoded_params = urlencode(params)
         url = f"{url}?{encoded_params}"
@@ -65,21 +123,144 @@ class PolygonAPIClient:
             url += f"&api_key={api_key}"
         return url
 
-    def fetch_data(self):
+    def fetch_data(self, url=None):
         headers = self.get_headers()
-        url = self.generate_url()
-        response = requests.get(url, headers=headers)
-        response.raise_for_status() # not 200/201
-        return response.json()
-
-    def get_stock_data(self):
-        data = self.fetch_data()
-        results = data.get('results') or None
-        if results is None:
-            raise Exception(f"Ticker {self.ticker} has no results")
+        if url is None:
+            url = self.generate_url()
+        return self.get_transport().get_json(url, headers=headers)
+
+    def fetch_pages(self):
+        """
+        Yield every response page, following `next_url`
+        when a range has more than `limit` results.
+        """
+        url = None
+        while True:
+            data = self.fetch_data(url=url)
+            yield data
+            url = data.get('next_url')
+            if not url:
+                break
+
+    def get_stock_data(self, raise_on_empty=True):
         dataset = []
-        for result in results:
-            dataset.append(
-                transform_polygon_result(result)
-            )
-        return dataset
\ No newline at end of file
+        for data in self.fetch_pages():
+            results = data.get('results') or []
+            with metrics.timer("market_transform_seconds", provider="polygon", format="dicts"):
+                for result in results:
+                    dataset.append(
+                        transform_polygon_result(result)
+                    )
+            metrics.inc("market_transform_rows_total", len(results), provider="polygon")
+        if len(dataset) == 0 and raise_on_empty:
+            raise Exception(f"Ticker {self.ticker} has no results")
+        return dataset
+
+    def get_stock_series(self, raise_on_empty=True):
+        """
+        Like `get_stock_data` but returns a `BarSeries`
+        built with `transform_polygon_results_columnar`.
+        """
+        pages = []
+        for data in self.fetch_pages():
+            results = data.get('results') or []
+            if len(results) > 0:
+                with metrics.timer("market_transform_seconds", provider="polygon", format="columns"):
+                    pages.append(BarSeries(transform_polygon_results_columnar(results)))
+                metrics.inc("market_transform_rows_total", len(results), provider="polygon")
+        series = BarSeries.concat(pages)
+        if len(series) == 0 and raise_on_empty:
+            raise Exception(f"Ticker {self.ticker} has no results")
+        return series
+
+    def get_stock_columns(self, raise_on_empty=True):
+        return self.get_stock_series(raise_on_empty=raise_on_empty).columns
+
+
+@dataclass
+class PolygonGroupedDailyClient:
+    """
+    Daily bars of every US stock for one date in a single request.
+    """
+    date: str = "2024-01-09"
+    api_key: str = ""
+    adjusted: bool = True
+    include_otc: bool = False
+    base_url: str = ""
+
+    def get_api_key(self):
+        return self.api_key or POLOGYON_API_KEY
+
+    def get_base_url(self):
+        return self.base_url or POLYGON_BASE_URL
+
+    def get_transport(self):
+        return get_transport(
+            "polygon",
+            requests_per_minute=POLYGON_REQUESTS_PER_MINUTE
+        )
+
+    def get_headers(self):
+        api_key = self.get_api_key()
+        return {
+            "Authorization": f"Bearer {api_key}"
+        }
+
+    def get_params(self):
+        return {
+            "adjusted": self.adjusted,
+            "include_otc": self.include_otc,
+        }
+
+    def generate_url(self):
+        path = f"/v2/aggs/grouped/locale/us/market/stocks/{self.date}"
+        url = f"{self.get_base_url()}{path}"
+        return f"{url}?{urlencode(self.get_params())}"
+
+    def fetch_data(self):
+        return self.get_transport().get_json(self.generate_url(), headers=self.get_headers())
+
+    def get_stock_data(self, tickers=None):
+        """
+        {ticker: quote dict} for the date; empty on market holidays.
+        """
+        results = self.fetch_data().get('results') or []
+        with metrics.timer("market_transform_seconds", provider="polygon", format="grouped"):
+            data = transform_polygon_grouped_results(results, tickers=tickers)
+        metrics.inc("market_transform_rows_total", len(data), provider="polygon")
+        return data
+
+
+async def fetch_polygon_jobs(jobs, concurrency=8, raise_on_empty=False, **client_kwargs):
+    """
+    Fetch many (ticker, from_date, to_date) jobs concurrently, at most
+    `concurrency` in flight, and yield (job, dataset, error) as each one
+    finishes so the caller can start storing before all downloads complete.
+
+    Requests go through the pooled, rate-limited transport in worker
+    threads.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        ticker, from_date, to_date = job
+        client = PolygonAPIClient(
+            ticker=ticker,
+            from_date=from_date,
+            to_date=to_date,
+            **client_kwargs
+        )
+        async with semaphore:
+            try:
+                dataset = await asyncio.to_thread(client.get_stock_data, raise_on_empty=raise_on_empty)
+            except Exception as e:
+                return job, None, e
+        return job, dataset, None
+
+    tasks = [asyncio.create_task(run(tuple(job))) for job in jobs]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+
+import requests
+
+from dataclasses import dataclass, field
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from helpers import metrics
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Token bucket shared by every worker through Redis.
+# Returns the seconds to wait before a token is available (0 = granted).
+TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local data = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class LocalTokenBucket:
+    """
+    In-process token bucket, used when Redis is not reachable.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire_wait(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class RedisTokenBucket:
+    """
+    Token bucket coordinated across processes (Celery workers)
+    through Redis. Falls back to a local bucket if Redis is down
+    and skips Redis for `failure_cooldown` seconds after that.
+    """
+
+    def __init__(self, key, capacity, rate, redis_url=None, failure_cooldown=30):
+        self.key = key
+        self.capacity = capacity
+        self.rate = rate
+        self.redis_url = redis_url or getattr(settings, "REDIS_URL", None)
+        self.failure_cooldown = failure_cooldown
+        self.failed_until = 0.0
+        self.local = LocalTokenBucket(capacity, rate)
+        self._script = None
+
+    def get_script(self):
+        if self._script is None:
+            import redis
+            client = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            self._script = client.register_script(TOKEN_BUCKET_LUA)
+        return self._script
+
+    def acquire_wait(self):
+        if not self.redis_url or time.monotonic() < self.failed_until:
+            return self.local.acquire_wait()
+        try:
+            return float(self.get_script()(keys=[self.key], args=[self.capacity, self.rate]))
+        except Exception:
+            self.failed_until = time.monotonic() + self.failure_cooldown
+            return self.local.acquire_wait()
+
+    def acquire(self):
+        while True:
+            wait = self.acquire_wait()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+@dataclass
+class HTTPTransport:
+    """
+    Shared HTTP layer for the API clients: a keep-alive connection pool,
+    timeouts, retries with jittered exponential backoff and a
+    token-bucket rate limit shared across workers.
+    """
+    name: str = "default"
+    base_url: str = ""
+    requests_per_minute: float = 300
+    burst: int = 5
+    timeout: tuple = (3.05, 30)
+    max_retries: int = 4
+    backoff: float = 0.5
+    max_backoff: float = 30
+    pool_maxsize: int = 20
+    redis_url: str = None
+    session: requests.Session = field(default=None, repr=False)
+    bucket: RedisTokenBucket = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.session is None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        if self.bucket is None and self.requests_per_minute:
+            self.bucket = RedisTokenBucket(
+                key=f"helpers:ratelimit:{self.name}",
+                capacity=self.burst,
+                rate=self.requests_per_minute / 60.0,
+                redis_url=self.redis_url,
+            )
+
+    def build_url(self, path_or_url):
+        if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
+            return path_or_url
+        return f"{self.base_url.rstrip('/')}/{path_or_url.lstrip('/')}"
+
+    def get_backoff(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        # full jitter
+        return random.uniform(0, delay)
+
+    def get(self, path_or_url, params=None, headers=None):
+        url = self.build_url(path_or_url)
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.observe("market_http_request_seconds", time.perf_counter() - start, provider=self.name, status="error")
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                metrics.observe("market_http_request_seconds", time.perf_counter() - start, provider=self.name, status=response.status_code)
+                metrics.inc("market_http_response_bytes_total", len(response.content), provider=self.name)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status() # not 200/201
+                    return response
+            metrics.inc("market_http_retries_total", provider=self.name)
+            time.sleep(self.get_backoff(attempt, response=response))
+            attempt += 1
+
+    def get_json(self, path_or_url, params=None, headers=None):
+        return self.get(path_or_url, params=params, headers=headers).json()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(name, **kwargs):
+    """
+    Process-wide transport per provider name, so every client
+    instance reuses the same connection pool.
+    """
+    with _transports_lock:
+        transport = _transports.get(name)
+        if transport is None:
+            transport = HTTPTransport(name=name, **kwargs)
+            _transports[name] = transport
+        return transport
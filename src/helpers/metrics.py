@@ -0,0 +1,341 @@
+"""
+Counters and histograms in the Prometheus text format.
+
+Values live in Redis hashes so the web process serving `/metrics` sees
+what Celery workers recorded. Observations are buffered in-process and
+flushed in one pipelined round trip every few seconds and after each
+request or task. Without Redis (or while it is down) values are kept
+in-process, and Redis is not retried until a cooldown has passed.
+
+    from helpers import metrics
+    with metrics.timer("market_transform_seconds", provider="polygon", format="dicts"):
+        ...
+    metrics.inc("market_insert_rows_total", 250, method="copy", result="inserted")
+"""
+import atexit
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+KEY_PREFIX = "metrics"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "market_http_request_seconds": ("histogram", "Provider HTTP request latency (per attempt)", DEFAULT_BUCKETS),
+    "market_http_response_bytes_total": ("counter", "Provider response payload bytes", None),
+    "market_http_retries_total": ("counter", "Provider requests retried", None),
+    "market_transform_seconds": ("histogram", "Provider response transform time", DEFAULT_BUCKETS),
+    "market_transform_rows_total": ("counter", "Rows transformed from provider responses", None),
+    "market_insert_seconds": ("histogram", "Quote insert time", DEFAULT_BUCKETS),
+    "market_insert_rows_total": ("counter", "Quote rows by result (inserted, skipped or attempted)", None),
+    "market_function_seconds": ("histogram", "Instrumented function time", DEFAULT_BUCKETS),
+    "market_function_queries_total": ("counter", "Database queries run by instrumented functions", None),
+    "market_function_db_seconds_total": ("counter", "Database time of instrumented functions", None),
+    "celery_task_seconds": ("histogram", "Celery task run time", DEFAULT_BUCKETS),
+    "celery_task_queue_lag_seconds": ("histogram", "Time between publishing and starting a task", DEFAULT_BUCKETS),
+    "http_request_queries": ("histogram", "Database queries per profiled request", COUNT_BUCKETS),
+    "http_request_db_seconds": ("histogram", "Database time per profiled request", DEFAULT_BUCKETS),
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = f"{value}".replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class LocalStore:
+    """
+    In-process values, used without Redis.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def incr(self, items):
+        with self.lock:
+            for key, field, value in items:
+                fields = self.values.setdefault(key, {})
+                fields[field] = fields.get(field, 0.0) + value
+
+    def get_all(self, key):
+        with self.lock:
+            return dict(self.values.get(key, {}))
+
+    def pop_all(self):
+        with self.lock:
+            values, self.values = self.values, {}
+            return values
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+
+class RedisStore:
+    """
+    Values shared by every process through Redis hashes, buffered
+    in-process between flushes. Falls back to a local store if Redis
+    is down and skips Redis for `failure_cooldown` seconds after that.
+    """
+
+    def __init__(self, redis_url=None, flush_interval=None, failure_cooldown=None):
+        self.redis_url = redis_url or getattr(settings, "REDIS_URL", None)
+        if flush_interval is None:
+            flush_interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+        if failure_cooldown is None:
+            failure_cooldown = getattr(settings, "METRICS_FAILURE_COOLDOWN", 30)
+        self.flush_interval = flush_interval
+        self.failure_cooldown = failure_cooldown
+        self.local = LocalStore()
+        self.pending = LocalStore()
+        self.flushed_at = time.monotonic()
+        self.failed_until = 0.0
+        self._client = None
+
+    def get_client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+        return self._client
+
+    def is_available(self):
+        return bool(self.redis_url) and time.monotonic() >= self.failed_until
+
+    def incr(self, items):
+        if not self.redis_url:
+            return self.local.incr(items)
+        self.pending.incr(items)
+        if time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the buffered values to Redis in one pipeline.
+        """
+        self.flushed_at = time.monotonic()
+        values = self.pending.pop_all()
+        items = [
+            (key, field, value)
+            for key, fields in values.items()
+            for field, value in fields.items()
+        ]
+        if len(items) == 0:
+            return
+        if not self.is_available():
+            return self.local.incr(items)
+        try:
+            pipe = self.get_client().pipeline(transaction=False)
+            for key, field, value in items:
+                pipe.hincrbyfloat(key, field, value)
+            pipe.execute()
+        except Exception:
+            self.failed_until = time.monotonic() + self.failure_cooldown
+            self.local.incr(items)
+
+    def get_all(self, key):
+        values = self.local.get_all(key)
+        for field, value in self.pending.get_all(key).items():
+            values[field] = values.get(field, 0.0) + value
+        if not self.is_available():
+            return values
+        try:
+            stored = self.get_client().hgetall(key)
+        except Exception:
+            self.failed_until = time.monotonic() + self.failure_cooldown
+            return values
+        for field, value in stored.items():
+            field = field.decode()
+            values[field] = values.get(field, 0.0) + float(value)
+        return values
+
+    def clear(self):
+        self.local.clear()
+        self.pending.clear()
+        if self.is_available():
+            try:
+                self.get_client().delete(*[get_key(name) for name in METRICS.keys()])
+            except Exception:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RedisStore()
+        return _store
+
+
+def set_store(store):
+    """
+    Swap the store (e.g. `LocalStore()` for benchmarks).
+    """
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def flush():
+    """
+    Send buffered values now (called after each request and task).
+    """
+    if _store is not None:
+        get_store().flush()
+
+
+atexit.register(flush)
+
+
+def get_key(name):
+    return f"{KEY_PREFIX}:{name}"
+
+
+def metrics_enabled():
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+def inc(name, value=1, **labels):
+    if not metrics_enabled():
+        return
+    get_store().incr([(get_key(name), f"{format_labels(labels)}|total", float(value))])
+
+
+def observe(name, value, **labels):
+    """
+    Record a histogram observation: the matching bucket, sum and count.
+    """
+    if not metrics_enabled():
+        return
+    _, _, buckets = METRICS[name]
+    bucket = "+Inf"
+    for upper in buckets:
+        if value <= upper:
+            bucket = f"{upper}"
+            break
+    label_text = format_labels(labels)
+    key = get_key(name)
+    get_store().incr([
+        (key, f"{label_text}|bucket|{bucket}", 1.0),
+        (key, f"{label_text}|sum", float(value)),
+        (key, f"{label_text}|count", 1.0),
+    ])
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def format_value(value):
+    if value == int(value):
+        return f"{int(value)}"
+    return f"{value!r}"
+
+
+def add_labels(label_text, extra):
+    if not label_text:
+        return "{" + extra + "}"
+    return label_text[:-1] + "," + extra + "}"
+
+
+def render():
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    store = get_store()
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        values = store.get_all(get_key(name))
+        if kind == "counter":
+            for field, value in sorted(values.items()):
+                label_text, _ = field.split("|", 1)
+                lines.append(f"{name}{label_text} {format_value(value)}")
+            continue
+        series = {}
+        for field, value in values.items():
+            label_text, rest = field.split("|", 1)
+            series.setdefault(label_text, {})[rest] = value
+        for label_text, fields in sorted(series.items()):
+            cumulative = 0.0
+            for upper in [*buckets, "+Inf"]:
+                cumulative += fields.get(f"bucket|{upper}", 0.0)
+                le = 'le="' + f"{upper}" + '"'
+                lines.append(f"{name}_bucket{add_labels(label_text, le)} {format_value(cumulative)}")
+            lines.append(f"{name}_sum{label_text} {format_value(fields.get('sum', 0.0))}")
+            lines.append(f"{name}_count{label_text} {format_value(fields.get('count', 0.0))}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def capture_queries(using="default", keep_statements=False):
+    """
+    Count and time the queries run inside the block:
+
+        with capture_queries(keep_statements=True) as queries:
+            ...
+        queries["count"], queries["seconds"], queries["statements"]
+    """
+    from django.db import connections
+    queries = {"count": 0, "seconds": 0.0, "statements": []}
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            queries["count"] += 1
+            queries["seconds"] += duration
+            if keep_statements:
+                queries["statements"].append((duration, sql))
+
+    with connections[using].execute_wrapper(wrapper):
+        yield queries
+
+
+def instrument(name):
+    """
+    Decorator recording a function's time, query count and DB time
+    under `function=<name>`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if not metrics_enabled():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            with capture_queries() as queries:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    observe("market_function_seconds", time.perf_counter() - start, function=name)
+                    inc("market_function_queries_total", queries["count"], function=name)
+                    inc("market_function_db_seconds_total", queries["seconds"], function=name)
+        return wrapped
+    return decorator
@@ -6,9 +6,45 @@ from rangefilter.filters import (
 )
 
 # Register your models here.
-from .models import StockQuote, Company
+from .models import StockQuote, Company, LatestQuote, Recommendation
 
-admin.site.register(Company)
+
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ['ticker', 'name', 'active', 'latest_close', 'latest_time']
+    list_filter = ['active']
+    search_fields = ['ticker', 'name']
+    list_select_related = ['latest_quote']
+
+    def latest_close(self, obj):
+        latest = getattr(obj, 'latest_quote', None)
+        return None if latest is None else latest.close_price
+
+    def latest_time(self, obj):
+        latest = getattr(obj, 'latest_quote', None)
+        return None if latest is None else latest.time
+
+
+admin.site.register(Company, CompanyAdmin)
+
+
+class LatestQuoteAdmin(admin.ModelAdmin):
+    list_display = ['company__ticker', 'close_price', 'change', 'change_percent', 'volume', 'time']
+    list_filter = ['company__active']
+    search_fields = ['company__ticker']
+    list_select_related = ['company']
+    ordering = ['company__ticker']
+
+
+admin.site.register(LatestQuote, LatestQuoteAdmin)
+
+
+class RecommendationAdmin(admin.ModelAdmin):
+    list_display = ['company__ticker', 'score', 'buy', 'sell', 'hold', 'model', 'hits', 'timestamp']
+    list_filter = ['company__ticker', 'model', 'buy', 'sell', 'hold']
+    readonly_fields = ['fingerprint', 'indicators', 'timestamp']
+
+
+admin.site.register(Recommendation, RecommendationAdmin)
 
 class StockQuoteAdmin(admin.ModelAdmin):
     list_display = ['company__ticker', 'close_price', 'localized_time', 'time']
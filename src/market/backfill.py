@@ -0,0 +1,145 @@
+"""
+Historical backfill planning.
+
+A backfill range is split into disjoint windows small enough that one
+window fits within the provider's row limit. Each window is recorded in
+`BackfillWindow` and marked completed once stored, so an interrupted
+backfill resumes with the windows that are still missing. Windows whose
+bars are already stored (e.g. by other syncs) are skipped as well.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+TIMESPAN_MINUTES = {
+    "minute": 1,
+    "hour": 60,
+    "day": 60 * 24,
+}
+
+# polygon aggregates: 50,000 rows per page
+PROVIDER_ROW_LIMIT = 50_000
+
+# windows are aligned to this date so the plan is stable between runs
+WINDOW_EPOCH = date(2000, 1, 1)
+
+# a stored window may miss this share of its weekdays (market holidays)
+HOLIDAY_WEEKDAYS = 20
+# and start / end this many days inside its edges (long weekends)
+EDGE_DAYS = 4
+
+
+def get_window_days(multiplier=5, timespan="minute", row_limit=PROVIDER_ROW_LIMIT):
+    """
+    Number of calendar days whose bars fit in one request,
+    assuming bars around the clock (the worst case).
+    """
+    minutes = multiplier * TIMESPAN_MINUTES[timespan]
+    bars_per_day = max(1, (24 * 60) // minutes)
+    return max(1, row_limit // bars_per_day)
+
+
+def plan_backfill_windows(start_date, end_date, multiplier=5, timespan="minute", row_limit=PROVIDER_ROW_LIMIT):
+    """
+    Disjoint (from_date, to_date) windows, inclusive and oldest first,
+    covering start_date through end_date.
+    """
+    window_days = get_window_days(multiplier=multiplier, timespan=timespan, row_limit=row_limit)
+    offset = (start_date - WINDOW_EPOCH).days % window_days
+    windows = []
+    window_start = start_date - timedelta(days=offset)
+    while window_start <= end_date:
+        window_end = window_start + timedelta(days=window_days - 1)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+
+def get_stored_days(company_obj, start_date, end_date):
+    """
+    UTC dates with stored quotes for a company, in one query.
+    """
+    StockQuote = apps.get_model("market", "StockQuote")
+    return set(
+        StockQuote.objects.filter(
+            company=company_obj,
+            time__gte=datetime.combine(start_date, time.min, tzinfo=dt_timezone.utc),
+            time__lt=datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc),
+        ).annotate(date=TruncDate('time')).values_list('date', flat=True).distinct()
+    )
+
+
+def is_window_stored(window, stored_days, today):
+    """
+    True when the stored days cover the window's weekdays (through
+    today), allowing for holidays and long weekends at its edges.
+    """
+    from_date, to_date = window
+    weekdays = []
+    day = from_date
+    while day <= min(to_date, today):
+        if day.weekday() < 5:
+            weekdays.append(day)
+        day += timedelta(days=1)
+    if len(weekdays) == 0:
+        return False
+    days = [day for day in weekdays if day in stored_days]
+    if len(weekdays) - len(days) > max(1, len(weekdays) // HOLIDAY_WEEKDAYS):
+        return False
+    return (days[0] - weekdays[0]).days <= EDGE_DAYS and (weekdays[-1] - days[-1]).days <= EDGE_DAYS
+
+
+def get_pending_windows(company_obj, years_ago=5, multiplier=5, timespan="minute", row_limit=PROVIDER_ROW_LIMIT):
+    """
+    Planned windows for a company, minus the ones already completed
+    or already present in the stored quotes.
+    """
+    BackfillWindow = apps.get_model("market", "BackfillWindow")
+    today = timezone.now().date()
+    start_date = today - timedelta(days=365 * years_ago)
+    windows = plan_backfill_windows(
+        start_date,
+        today,
+        multiplier=multiplier,
+        timespan=timespan,
+        row_limit=row_limit
+    )
+    completed = set(
+        BackfillWindow.objects.filter(
+            company=company_obj,
+            multiplier=multiplier,
+            timespan=timespan,
+            completed__isnull=False,
+        ).values_list('from_date', 'to_date')
+    )
+    windows = [window for window in windows if window not in completed]
+    if len(windows) == 0:
+        return windows
+    stored_days = get_stored_days(company_obj, windows[0][0], today)
+    return [window for window in windows if not is_window_stored(window, stored_days, today)]
+
+
+def mark_window(company_obj, from_date, to_date, rows=0, multiplier=5, timespan="minute"):
+    """
+    Record a stored window. Windows reaching today stay open since
+    their most recent bars are still arriving.
+    """
+    BackfillWindow = apps.get_model("market", "BackfillWindow")
+    completed = None
+    if to_date < timezone.now().date():
+        completed = timezone.now()
+    obj, _ = BackfillWindow.objects.update_or_create(
+        company=company_obj,
+        from_date=from_date,
+        to_date=to_date,
+        multiplier=multiplier,
+        timespan=timespan,
+        defaults={
+            "rows": rows,
+            "completed": completed,
+        }
+    )
+    return obj
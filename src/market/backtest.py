@@ -0,0 +1,273 @@
+"""
+Vectorized backtest of the logic-based score.
+
+The four signals of `market.indicators.get_signals` (MA crossover,
+Fibonacci price target, volume trend and RSI) are computed for every day
+at once as rolling arrays over one ticker's daily bars, so a history is
+evaluated with a single query instead of one service call per day.
+
+    from market import backtest
+    backtest.backtest_ticker("AAPL", years=10)
+"""
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from django.utils import timezone
+
+from . import indicators as market_indicators
+from . import services as market_services
+
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+@dataclass(frozen=True)
+class BacktestParams:
+    """
+    Thresholds of the score and the trading rule. The defaults match
+    `get_signals` and the BUY / SELL cut-offs of the logic-based
+    recommendation; `window` is the number of daily bars each day's
+    indicators look back on (~30 calendar days).
+    """
+    window: int = 21
+    ma_short: int = 5
+    ma_long: int = 20
+    fib_ratio: float = 0.382
+    volume_threshold: float = 20
+    rsi_period: int = 14
+    rsi_overbought: float = 70
+    rsi_oversold: float = 30
+    buy_score: int = 2
+    sell_score: int = -2
+    fee: float = 0.0
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def rolling_mean(values, size, window):
+    """
+    Mean of the last `size` values for every day with a full `window`
+    (aligned to the last `len(values) - window + 1` days).
+    """
+    size = min(size, window)
+    means = sliding_window_view(values, size).mean(axis=1)
+    return means[window - size:]
+
+
+def get_wilder_kernel(count, period):
+    """
+    Weights that turn `count` changes into `wilder_smooth(changes, period)`:
+    the simple average seed of the first `period` changes decays over
+    the remaining ones.
+    """
+    period = max(1, min(period, count))
+    alpha = 1.0 / period
+    decay = 1.0 - alpha
+    n = count - period
+    kernel = np.empty(count, dtype=np.float64)
+    kernel[:period] = decay ** n / period
+    kernel[period:] = alpha * decay ** np.arange(n - 1, -1, -1)
+    return kernel
+
+
+def rolling_rsi(close, window, period=14):
+    """
+    `compute_rsi` of the last `window` closes, for every day
+    with a full window.
+    """
+    changes = np.diff(close)
+    gains = np.where(changes > 0, changes, 0.0)
+    losses = np.where(changes < 0, -changes, 0.0)
+    kernel = get_wilder_kernel(window - 1, period)
+    avg_gain = sliding_window_view(gains, window - 1) @ kernel
+    avg_loss = sliding_window_view(losses, window - 1) @ kernel
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+    return np.where(avg_loss == 0, 100.0, rsi)
+
+
+def get_indicator_key(params):
+    """
+    The parameters the rolling indicators depend on; parameter sets
+    sharing them only differ in thresholds.
+    """
+    return (params.window, params.ma_short, params.ma_long, params.fib_ratio, params.rsi_period)
+
+
+def compute_indicator_arrays(bars, params=None):
+    """
+    Rolling indicators for every day. Days without a full window are
+    NaN and not `valid`.
+    """
+    if params is None:
+        params = BacktestParams()
+    close = np.asarray(bars['close'], dtype=np.float64)
+    high = np.asarray(bars['high'], dtype=np.float64)
+    low = np.asarray(bars['low'], dtype=np.float64)
+    volume = np.asarray(bars['volume'], dtype=np.float64)
+    n = len(close)
+    window = params.window
+    valid = np.zeros(n, dtype=bool)
+    arrays = {
+        'close': close,
+        'ma_short': np.full(n, np.nan),
+        'ma_long': np.full(n, np.nan),
+        'conservative_target': np.full(n, np.nan),
+        'volume_change_percent': np.full(n, np.nan),
+        'rsi': np.full(n, np.nan),
+    }
+    if n >= window and window >= 2:
+        days = slice(window - 1, n)
+        valid[days] = True
+        arrays['ma_short'][days] = rolling_mean(close, params.ma_short, window)
+        arrays['ma_long'][days] = rolling_mean(close, params.ma_long, window)
+        price_range = sliding_window_view(high, window).max(axis=1) - sliding_window_view(low, window).min(axis=1)
+        arrays['conservative_target'][days] = close[days] + price_range * params.fib_ratio
+        avg_volume = sliding_window_view(volume, window).mean(axis=1)
+        latest_volume = volume[days]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volume_change = (latest_volume - avg_volume) / avg_volume * 100
+        arrays['volume_change_percent'][days] = np.where(
+            (latest_volume > 0) & (avg_volume > 0), volume_change, 0.0
+        )
+        arrays['rsi'][days] = rolling_rsi(close, window, period=params.rsi_period)
+    arrays['valid'] = valid
+    return arrays
+
+
+def compute_signal_arrays(bars, params=None, indicator_arrays=None):
+    """
+    Rolling indicators, the four signal votes (+1 / 0 / -1) and the score
+    for every day; days without a full window score 0.
+    `indicator_arrays` reuses `compute_indicator_arrays` output computed
+    for the same indicator parameters.
+    """
+    if params is None:
+        params = BacktestParams()
+    if indicator_arrays is None:
+        indicator_arrays = compute_indicator_arrays(bars, params=params)
+    valid = indicator_arrays['valid']
+    signals = np.zeros((4, len(valid)), dtype=np.int8)
+    close = indicator_arrays['close'][valid]
+    change = indicator_arrays['volume_change_percent'][valid]
+    rsi = indicator_arrays['rsi'][valid]
+    signals[0, valid] = np.where(indicator_arrays['ma_short'][valid] > indicator_arrays['ma_long'][valid], 1, -1)
+    signals[1, valid] = np.where(close < indicator_arrays['conservative_target'][valid], 1, -1)
+    signals[2, valid] = np.where(change > params.volume_threshold, 1, np.where(change < -params.volume_threshold, -1, 0))
+    signals[3, valid] = np.where(rsi > params.rsi_overbought, -1, np.where(rsi < params.rsi_oversold, 1, 0))
+    return {
+        **indicator_arrays,
+        'signals': signals,
+        'score': signals.sum(axis=0),
+    }
+
+
+def get_positions(score, valid, buy_score=2, sell_score=-2):
+    """
+    Long (1) from a BUY score until a SELL score, flat (0) otherwise.
+    Positions are taken at the close of the signal day.
+    """
+    n = len(score)
+    action = np.full(n, np.nan)
+    action[valid & (score >= buy_score)] = 1
+    action[valid & (score <= sell_score)] = 0
+    # forward fill the last action
+    index = np.where(np.isnan(action), 0, np.arange(n))
+    np.maximum.accumulate(index, out=index)
+    positions = action[index]
+    return np.where(np.isnan(positions), 0.0, positions)
+
+
+def get_trade_returns(close, positions, fee=0.0):
+    """
+    Return of each round trip (entry close to exit close, net of fees).
+    A trade still open is marked to the last close.
+    """
+    changes = np.diff(positions, prepend=0.0)
+    entries = np.flatnonzero(changes > 0)
+    exits = np.flatnonzero(changes < 0)
+    if len(exits) < len(entries):
+        exits = np.append(exits, len(close) - 1)
+    return close[exits] / close[entries] * (1 - fee) ** 2 - 1
+
+
+def simulate(close, score, valid, params=None):
+    """
+    Simulate the trading rule and report returns, drawdown and hit rate.
+    """
+    if params is None:
+        params = BacktestParams()
+    close = np.asarray(close, dtype=np.float64)
+    positions = get_positions(score, valid, buy_score=params.buy_score, sell_score=params.sell_score)
+    daily_returns = np.zeros(len(close))
+    daily_returns[1:] = close[1:] / close[:-1] - 1
+    turnover = np.abs(np.diff(positions, prepend=0.0))
+    strategy_returns = np.zeros(len(close))
+    strategy_returns[1:] = positions[:-1] * daily_returns[1:]
+    strategy_returns -= turnover * params.fee
+    equity = np.cumprod(1 + strategy_returns)
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    trade_returns = get_trade_returns(close, positions, fee=params.fee)
+    days = len(close)
+    total_return = float(equity[-1] - 1) if days > 0 else 0.0
+    years = days / TRADING_DAYS_PER_YEAR
+    return {
+        "days": days,
+        "total_return": total_return,
+        "annualized_return": float((1 + total_return) ** (1 / years) - 1) if years > 0 and total_return > -1 else None,
+        "buy_and_hold_return": float(close[-1] / close[0] - 1) if days > 0 else 0.0,
+        "max_drawdown": float(drawdown.min()) if days > 0 else 0.0,
+        "trades": len(trade_returns),
+        "hit_rate": float((trade_returns > 0).mean()) if len(trade_returns) > 0 else None,
+        "average_trade_return": float(trade_returns.mean()) if len(trade_returns) > 0 else None,
+        "exposure": float(positions.mean()) if days > 0 else 0.0,
+        "equity": equity,
+        "positions": positions,
+    }
+
+
+def run_backtest(bars, params=None, include_series=False, indicator_arrays=None):
+    """
+    Backtest daily bar arrays (`queryset_to_arrays` /
+    `BarSeries.to_indicator_arrays` format, oldest first).
+    """
+    if params is None:
+        params = BacktestParams()
+    signal_arrays = compute_signal_arrays(bars, params=params, indicator_arrays=indicator_arrays)
+    result = simulate(bars['close'], signal_arrays['score'], signal_arrays['valid'], params=params)
+    equity = result.pop('equity')
+    positions = result.pop('positions')
+    result['params'] = params.to_dict()
+    if include_series:
+        result['series'] = {
+            'time': bars['time'],
+            'score': signal_arrays['score'],
+            'position': positions,
+            'equity': equity,
+        }
+    return result
+
+
+def load_daily_bars(ticker, years=10):
+    """
+    A ticker's daily bars for the last `years` as arrays, in one query.
+    """
+    start_date = timezone.now() - timedelta(days=365 * years)
+    queryset = market_services.get_daily_quotes_queryset(
+        start_date=start_date,
+        company__ticker=f"{ticker}".upper()
+    )
+    return market_indicators.queryset_to_arrays(queryset)
+
+
+def backtest_ticker(ticker="AAPL", years=10, params=None, include_series=False):
+    bars = load_daily_bars(ticker, years=years)
+    if len(bars['close']) == 0:
+        raise Exception(f"Data for {ticker} not found")
+    result = run_backtest(bars, params=params, include_series=include_series)
+    result['ticker'] = f"{ticker}".upper()
+    return result
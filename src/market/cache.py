@@ -0,0 +1,114 @@
+"""
+Redis-backed cache for indicator results.
+
+Keys are versioned by a per-ticker marker made of the company's latest
+quote time and a write stamp. Inserting quotes (`bump_indicator_cache`)
+replaces the marker, so every cached result for that ticker becomes
+unreachable; stale entries expire through their TTL (and Redis'
+volatile-lru eviction).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+CACHE_ALIAS = "default"
+KEY_PREFIX = "market:indicators"
+HITS_KEY = f"{KEY_PREFIX}:stats:hits"
+MISSES_KEY = f"{KEY_PREFIX}:stats:misses"
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_timeout():
+    return getattr(settings, "MARKET_INDICATOR_CACHE_TIMEOUT", 300)
+
+
+def get_latest_key(ticker):
+    return f"{KEY_PREFIX}:latest:{ticker.upper()}"
+
+
+def get_result_key(ticker, days, marker):
+    return f"{KEY_PREFIX}:{ticker.upper()}:{days}:{marker}"
+
+
+def make_marker(latest_time=None):
+    latest = "none" if latest_time is None else latest_time.isoformat()
+    return f"{latest}:{time.time_ns()}"
+
+
+def get_latest_quote_marker(ticker):
+    """
+    The ticker's cache version, created from its latest
+    quote time on first use.
+    """
+    cache = get_cache()
+    key = get_latest_key(ticker)
+    marker = cache.get(key)
+    if marker is not None:
+        return marker
+    from market.utils import get_latest_quote_time
+    latest_time = get_latest_quote_time(ticker=ticker)
+    marker = make_marker(latest_time)
+    cache.set(key, marker, timeout=None)
+    return marker
+
+
+def bump_indicator_cache(ticker, latest_time=None):
+    """
+    Version-bump the ticker after quotes were written.
+    """
+    get_cache().set(get_latest_key(ticker), make_marker(latest_time), timeout=None)
+
+
+def bump_indicator_caches(latest_times):
+    """
+    `bump_indicator_cache` for {ticker: latest_time} in one write.
+    """
+    get_cache().set_many(
+        {get_latest_key(ticker): make_marker(latest_time) for ticker, latest_time in latest_times.items()},
+        timeout=None
+    )
+
+
+def incr_counter(key):
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached(ticker, days):
+    key = get_result_key(ticker, days, get_latest_quote_marker(ticker))
+    result = get_cache().get(key)
+    if result is None:
+        incr_counter(MISSES_KEY)
+    else:
+        incr_counter(HITS_KEY)
+    return key, result
+
+
+def set_cached(key, result):
+    get_cache().set(key, result, timeout=get_timeout())
+
+
+def get_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total > 0 else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,112 @@
+"""
+Bar rows to NDJSON, CSV and Arrow IPC chunks for streaming responses.
+
+Rows are (time, open, high, low, close, volume, vwap, trades) tuples as
+read by `market.views`; each encoder takes an iterable of row chunks and
+yields bytes, so nothing larger than one chunk is held in memory.
+"""
+import csv
+import io
+import json
+
+
+BAR_COLUMNS = ['time', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'volume_weighted_average', 'number_of_trades']
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def to_float(value):
+    return None if value is None else float(value)
+
+
+def row_to_dict(row):
+    bar_time, open_price, high_price, low_price, close_price, volume, vwap, trades = row
+    return {
+        'time': bar_time.isoformat(),
+        'open_price': to_float(open_price),
+        'high_price': to_float(high_price),
+        'low_price': to_float(low_price),
+        'close_price': to_float(close_price),
+        'volume': None if volume is None else int(volume),
+        'volume_weighted_average': to_float(vwap),
+        'number_of_trades': None if trades is None else int(trades),
+    }
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(row_to_dict(row)) + "\n" for row in rows).encode()
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BAR_COLUMNS)
+    for rows in chunks:
+        for row in rows:
+            data = row_to_dict(row)
+            writer.writerow(["" if data[column] is None else data[column] for column in BAR_COLUMNS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell() > 0:
+        yield buffer.getvalue().encode()
+
+
+def has_arrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('time', pa.timestamp('ms', tz='UTC')),
+        ('open_price', pa.float64()),
+        ('high_price', pa.float64()),
+        ('low_price', pa.float64()),
+        ('close_price', pa.float64()),
+        ('volume', pa.int64()),
+        ('volume_weighted_average', pa.float64()),
+        ('number_of_trades', pa.int64()),
+    ])
+
+
+def encode_arrow(chunks):
+    """
+    An Arrow IPC stream: the schema, then one record batch per chunk.
+    """
+    import pyarrow as pa
+    schema = get_arrow_schema()
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows)) if len(rows) > 0 else [[] for _ in BAR_COLUMNS]
+            arrays = [pa.array(columns[0], type=schema.field('time').type)]
+            for i, column in enumerate(columns[1:], start=1):
+                values = [
+                    None if value is None else (int(value) if pa.types.is_integer(schema.field(i).type) else float(value))
+                    for value in column
+                ]
+                arrays.append(pa.array(values, type=schema.field(i).type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # end of stream marker
+    yield sink.getvalue()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "arrow": encode_arrow,
+}
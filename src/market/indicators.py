@@ -0,0 +1,201 @@
+"""
+Vectorized indicator calculations on daily bar arrays.
+
+Every function here works on plain NumPy arrays (oldest bar first) so
+the daily bars only need to be pulled from the database once per ticker.
+"""
+import numpy as np
+
+
+BAR_FIELDS = ('time', 'open_price', 'high_price', 'low_price', 'close_price', 'volume')
+
+
+class InsufficientDataError(Exception):
+    """
+    Too few bars to compute a ticker's indicators.
+    """
+
+
+def queryset_to_arrays(queryset):
+    """
+    Convert a StockQuote queryset into a dict of NumPy arrays,
+    ordered by time ascending, in a single query.
+    """
+    rows = list(queryset.order_by('time').values_list(*BAR_FIELDS))
+    return rows_to_arrays(rows)
+
+
+def rows_to_arrays(rows):
+    if len(rows) == 0:
+        return {
+            'time': np.array([], dtype=object),
+            'open': np.array([], dtype=np.float64),
+            'high': np.array([], dtype=np.float64),
+            'low': np.array([], dtype=np.float64),
+            'close': np.array([], dtype=np.float64),
+            'volume': np.array([], dtype=np.float64),
+        }
+    times, opens, highs, lows, closes, volumes = zip(*rows)
+    return {
+        'time': np.array(times, dtype=object),
+        'open': np.array(opens, dtype=np.float64),
+        'high': np.array(highs, dtype=np.float64),
+        'low': np.array(lows, dtype=np.float64),
+        'close': np.array(closes, dtype=np.float64),
+        'volume': np.array(volumes, dtype=np.float64),
+    }
+
+
+def wilder_smooth(values, period):
+    """
+    Final value of Wilder's smoothing (alpha = 1 / period), seeded with
+    the simple average of the first `period` values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return 0.0
+    seed = values[:period].mean()
+    rest = values[period:]
+    if len(rest) == 0:
+        return float(seed)
+    alpha = 1.0 / period
+    decay = 1.0 - alpha
+    n = len(rest)
+    weights = alpha * decay ** np.arange(n - 1, -1, -1)
+    return float(seed * decay ** n + np.dot(weights, rest))
+
+
+def compute_moving_averages(close, short_window=5, long_window=20):
+    if len(close) == 0:
+        return None
+    ma_5 = close[-short_window:].mean()
+    ma_20 = close[-long_window:].mean()
+    if ma_5 <= 0 or ma_20 <= 0:
+        return None
+    return {
+        "ma_5": float(round(ma_5, 4)),
+        "ma_20": float(round(ma_20, 4)),
+    }
+
+
+def compute_price_target(close, high, low):
+    """
+    Simplified price target calculation
+    """
+    if len(close) == 0:
+        return None
+    current_price = float(close[-1])
+    avg_price = float(close.mean())
+    price_range = float(high.max()) - float(low.min())
+
+    # Simple target based on average price and recent range
+    conservative_target = current_price + (price_range * 0.382)  # 38.2% Fibonacci
+    aggressive_target = current_price + (price_range * 0.618)   # 61.8% Fibonacci
+
+    return {
+        'current_price': round(current_price, 4),
+        'conservative_target': round(conservative_target, 4),
+        'aggressive_target': round(aggressive_target, 4),
+        'average_price': round(avg_price, 4)
+    }
+
+
+def compute_volume_trend(volume, days=28):
+    """
+    Analyze recent volume trends
+    """
+    if len(volume) == 0:
+        return None
+    vol = volume[-1]
+    avg_vol = volume[-days:].mean()
+    volume_change = 0
+    if vol > 0 and avg_vol > 0:
+        volume_change = ((vol - avg_vol) / avg_vol) * 100
+    return {
+        'avg_volume': float(avg_vol),
+        'latest_volume': int(vol),
+        'volume_change_percent': float(volume_change)
+    }
+
+
+def compute_rsi(close, days=28, period=14):
+    """
+    Wilder's Relative Strength Index over the daily closes.
+    """
+    if period is None:
+        period = int(days / 4)
+    changes = np.diff(close)
+    gains = np.where(changes > 0, changes, 0.0)
+    losses = np.where(changes < 0, -changes, 0.0)
+    avg_gain = wilder_smooth(gains, period)
+    avg_loss = wilder_smooth(losses, period)
+
+    # Prevent division by zero
+    if avg_loss == 0:
+        rsi = 100
+    else:
+        rs = avg_gain / avg_loss
+        rsi = 100 - (100 / (1 + rs))
+
+    return {
+        'rsi': round(float(rsi), 4),
+        'avg_gain': round(float(avg_gain), 4),
+        'avg_loss': round(float(avg_loss), 4),
+        'period': period,
+        'days': days,
+    }
+
+
+def get_signals(indicators):
+    """
+    Logic-based BUY (+1) / SELL (-1) / neutral (0) votes
+    for MA crossover, price target, volume trend and RSI.
+    """
+    signals = []
+    if indicators.get('ma_5') > indicators.get('ma_20'):
+        signals.append(1)
+    else:
+        signals.append(-1)
+    if indicators.get('current_price') < indicators.get('conservative_target'):
+        signals.append(1)
+    else:
+        signals.append(-1)
+    if indicators.get("volume_change_percent") > 20:
+        signals.append(1)
+    elif indicators.get("volume_change_percent") < -20:
+        signals.append(-1)
+    else:
+        signals.append(0)
+    rsi = indicators.get('rsi')
+    if rsi > 70:
+        signals.append(-1)  # Overbought
+    elif rsi < 30:
+        signals.append(1) # Oversold
+    else:
+        signals.append(0)
+    return signals
+
+
+def compute_stock_indicators(ticker, bars, days=30, period=14):
+    """
+    Same result shape as `market.services.get_stock_indicators`
+    computed from one set of daily bar arrays.
+    """
+    close = bars['close']
+    averages = compute_moving_averages(close)
+    price_target = compute_price_target(close, bars['high'], bars['low'])
+    volume_trend = compute_volume_trend(bars['volume'], days=days)
+    rsi_data = compute_rsi(close, days=days, period=period)
+    if averages is None or price_target is None or volume_trend is None:
+        raise InsufficientDataError(f"Data for {ticker} not found")
+    indicators = {
+        **averages,
+        **price_target,
+        **volume_trend,
+        **rsi_data,
+    }
+    return {
+        "score": sum(get_signals(indicators)),
+        "ticker": ticker,
+        "indicators": indicators,
+    }
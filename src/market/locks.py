@@ -0,0 +1,153 @@
+"""
+Redis (cache) backed locks and dedupe keys for sync jobs.
+
+A sync for one (company, window) is queued at most once while it waits
+(`queued` key) and runs at most once at a time (`running` lock), so
+duplicate requests coalesce into the one already queued or in flight.
+
+With the Redis cache, the running locks are plain Redis strings written
+with a client from `settings.REDIS_URL` (SET NX, compare-and-delete in
+Lua); other cache backends fall back to the cache.
+"""
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+CACHE_ALIAS = "default"
+KEY_PREFIX = "market:sync"
+# a backfill's pending window count outlives its last task by at most this
+PENDING_TIMEOUT = 24 * 60 * 60
+
+# delete the lock only while it still holds our token
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+_redis_client = None
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_redis_client():
+    """
+    A Redis client for the locks, or None when the cache isn't Redis.
+    """
+    global _redis_client
+    if not isinstance(get_cache(), RedisCache):
+        return None
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+def get_lock_timeout():
+    return getattr(settings, "MARKET_SYNC_LOCK_TIMEOUT", 15 * 60)
+
+
+def get_queued_key(name, *parts):
+    return ":".join([KEY_PREFIX, "queued", name, *[f"{part}" for part in parts]])
+
+
+def get_running_key(name, *parts):
+    return ":".join([KEY_PREFIX, "running", name, *[f"{part}" for part in parts]])
+
+
+def get_pending_key(name, *parts):
+    return ":".join([KEY_PREFIX, "pending", name, *[f"{part}" for part in parts]])
+
+
+def add_pending(key, count):
+    """
+    Count `count` more jobs of a group (e.g. a company's backfill windows).
+    """
+    cache = get_cache()
+    cache.add(key, 0, timeout=PENDING_TIMEOUT)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        # expired between add and incr
+        cache.set(key, count, timeout=PENDING_TIMEOUT)
+
+
+def finish_pending(key):
+    """
+    Count one job of the group as done; returns how many are left
+    (0 for the last one, or when nothing was counted).
+    """
+    cache = get_cache()
+    try:
+        remaining = cache.decr(key)
+    except ValueError:
+        return 0
+    if remaining <= 0:
+        cache.delete(key)
+        return 0
+    return remaining
+
+
+def mark_queued(key, timeout=None):
+    """
+    True if nothing with this key is queued yet (and marks it queued).
+    """
+    return get_cache().add(key, 1, timeout=timeout or get_lock_timeout())
+
+
+def clear_queued(key):
+    get_cache().delete(key)
+
+
+def acquire_lock(key, timeout=None):
+    """
+    Returns a token when the lock was acquired, else None.
+    The timeout releases locks of workers that died mid-task.
+    """
+    token = uuid.uuid4().hex
+    timeout = timeout or get_lock_timeout()
+    client = get_redis_client()
+    if client is not None:
+        acquired = client.set(key, token, nx=True, ex=timeout)
+    else:
+        acquired = get_cache().add(key, token, timeout=timeout)
+    if acquired:
+        return token
+    return None
+
+
+def release_lock(key, token):
+    """
+    Release the lock if it still holds `token`; a lock that expired and
+    was taken by another worker is kept. Atomic on Redis, get-then-delete
+    on other cache backends.
+    """
+    client = get_redis_client()
+    if client is not None:
+        client.eval(RELEASE_LOCK_LUA, 1, key, token)
+        return
+    cache = get_cache()
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+@contextmanager
+def lock(key, timeout=None):
+    """
+    with lock(key) as acquired:
+        if not acquired: return
+    """
+    token = acquire_lock(key, timeout=timeout)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            release_lock(key, token)
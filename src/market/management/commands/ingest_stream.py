@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from market import streaming
+
+
+class Command(BaseCommand):
+    help = "Aggregate streamed trade/quote events into 5 minute bars"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replay", help="JSON lines file of events")
+        parser.add_argument("--speed", type=float, default=None, help="replay pacing (1 = real time)")
+        parser.add_argument("--socket", help="host:port of a newline delimited JSON event stream")
+        parser.add_argument("--interval-minutes", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--flush-interval", type=float, default=5.0)
+        parser.add_argument("--max-events", type=int, default=None)
+        parser.add_argument("--no-publish", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["replay"]:
+            source = streaming.ReplaySource(options["replay"], speed=options["speed"])
+        elif options["socket"]:
+            host, _, port = options["socket"].rpartition(":")
+            source = streaming.SocketSource(host=host or "127.0.0.1", port=int(port))
+        else:
+            raise CommandError("Pass --replay or --socket")
+        publisher = None if options["no_publish"] else streaming.RedisPublisher()
+        worker = streaming.StreamIngestWorker(
+            source,
+            aggregator=streaming.BarAggregator(interval_ms=options["interval_minutes"] * 60 * 1000),
+            publisher=publisher,
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval"],
+            verbose=options["verbosity"] > 1,
+        )
+        stats = worker.run(max_events=options["max_events"])
+        self.stdout.write(f"{stats}")
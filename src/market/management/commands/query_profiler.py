@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from cfehome.metrics import PROFILER_CHECK_INTERVAL, query_profiler_enabled, set_query_profiler
+
+
+class Command(BaseCommand):
+    help = "Turn the per-request query profiler on or off (or show its state)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("state", nargs="?", choices=["on", "off", "status"], default="status")
+        parser.add_argument("--minutes", type=int, default=15, help="turn off again after this long (0 = never)")
+
+    def handle(self, *args, **options):
+        if options["state"] == "on":
+            minutes = options["minutes"]
+            set_query_profiler(True, timeout=minutes * 60 if minutes > 0 else None)
+        elif options["state"] == "off":
+            set_query_profiler(False)
+        enabled = query_profiler_enabled()
+        message = f"Query profiler is {'on' if enabled else 'off'}"
+        if options["state"] != "status":
+            message += f" (processes pick it up within {PROFILER_CHECK_INTERVAL}s)"
+        self.stdout.write(message)
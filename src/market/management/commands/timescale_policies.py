@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from market import policies
+
+
+class Command(BaseCommand):
+    help = "Apply StockQuote compression / retention / rollup policies and report compression"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compress-after-days", type=int, default=None, help="defaults to MARKET_COMPRESS_AFTER_DAYS")
+        parser.add_argument("--retention-days", type=int, default=None, help="defaults to MARKET_RAW_RETENTION_DAYS (0 = keep)")
+        parser.add_argument("--compress-now", action="store_true", help="compress eligible chunks without waiting for the job")
+        parser.add_argument("--refresh", action="store_true", help="materialize the hourly and daily rollups")
+        parser.add_argument("--status", action="store_true", help="only print the current state")
+
+    def handle(self, *args, **options):
+        if not policies.has_timescaledb(connection):
+            raise CommandError("TimescaleDB is not installed on this database")
+        if not options["status"]:
+            policies.apply_policies(
+                connection,
+                compress_after_days=options["compress_after_days"],
+                retention_days=options["retention_days"],
+                verbose=options["verbosity"] > 1,
+            )
+            if options["refresh"]:
+                policies.refresh_aggregates(connection, retention_days=options["retention_days"])
+            if options["compress_now"]:
+                count = policies.compress_chunks(connection, older_than_days=options["compress_after_days"])
+                self.stdout.write(f"Compressed {count} chunks")
+        self.stdout.write(json.dumps(policies.get_policy_status(connection), indent=2, default=str))
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CREATE_DAILY_AGGREGATE_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS market_dailystockquote
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    company_id,
+    time_bucket(INTERVAL '1 day', time) AS time,
+    first(open_price, time) AS open_price,
+    max(high_price) AS high_price,
+    min(low_price) AS low_price,
+    last(close_price, time) AS close_price,
+    sum(volume) AS volume,
+    sum(number_of_trades) AS number_of_trades,
+    sum(volume_weighted_average * volume) / NULLIF(sum(volume), 0) AS volume_weighted_average,
+    count(*) AS bar_count
+FROM market_stockquote
+GROUP BY company_id, time_bucket(INTERVAL '1 day', time)
+WITH NO DATA;
+"""
+
+ADD_REFRESH_POLICY_SQL = """
+SELECT add_continuous_aggregate_policy(
+    'market_dailystockquote',
+    start_offset => NULL,
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes',
+    if_not_exists => true
+);
+"""
+
+DROP_DAILY_AGGREGATE_SQL = """
+DROP MATERIALIZED VIEW IF EXISTS market_dailystockquote;
+"""
+
+
+def create_daily_aggregate(apps, schema_editor):
+    # continuous aggregates only exist on TimescaleDB
+    from market import policies
+    if not policies.has_timescaledb(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_DAILY_AGGREGATE_SQL)
+    schema_editor.execute(ADD_REFRESH_POLICY_SQL)
+
+
+def drop_daily_aggregate(apps, schema_editor):
+    from market import policies
+    if not policies.has_timescaledb(schema_editor.connection):
+        return
+    schema_editor.execute(DROP_DAILY_AGGREGATE_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0005_stockquote_raw_timestamp"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStockQuote",
+            fields=[
+                ("open_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("close_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("high_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("low_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("number_of_trades", models.BigIntegerField(blank=True, null=True)),
+                ("volume", models.BigIntegerField()),
+                (
+                    "volume_weighted_average",
+                    models.DecimalField(decimal_places=6, max_digits=10, null=True),
+                ),
+                ("bar_count", models.BigIntegerField()),
+                ("time", models.DateTimeField(primary_key=True, serialize=False)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="daily_stock_quotes",
+                        to="market.company",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "market_dailystockquote",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_daily_aggregate, drop_daily_aggregate),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0006_dailystockquote"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="stockquote",
+            name="raw_timestamp",
+            field=models.CharField(
+                blank=True,
+                help_text="Non transformed timestamp string or int or float",
+                max_length=120,
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="IndicatorState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "last_bar_time",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Latest quote time folded into this state",
+                        null=True,
+                    ),
+                ),
+                ("daily_bars", models.JSONField(blank=True, default=list)),
+                ("avg_gain", models.FloatField(default=0)),
+                ("avg_loss", models.FloatField(default=0)),
+                (
+                    "rsi_count",
+                    models.IntegerField(
+                        default=0,
+                        help_text="Number of daily price changes in avg_gain/avg_loss",
+                    ),
+                ),
+                ("sum_close_5", models.FloatField(default=0)),
+                ("sum_close_20", models.FloatField(default=0)),
+                ("sum_volume_20", models.FloatField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "company",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="indicator_state",
+                        to="market.company",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0007_indicatorstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillWindow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("from_date", models.DateField()),
+                ("to_date", models.DateField()),
+                ("multiplier", models.IntegerField(default=5)),
+                ("timespan", models.CharField(default="minute", max_length=20)),
+                ("rows", models.IntegerField(default=0)),
+                ("completed", models.DateTimeField(blank=True, null=True)),
+                ("timestamp", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="backfill_windows",
+                        to="market.company",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {
+                    ("company", "from_date", "to_date", "multiplier", "timespan")
+                },
+            },
+        ),
+    ]
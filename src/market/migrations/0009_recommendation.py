@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0008_backfillwindow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Recommendation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fingerprint", models.CharField(db_index=True, max_length=64)),
+                ("model", models.CharField(max_length=120)),
+                ("score", models.IntegerField(default=0)),
+                ("indicators", models.JSONField(default=dict)),
+                ("buy", models.BooleanField(default=False)),
+                ("sell", models.BooleanField(default=False)),
+                ("hold", models.BooleanField(default=False)),
+                ("explanation", models.TextField(blank=True, null=True)),
+                (
+                    "batch_size",
+                    models.IntegerField(
+                        default=1, help_text="Tickers sent in the same request"
+                    ),
+                ),
+                (
+                    "hits",
+                    models.IntegerField(
+                        default=0, help_text="Times reused from the cache"
+                    ),
+                ),
+                ("last_used", models.DateTimeField(blank=True, null=True)),
+                ("timestamp", models.DateTimeField(auto_now_add=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendations",
+                        to="market.company",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CREATE_HOURLY_AGGREGATE_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS market_hourlystockquote
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    company_id,
+    time_bucket(INTERVAL '1 hour', time) AS time,
+    first(open_price, time) AS open_price,
+    max(high_price) AS high_price,
+    min(low_price) AS low_price,
+    last(close_price, time) AS close_price,
+    sum(volume) AS volume,
+    sum(number_of_trades) AS number_of_trades,
+    sum(volume_weighted_average * volume) / NULLIF(sum(volume), 0) AS volume_weighted_average,
+    count(*) AS bar_count
+FROM market_stockquote
+GROUP BY company_id, time_bucket(INTERVAL '1 hour', time)
+WITH NO DATA;
+"""
+
+ENABLE_COMPRESSION_SQL = """
+ALTER TABLE market_stockquote SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'company_id',
+    timescaledb.compress_orderby = 'time'
+);
+"""
+
+DISABLE_COMPRESSION_SQL = """
+ALTER TABLE market_stockquote SET (timescaledb.compress = false);
+"""
+
+DROP_HOURLY_AGGREGATE_SQL = """
+DROP MATERIALIZED VIEW IF EXISTS market_hourlystockquote;
+"""
+
+
+def create_policies(apps, schema_editor):
+    from market import policies
+    connection = schema_editor.connection
+    if not policies.has_timescaledb(connection):
+        return
+    schema_editor.execute(CREATE_HOURLY_AGGREGATE_SQL)
+    schema_editor.execute(ENABLE_COMPRESSION_SQL)
+    policies.apply_policies(connection)
+
+
+def drop_policies(apps, schema_editor):
+    from market import policies
+    connection = schema_editor.connection
+    if not policies.has_timescaledb(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT remove_retention_policy('market_stockquote', if_exists => true)")
+        cursor.execute("SELECT remove_compression_policy('market_stockquote', if_exists => true)")
+    policies.decompress_chunks(connection)
+    schema_editor.execute(DISABLE_COMPRESSION_SQL)
+    schema_editor.execute(DROP_HOURLY_AGGREGATE_SQL)
+    # back to the unbounded daily refresh of migration 0006
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT remove_continuous_aggregate_policy('market_dailystockquote', if_exists => true)")
+        cursor.execute(
+            "SELECT add_continuous_aggregate_policy('market_dailystockquote', "
+            "start_offset => NULL, end_offset => INTERVAL '1 hour', "
+            "schedule_interval => INTERVAL '30 minutes', if_not_exists => true)"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0009_recommendation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HourlyStockQuote",
+            fields=[
+                ("open_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("close_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("high_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("low_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("number_of_trades", models.BigIntegerField(blank=True, null=True)),
+                ("volume", models.BigIntegerField()),
+                (
+                    "volume_weighted_average",
+                    models.DecimalField(decimal_places=6, max_digits=10, null=True),
+                ),
+                ("bar_count", models.BigIntegerField()),
+                ("time", models.DateTimeField(primary_key=True, serialize=False)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="hourly_stock_quotes",
+                        to="market.company",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "market_hourlystockquote",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_policies, drop_policies),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.1.3 on 2026-10-18 22:05
+
+from datetime import datetime, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+LATEST_QUOTE_FIELDS = [
+    "open_price",
+    "close_price",
+    "high_price",
+    "low_price",
+    "number_of_trades",
+    "volume",
+    "volume_weighted_average",
+    "time",
+]
+
+
+def populate_latest_quotes(apps, schema_editor):
+    # each company's newest bar and the last close of the day before it
+    Company = apps.get_model("market", "Company")
+    LatestQuote = apps.get_model("market", "LatestQuote")
+    StockQuote = apps.get_model("market", "StockQuote")
+    db_alias = schema_editor.connection.alias
+    rows = []
+    for company_id in Company.objects.using(db_alias).values_list("id", flat=True):
+        quotes = StockQuote.objects.using(db_alias).filter(company_id=company_id).order_by("-time")
+        latest = quotes.values(*LATEST_QUOTE_FIELDS).first()
+        if latest is None:
+            continue
+        day_start = datetime.combine(
+            latest["time"].astimezone(dt_timezone.utc).date(), datetime.min.time(), tzinfo=dt_timezone.utc
+        )
+        previous_close = quotes.filter(time__lt=day_start).values_list("close_price", flat=True).first()
+        change = None
+        change_percent = None
+        if previous_close:
+            change = round(float(latest["close_price"]) - float(previous_close), 4)
+            change_percent = change / float(previous_close) * 100
+        rows.append(LatestQuote(
+            company_id=company_id,
+            previous_close=previous_close,
+            change=change,
+            change_percent=change_percent,
+            **latest
+        ))
+    LatestQuote.objects.using(db_alias).bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0010_hourlystockquote_compression"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestQuote",
+            fields=[
+                (
+                    "company",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="latest_quote",
+                        serialize=False,
+                        to="market.company",
+                    ),
+                ),
+                ("open_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("close_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("high_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("low_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("number_of_trades", models.BigIntegerField(blank=True, null=True)),
+                ("volume", models.BigIntegerField()),
+                (
+                    "volume_weighted_average",
+                    models.DecimalField(decimal_places=6, max_digits=10, null=True),
+                ),
+                ("time", models.DateTimeField(db_index=True)),
+                (
+                    "previous_close",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=4,
+                        help_text="Last close of the previous day",
+                        max_digits=10,
+                        null=True,
+                    ),
+                ),
+                (
+                    "change",
+                    models.DecimalField(
+                        blank=True, decimal_places=4, max_digits=10, null=True
+                    ),
+                ),
+                ("change_percent", models.FloatField(blank=True, null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_latest_quotes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CREATE_COMBINED_VIEW_SQL = """
+CREATE VIEW market_combineddailystockquote AS
+SELECT
+    company_id, time, open_price, high_price, low_price, close_price,
+    volume, number_of_trades, volume_weighted_average, bar_count
+FROM market_dailystockquote
+UNION ALL
+SELECT
+    e.company_id, e.time, e.open_price, e.high_price, e.low_price, e.close_price,
+    e.volume, e.number_of_trades, e.volume_weighted_average, NULL::bigint AS bar_count
+FROM market_endofdaystockquote e
+WHERE NOT EXISTS (
+    SELECT 1 FROM market_dailystockquote d
+    WHERE d.company_id = e.company_id AND d.time = e.time
+);
+"""
+
+DROP_COMBINED_VIEW_SQL = """
+DROP VIEW IF EXISTS market_combineddailystockquote;
+"""
+
+
+def create_combined_view(apps, schema_editor):
+    # built on the daily continuous aggregate (see 0006)
+    from market import policies
+    if not policies.has_timescaledb(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_COMBINED_VIEW_SQL)
+
+
+def drop_combined_view(apps, schema_editor):
+    from market import policies
+    if not policies.has_timescaledb(schema_editor.connection):
+        return
+    schema_editor.execute(DROP_COMBINED_VIEW_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("market", "0011_latestquote"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CombinedDailyStockQuote",
+            fields=[
+                ("open_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("close_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("high_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("low_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("number_of_trades", models.BigIntegerField(blank=True, null=True)),
+                ("volume", models.BigIntegerField()),
+                (
+                    "volume_weighted_average",
+                    models.DecimalField(decimal_places=6, max_digits=10, null=True),
+                ),
+                (
+                    "bar_count",
+                    models.BigIntegerField(
+                        help_text="Intraday bars in the day; null for end of day bars",
+                        null=True,
+                    ),
+                ),
+                ("time", models.DateTimeField(primary_key=True, serialize=False)),
+            ],
+            options={
+                "db_table": "market_combineddailystockquote",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="EndOfDayStockQuote",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("open_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("close_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("high_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("low_price", models.DecimalField(decimal_places=4, max_digits=10)),
+                ("number_of_trades", models.BigIntegerField(blank=True, null=True)),
+                ("volume", models.BigIntegerField()),
+                (
+                    "volume_weighted_average",
+                    models.DecimalField(
+                        blank=True, decimal_places=6, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "raw_timestamp",
+                    models.CharField(
+                        blank=True,
+                        help_text="Non transformed timestamp string or int or float",
+                        max_length=120,
+                        null=True,
+                    ),
+                ),
+                ("time", models.DateTimeField(help_text="Start of the UTC day")),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="end_of_day_stock_quotes",
+                        to="market.company",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("company", "time")},
+            },
+        ),
+        migrations.RunPython(create_combined_view, drop_combined_view),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 20:02
+
+from django.db import migrations
+
+
+def clear_daily_bars(apps, schema_editor):
+    # states kept 21 bars; the next ingest rebuilds the longer window
+    IndicatorState = apps.get_model("market", "IndicatorState")
+    IndicatorState.objects.using(schema_editor.connection.alias).update(daily_bars=[])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("market", "0012_endofdaystockquote"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_daily_bars, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="avg_gain",
+        ),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="avg_loss",
+        ),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="rsi_count",
+        ),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="sum_close_20",
+        ),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="sum_close_5",
+        ),
+        migrations.RemoveField(
+            model_name="indicatorstate",
+            name="sum_volume_20",
+        ),
+    ]
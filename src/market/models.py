@@ -15,8 +15,15 @@ class Company(models.Model):
 
     def save(self, *args, **kwargs):
         self.ticker = f"{self.ticker}".upper()
+        is_new = self._state.adding
+        ticker_changed = False
+        if not is_new:
+            previous_ticker = Company.objects.filter(pk=self.pk).values_list('ticker', flat=True).first()
+            ticker_changed = previous_ticker != self.ticker
         super().save(*args, **kwargs)
-        tasks.sync_company_stock_quotes.delay(self.pk)
+        # only new companies or new tickers need quotes
+        if is_new or ticker_changed:
+            tasks.enqueue_company_sync(self.pk)
 
 class StockQuote(models.Model):
     """
@@ -48,4 +55,219 @@ class StockQuote(models.Model):
     timescale = TimescaleManager()
 
     class Meta:
-        unique_together = [('company', 'time')]
\ No newline at end of file
+        unique_together = [('company', 'time')]
+
+
+class EndOfDayStockQuote(models.Model):
+    """
+    Provider daily bars (polygon grouped daily), one per company and
+    UTC day. Kept apart from the 5 minute `StockQuote` bars so they never
+    feed the hourly / daily rollups, `LatestQuote` or the intraday reads;
+    the daily readers see them through `CombinedDailyStockQuote`.
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        related_name="end_of_day_stock_quotes"
+    )
+    open_price = models.DecimalField(max_digits=10, decimal_places=4)
+    close_price = models.DecimalField(max_digits=10, decimal_places=4)
+    high_price = models.DecimalField(max_digits=10, decimal_places=4)
+    low_price = models.DecimalField(max_digits=10, decimal_places=4)
+    number_of_trades = models.BigIntegerField(blank=True, null=True)
+    volume = models.BigIntegerField()
+    volume_weighted_average = models.DecimalField(max_digits=10, decimal_places=6, blank=True, null=True)
+    raw_timestamp = models.CharField(max_length=120, null=True, blank=True, help_text="Non transformed timestamp string or int or float")
+    time = models.DateTimeField(help_text="Start of the UTC day")
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('company', 'time')]
+
+
+class LatestQuote(models.Model):
+    """
+    Each company's most recent bar and its change from the previous
+    day's close, upserted in the same transaction as the quotes
+    (see `market.utils.upsert_latest_quotes`).
+    """
+    company = models.OneToOneField(
+        Company,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="latest_quote"
+    )
+    open_price = models.DecimalField(max_digits=10, decimal_places=4)
+    close_price = models.DecimalField(max_digits=10, decimal_places=4)
+    high_price = models.DecimalField(max_digits=10, decimal_places=4)
+    low_price = models.DecimalField(max_digits=10, decimal_places=4)
+    number_of_trades = models.BigIntegerField(blank=True, null=True)
+    volume = models.BigIntegerField()
+    volume_weighted_average = models.DecimalField(max_digits=10, decimal_places=6, null=True)
+    time = models.DateTimeField(db_index=True)
+    previous_close = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True, help_text="Last close of the previous day")
+    change = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
+    change_percent = models.FloatField(blank=True, null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class DailyStockQuote(models.Model):
+    """
+    Daily OHLCV bars per company, read from the `market_dailystockquote`
+    TimescaleDB continuous aggregate over `StockQuote` (see migration 0006).
+    Read only.
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="daily_stock_quotes"
+    )
+    open_price = models.DecimalField(max_digits=10, decimal_places=4)
+    close_price = models.DecimalField(max_digits=10, decimal_places=4)
+    high_price = models.DecimalField(max_digits=10, decimal_places=4)
+    low_price = models.DecimalField(max_digits=10, decimal_places=4)
+    number_of_trades = models.BigIntegerField(blank=True, null=True)
+    volume = models.BigIntegerField()
+    volume_weighted_average = models.DecimalField(max_digits=10, decimal_places=6, null=True)
+    bar_count = models.BigIntegerField()
+    # the view has no id column; (company, time) is unique
+    time = models.DateTimeField(primary_key=True)
+
+    objects = models.Manager()
+    timescale = TimescaleManager()
+
+    class Meta:
+        managed = False
+        db_table = "market_dailystockquote"
+
+
+class HourlyStockQuote(models.Model):
+    """
+    Hourly OHLCV bars per company, read from the `market_hourlystockquote`
+    TimescaleDB continuous aggregate over `StockQuote` (see migration 0010).
+    Kept after the raw bars pass their retention age. Read only.
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="hourly_stock_quotes"
+    )
+    open_price = models.DecimalField(max_digits=10, decimal_places=4)
+    close_price = models.DecimalField(max_digits=10, decimal_places=4)
+    high_price = models.DecimalField(max_digits=10, decimal_places=4)
+    low_price = models.DecimalField(max_digits=10, decimal_places=4)
+    number_of_trades = models.BigIntegerField(blank=True, null=True)
+    volume = models.BigIntegerField()
+    volume_weighted_average = models.DecimalField(max_digits=10, decimal_places=6, null=True)
+    bar_count = models.BigIntegerField()
+    # the view has no id column; (company, time) is unique
+    time = models.DateTimeField(primary_key=True)
+
+    objects = models.Manager()
+    timescale = TimescaleManager()
+
+    class Meta:
+        managed = False
+        db_table = "market_hourlystockquote"
+
+
+class CombinedDailyStockQuote(models.Model):
+    """
+    Daily bars per company from the `market_combineddailystockquote`
+    view (see migration 0012): the `DailyStockQuote` rollup of the
+    intraday bars, plus `EndOfDayStockQuote` bars for days without any.
+    What the daily readers in `market.services` query. Read only.
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="combined_daily_stock_quotes"
+    )
+    open_price = models.DecimalField(max_digits=10, decimal_places=4)
+    close_price = models.DecimalField(max_digits=10, decimal_places=4)
+    high_price = models.DecimalField(max_digits=10, decimal_places=4)
+    low_price = models.DecimalField(max_digits=10, decimal_places=4)
+    number_of_trades = models.BigIntegerField(blank=True, null=True)
+    volume = models.BigIntegerField()
+    volume_weighted_average = models.DecimalField(max_digits=10, decimal_places=6, null=True)
+    bar_count = models.BigIntegerField(null=True, help_text="Intraday bars in the day; null for end of day bars")
+    # the view has no id column; (company, time) is unique
+    time = models.DateTimeField(primary_key=True)
+
+    objects = models.Manager()
+    timescale = TimescaleManager()
+
+    class Meta:
+        managed = False
+        db_table = "market_combineddailystockquote"
+
+
+class IndicatorState(models.Model):
+    """
+    A cached window of each company's recent daily bars, updated
+    after new quotes are inserted (see `market.utils.update_indicator_state`).
+
+    `daily_bars` holds the daily bars of the last
+    `MARKET_INDICATOR_STATE_DAYS` as [date, open, high, low, close, volume];
+    the last one may still be in progress. Indicators for windows that fit
+    are computed from it without reading the quotes.
+    """
+    company = models.OneToOneField(
+        Company,
+        on_delete=models.CASCADE,
+        related_name="indicator_state"
+    )
+    last_bar_time = models.DateTimeField(blank=True, null=True, help_text="Latest quote time folded into this state")
+    daily_bars = models.JSONField(default=list, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class BackfillWindow(models.Model):
+    """
+    Progress of a historical backfill: one row per disjoint
+    (company, from_date, to_date) window planned by `market.backfill`.
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        related_name="backfill_windows"
+    )
+    from_date = models.DateField()
+    to_date = models.DateField()
+    multiplier = models.IntegerField(default=5)
+    timespan = models.CharField(max_length=20, default="minute")
+    rows = models.IntegerField(default=0)
+    completed = models.DateTimeField(blank=True, null=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('company', 'from_date', 'to_date', 'multiplier', 'timespan')]
+
+
+class Recommendation(models.Model):
+    """
+    A buy / sell / hold recommendation from the language model, kept for
+    audit and reused while a ticker's rounded indicators (`fingerprint`)
+    are unchanged (see `market.recommendations`).
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        related_name="recommendations"
+    )
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    model = models.CharField(max_length=120)
+    score = models.IntegerField(default=0)
+    indicators = models.JSONField(default=dict)
+    buy = models.BooleanField(default=False)
+    sell = models.BooleanField(default=False)
+    hold = models.BooleanField(default=False)
+    explanation = models.TextField(blank=True, null=True)
+    batch_size = models.IntegerField(default=1, help_text="Tickers sent in the same request")
+    hits = models.IntegerField(default=0, help_text="Times reused from the cache")
+    last_used = models.DateTimeField(blank=True, null=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,220 @@
+"""
+TimescaleDB storage policies for `StockQuote`.
+
+- compression: chunks older than MARKET_COMPRESS_AFTER_DAYS are
+  compressed, segmented by company and ordered by time.
+- retention: raw 5 minute chunks older than MARKET_RAW_RETENTION_DAYS
+  are dropped (0 keeps them forever).
+- rollups: the hourly (`HourlyStockQuote`) and daily (`DailyStockQuote`)
+  continuous aggregates keep the downsampled bars after the raw chunks
+  are gone. Their refresh windows stop short of the retention age, since
+  refreshing a range whose raw data was dropped would empty it; history
+  backfilled past that age is refreshed window by window as it lands
+  (`refresh_backfilled_range`).
+
+Applied by migration 0010; `python manage.py timescale_policies` re-applies
+them after the settings change and reports the compression ratio.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+HYPERTABLE = "market_stockquote"
+HOURLY_AGGREGATE = "market_hourlystockquote"
+DAILY_AGGREGATE = "market_dailystockquote"
+
+# (view, end_offset, schedule_interval)
+AGGREGATE_POLICIES = [
+    (HOURLY_AGGREGATE, "1 hour", "15 minutes"),
+    (DAILY_AGGREGATE, "1 hour", "30 minutes"),
+]
+
+
+def get_compress_after_days():
+    return getattr(settings, "MARKET_COMPRESS_AFTER_DAYS", 30)
+
+
+def get_raw_retention_days():
+    return getattr(settings, "MARKET_RAW_RETENTION_DAYS", 730)
+
+
+def has_timescaledb(connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+        return cursor.fetchone() is not None
+
+
+def get_refresh_start_offset(retention_days):
+    """
+    How far back the aggregate refresh policies look: everything while
+    raw data is kept forever, otherwise a day short of the retention age.
+    """
+    if not retention_days:
+        return None
+    return f"{max(retention_days - 1, 1)} days"
+
+
+def set_aggregate_policies(cursor, retention_days):
+    start_offset = get_refresh_start_offset(retention_days)
+    for view, end_offset, schedule_interval in AGGREGATE_POLICIES:
+        cursor.execute(
+            "SELECT remove_continuous_aggregate_policy(%s, if_exists => true)",
+            [view]
+        )
+        cursor.execute(
+            "SELECT add_continuous_aggregate_policy("
+            "%s, start_offset => %s::interval, end_offset => %s::interval, "
+            "schedule_interval => %s::interval, if_not_exists => true)",
+            [view, start_offset, end_offset, schedule_interval]
+        )
+
+
+def set_compression_policy(cursor, compress_after_days):
+    cursor.execute(f"SELECT remove_compression_policy('{HYPERTABLE}', if_exists => true)")
+    if compress_after_days:
+        cursor.execute(
+            f"SELECT add_compression_policy('{HYPERTABLE}', "
+            f"compress_after => %s::interval, if_not_exists => true)",
+            [f"{compress_after_days} days"]
+        )
+
+
+def set_retention_policy(cursor, retention_days):
+    cursor.execute(f"SELECT remove_retention_policy('{HYPERTABLE}', if_exists => true)")
+    if retention_days:
+        cursor.execute(
+            f"SELECT add_retention_policy('{HYPERTABLE}', "
+            f"drop_after => %s::interval, if_not_exists => true)",
+            [f"{retention_days} days"]
+        )
+
+
+def apply_policies(connection, compress_after_days=None, retention_days=None, verbose=False):
+    """
+    (Re)create the compression, retention and aggregate refresh policies.
+    Returns False without TimescaleDB.
+    """
+    if not has_timescaledb(connection):
+        return False
+    if compress_after_days is None:
+        compress_after_days = get_compress_after_days()
+    if retention_days is None:
+        retention_days = get_raw_retention_days()
+    if retention_days and compress_after_days and retention_days <= compress_after_days:
+        raise Exception("Raw retention must be longer than the compression age")
+    with connection.cursor() as cursor:
+        # aggregate windows first so a shorter retention never
+        # overlaps a refresh window
+        set_aggregate_policies(cursor, retention_days)
+        set_compression_policy(cursor, compress_after_days)
+        set_retention_policy(cursor, retention_days)
+    if verbose:
+        print("compress after", compress_after_days, "days, raw retention", retention_days or "forever")
+    return True
+
+
+def compress_chunks(connection, older_than_days=None):
+    """
+    Compress eligible chunks now instead of waiting for the policy job.
+    Returns the number of chunks compressed.
+    """
+    if older_than_days is None:
+        older_than_days = get_compress_after_days()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT compress_chunk(c, if_not_compressed => true) "
+            f"FROM show_chunks('{HYPERTABLE}', older_than => %s::interval) c",
+            [f"{older_than_days} days"]
+        )
+        return len(cursor.fetchall())
+
+
+def decompress_chunks(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT decompress_chunk(c, if_compressed => true) "
+            f"FROM show_chunks('{HYPERTABLE}') c"
+        )
+        return len(cursor.fetchall())
+
+
+def refresh_aggregates(connection, start=None, end=None, retention_days=None):
+    """
+    Materialize both rollups for a range, e.g. after backfilling history.
+    By default from a day inside the raw retention age (or the beginning
+    when raw data is kept) to now.
+    """
+    if retention_days is None:
+        retention_days = get_raw_retention_days()
+    if start is None and retention_days:
+        start = timezone.now() - timedelta(days=max(retention_days - 1, 1))
+    with connection.cursor() as cursor:
+        for view, _, _ in AGGREGATE_POLICIES:
+            cursor.execute(f"CALL refresh_continuous_aggregate('{view}', %s, %s)", [start, end])
+
+
+def refresh_backfilled_range(connection, start, end, retention_days=None):
+    """
+    Materialize both rollups for freshly backfilled raw bars that the
+    refresh policies no longer reach (older than the retention window),
+    before the retention job drops them. Returns True when refreshed.
+    Must run outside a transaction.
+    """
+    if not has_timescaledb(connection):
+        return False
+    if retention_days is None:
+        retention_days = get_raw_retention_days()
+    if not retention_days:
+        # raw bars are kept, the policies refresh everything
+        return False
+    if start >= timezone.now() - timedelta(days=max(retention_days - 1, 1)):
+        return False
+    refresh_aggregates(connection, start=start, end=end, retention_days=retention_days)
+    return True
+
+
+def get_policy_status(connection):
+    """
+    Chunk counts, sizes before / after compression and scheduled jobs.
+    """
+    status = {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT total_chunks, number_compressed_chunks, "
+            f"before_compression_total_bytes, after_compression_total_bytes "
+            f"FROM hypertable_compression_stats('{HYPERTABLE}')"
+        )
+        row = cursor.fetchone() or (None, None, None, None)
+        before, after = row[2], row[3]
+        status["compression"] = {
+            "total_chunks": row[0],
+            "compressed_chunks": row[1],
+            "before_bytes": before,
+            "after_bytes": after,
+            "ratio": before / after if before and after else None,
+        }
+        cursor.execute(f"SELECT hypertable_size('{HYPERTABLE}')")
+        status["hypertable_bytes"] = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT job_id, proc_name, hypertable_name, schedule_interval::text, config::text "
+            "FROM timescaledb_information.jobs "
+            "WHERE hypertable_name IN (%s, %s, %s) "
+            "OR config->>'mat_hypertable_id' IS NOT NULL "
+            "ORDER BY job_id",
+            [HYPERTABLE, HOURLY_AGGREGATE, DAILY_AGGREGATE]
+        )
+        status["jobs"] = [
+            {
+                "job_id": job_id,
+                "proc_name": proc_name,
+                "hypertable_name": hypertable_name,
+                "schedule_interval": schedule_interval,
+                "config": config,
+            }
+            for job_id, proc_name, hypertable_name, schedule_interval, config in cursor.fetchall()
+        ]
+    return status
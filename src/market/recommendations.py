@@ -0,0 +1,279 @@
+"""
+Language model buy / sell / hold recommendations.
+
+Each ticker's indicators are rounded and hashed into a fingerprint; a
+stored `Recommendation` with the same fingerprint (and model) is reused
+instead of asking the model again. Misses are sent several tickers per
+request, with a few requests in flight at once. Every model answer is
+stored for audit.
+
+The model client is injectable: anything with a `model` name and a
+`recommend(items)` method works, e.g. `StubRecommendationClient` to
+run offline.
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import services as market_services
+from .models import Company, Recommendation
+
+
+# bump when the prompt changes so old answers are not reused
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You are an expert an analyzing stocks and respond in JSON data"
+
+RECOMMENDATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "ticker": {
+                        "description": "Ticker the recommendation is for",
+                        "type": "string"
+                    },
+                    "buy": {
+                        "description": "Recommend to buy stock",
+                        "type": "boolean"
+                    },
+                    "sell": {
+                        "description": "Recommend to sell stock",
+                        "type": "boolean"
+                    },
+                    "hold": {
+                        "description": "Recommend to hold stock",
+                        "type": "boolean"
+                    },
+                    "explanation": {
+                        "description": "Explanation of reasoning in 1 or 2 sentences",
+                        "type": "string"
+                    },
+                },
+                "required": ["ticker", "buy", "sell", "hold", "explanation"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["recommendations"],
+    "additionalProperties": False
+}
+
+
+def get_model_name():
+    return getattr(settings, "MARKET_RECOMMENDATION_MODEL", "gpt-4o-mini")
+
+
+class OpenAIRecommendationClient:
+    """
+    One chat completion for a batch of tickers, answered as JSON.
+    """
+
+    def __init__(self, model=None, api_key=None):
+        self.model = model or get_model_name()
+        self.api_key = api_key or getattr(settings, "OPENAI_API_KEY", None)
+        self._client = None
+
+    def get_client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    def recommend(self, items):
+        response = self.get_client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": (
+                    f"Considering these results {json.dumps(items)}, "
+                    f"provide a recommendation for each ticker"
+                )}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "recommendations",
+                    "schema": RECOMMENDATION_SCHEMA,
+                    "strict": True,
+                }
+            }
+        )
+        return json.loads(response.choices[0].message.content)["recommendations"]
+
+
+class StubRecommendationClient:
+    """
+    Offline stand-in: answers from the score after `latency` seconds.
+    """
+
+    def __init__(self, model="stub", latency=0.0):
+        self.model = model
+        self.latency = latency
+        self.calls = 0
+
+    def recommend(self, items):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for item in items:
+            score = item["score"]
+            results.append({
+                "ticker": item["ticker"],
+                "buy": score >= 2,
+                "sell": score <= -2,
+                "hold": -2 < score < 2,
+                "explanation": f"Score of {score}.",
+            })
+        return results
+
+
+def round_indicators(indicators, digits=2):
+    return {
+        key: round(value, digits) if isinstance(value, float) else value
+        for key, value in indicators.items()
+    }
+
+
+def get_fingerprint(ticker, score, indicators, model, digits=2):
+    data = {
+        "ticker": ticker,
+        "score": score,
+        "indicators": round_indicators(indicators, digits=digits),
+        "model": model,
+        "prompt_version": PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+async def fetch_recommendation_batches(batches, client, concurrency=4):
+    """
+    Run `client.recommend` for each batch in worker threads, at most
+    `concurrency` at once, yielding (batch, results, error) as they finish.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(batch):
+        async with semaphore:
+            try:
+                results = await asyncio.to_thread(client.recommend, batch)
+            except Exception as e:
+                return batch, None, e
+        return batch, results, None
+
+    tasks = [asyncio.create_task(run(batch)) for batch in batches]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def to_result(obj, cached):
+    return {
+        "ticker": obj.company.ticker,
+        "score": obj.score,
+        "indicators": obj.indicators,
+        "buy": obj.buy,
+        "sell": obj.sell,
+        "hold": obj.hold,
+        "explanation": obj.explanation,
+        "model": obj.model,
+        "cached": cached,
+        "recommendation_id": obj.id,
+    }
+
+
+def get_recommendations(tickers, days=30, client=None, batch_size=5, concurrency=4, digits=2, verbose=False):
+    """
+    Recommendations for `tickers` (in that order). Tickers without
+    indicators or without an answer get an `error` entry instead.
+    """
+    if client is None:
+        client = OpenAIRecommendationClient()
+    tickers = [f"{ticker}".upper() for ticker in tickers]
+    companies = {obj.ticker: obj for obj in Company.objects.filter(ticker__in=tickers)}
+    results = {}
+    items = {}
+    for ticker in tickers:
+        if ticker not in companies:
+            results[ticker] = {"ticker": ticker, "error": f"Company {ticker} not found"}
+            continue
+        try:
+            data = market_services.get_cached_stock_indicators(ticker=ticker, days=days)
+        except Exception as e:
+            results[ticker] = {"ticker": ticker, "error": f"{e}"}
+            continue
+        fingerprint = get_fingerprint(ticker, data["score"], data["indicators"], client.model, digits=digits)
+        items[ticker] = (fingerprint, data)
+
+    stored = {}
+    qs = Recommendation.objects.filter(
+        fingerprint__in=[fingerprint for fingerprint, _ in items.values()],
+        model=client.model,
+    ).select_related('company').order_by('-timestamp')
+    for obj in qs:
+        stored.setdefault(obj.fingerprint, obj)
+    reused = []
+    misses = []
+    for ticker, (fingerprint, data) in items.items():
+        obj = stored.get(fingerprint)
+        if obj is None:
+            misses.append({"ticker": ticker, "score": data["score"], "indicators": data["indicators"]})
+            continue
+        reused.append(obj.id)
+        results[ticker] = to_result(obj, cached=True)
+    if len(reused) > 0:
+        Recommendation.objects.filter(id__in=reused).update(hits=F('hits') + 1, last_used=timezone.now())
+    if verbose:
+        print(len(reused), "reused,", len(misses), "to request")
+
+    batches = [misses[i:i+batch_size] for i in range(0, len(misses), batch_size)]
+
+    async def consume():
+        return [
+            answer async for answer in fetch_recommendation_batches(batches, client, concurrency=concurrency)
+        ]
+
+    answers = async_to_sync(consume)() if len(batches) > 0 else []
+    created = []
+    for batch, batch_results, error in answers:
+        if error is not None:
+            if verbose:
+                print("batch failed", [item["ticker"] for item in batch], error)
+            for item in batch:
+                results[item["ticker"]] = {"ticker": item["ticker"], "error": f"{error}"}
+            continue
+        by_ticker = {f"{answer.get('ticker')}".upper(): answer for answer in batch_results}
+        for item in batch:
+            ticker = item["ticker"]
+            answer = by_ticker.get(ticker)
+            if answer is None:
+                results[ticker] = {"ticker": ticker, "error": "Missing from the model response"}
+                continue
+            created.append(Recommendation(
+                company=companies[ticker],
+                fingerprint=items[ticker][0],
+                model=client.model,
+                score=item["score"],
+                indicators=item["indicators"],
+                buy=bool(answer.get("buy")),
+                sell=bool(answer.get("sell")),
+                hold=bool(answer.get("hold")),
+                explanation=answer.get("explanation"),
+                batch_size=len(batch),
+            ))
+    for obj in Recommendation.objects.bulk_create(created):
+        results[obj.company.ticker] = to_result(obj, cached=False)
+    return [results[ticker] for ticker in tickers]
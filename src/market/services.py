@@ -1,3 +1,5 @@
+import logging
+
 from django.db.models import (
     Avg, 
     F,
@@ -9,41 +11,141 @@ from django.db.models import (
     DecimalField,
     Case,
     When,
-    Value
+    Value,
+    Subquery,
 )
-from django.db.models.functions import TruncDate, FirstValue, Lag, Coalesce
+from django.db.models.functions import TruncDate, Lag, Coalesce, RowNumber
+from django.db import connections
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
+from itertools import groupby
 
+from asgiref.sync import sync_to_async
 
-from market.models import StockQuote
+from helpers import aiodb, metrics
 
+from market.models import StockQuote, CombinedDailyStockQuote, IndicatorState, LatestQuote
+from market import indicators as market_indicators
+from market import utils as market_utils
+from market import cache as market_cache
+from market import policies as market_policies
 
-def get_daily_stock_quotes_queryset(ticker, days=28, use_bucket=False):
+logger = logging.getLogger(__name__)
+
+# connection alias -> whether it has the timescaledb extension
+TIMESCALEDB_ALIASES = {}
+
+
+def use_daily_aggregate(using='default'):
+    """
+    The `DailyStockQuote` continuous aggregate (and the
+    `CombinedDailyStockQuote` view over it) only exist on TimescaleDB;
+    elsewhere daily bars come from the raw quotes alone. The extension
+    check runs once per connection alias.
+    """
+    if using not in TIMESCALEDB_ALIASES:
+        TIMESCALEDB_ALIASES[using] = market_policies.has_timescaledb(connections[using])
+    return TIMESCALEDB_ALIASES[using]
+
+
+def get_daily_range(days=28):
+    """
+    (start, now) of a `days` window of daily bars; the start is
+    truncated to midnight (UTC) so every path keeps whole first days.
+    """
     now = timezone.now()
-    start_date = now - timedelta(days=days)
-    end_date = now
+    start_date = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start_date, now
+
+
+def get_daily_stock_quotes_queryset(ticker, days=28, use_bucket=False):
+    if not use_daily_aggregate():
+        return get_raw_daily_stock_quotes_queryset(ticker, days=days, use_bucket=use_bucket)
+    start_date, end_date = get_daily_range(days=days)
+    qs = CombinedDailyStockQuote.timescale.filter(
+        company__ticker=ticker,
+        time__range=(start_date, end_date)
+    )
+    if use_bucket:
+        return qs.time_bucket('time', '1 day')
+    return qs
+
+
+def get_raw_daily_stock_quotes_queryset(ticker, days=28, use_bucket=False):
+    """
+    Last raw bar of each day, for databases without the daily aggregate.
+    """
+    start_date, end_date = get_daily_range(days=days)
     lastest_daily_timestamps = (
-        StockQuote.objects.filter(company__ticker=ticker, time__range=(start_date - timedelta(days=40), end_date))
+        StockQuote.objects.filter(company__ticker=ticker, time__range=(start_date, end_date))
         .annotate(date=TruncDate('time'))
         .values('company', 'date')
         .annotate(latest_time=Max('time'))
-        .values('company', 'date', 'latest_time')
-        .order_by('date')
+        .values('latest_time')
     )
-    acutal_timestamps = [x['latest_time'] for x in lastest_daily_timestamps]
     qs = StockQuote.timescale.filter(
         company__ticker=ticker, 
         time__range=(start_date, end_date),
-        time__in=acutal_timestamps
+        time__in=Subquery(lastest_daily_timestamps)
     )
     if use_bucket:
         return qs.time_bucket('time', '1 day')
     return qs
 
 
+def get_daily_stock_quotes_arrays(ticker, days=28, queryset=None):
+    """
+    Daily bars for a ticker as NumPy arrays (oldest first),
+    fetched with a single query.
+    """
+    if queryset is None:
+        queryset = get_daily_stock_quotes_queryset(ticker, days=days)
+    return market_indicators.queryset_to_arrays(queryset)
+
+
+def get_daily_quotes_queryset(start_date=None, end_date=None, **filters):
+    """
+    Daily bars matching `filters` from the continuous aggregate (with
+    end of day bars filling days without intraday bars), or the last raw
+    bar of each day via a row number window partitioned by company and date.
+    `start_date` is truncated to midnight, as in `get_daily_range`.
+    """
+    if start_date is not None:
+        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if use_daily_aggregate():
+        qs = CombinedDailyStockQuote.objects.filter(**filters)
+        if start_date is not None:
+            qs = qs.filter(time__gte=start_date)
+        if end_date is not None:
+            qs = qs.filter(time__lte=end_date)
+        return qs
+    qs = StockQuote.objects.filter(**filters)
+    if start_date is not None:
+        qs = qs.filter(time__gte=start_date)
+    if end_date is not None:
+        qs = qs.filter(time__lte=end_date)
+    return qs.annotate(
+        daily_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('company_id'), TruncDate('time')],
+            order_by=F('time').desc(),
+        )
+    ).filter(daily_rank=1)
 
+
+def get_daily_universe_quotes_queryset(days=28, company_ids=None):
+    """
+    Daily bars for every active company.
+    """
+    start_date, end_date = get_daily_range(days=days)
+    filters = {"company__active": True}
+    if company_ids is not None:
+        filters["company_id__in"] = company_ids
+    return get_daily_quotes_queryset(start_date=start_date, end_date=end_date, **filters)
+
+
+@metrics.instrument("services.get_daily_moving_averages")
 def get_daily_moving_averages(ticker, days=28, queryset=None):
     if queryset is None:
         queryset = get_daily_stock_quotes_queryset(ticker=ticker, days=days)
@@ -75,32 +177,27 @@ def get_daily_moving_averages(ticker, days=28, queryset=None):
     }
 
 
+@metrics.instrument("services.get_price_target")
 def get_price_target(ticker, days=28, queryset=None):
     """
     Simplified price target calculation
     """
+    latest_close = None
     if queryset is None:
-        queryset = get_daily_stock_quotes_queryset(ticker, days=days)    
-    daily_data = (
-        queryset
-        .annotate(
-            latest_price=Window(
-                expression=FirstValue('close_price'),
-                partition_by=[],
-                order_by=F('time').desc()
-            )
-        )
-        .aggregate(
-            current_price=Max('latest_price'),
-            avg_price=Avg('close_price'),
-            highest=Max('high_price'),
-            lowest=Min('low_price')
-        )
+        queryset = get_daily_stock_quotes_queryset(ticker, days=days)
+        latest_close = LatestQuote.objects.filter(company__ticker=ticker).values_list('close_price', flat=True).first()
+    if latest_close is None:
+        latest_close = queryset.order_by('-time').values_list('close_price', flat=True).first()
+    if latest_close is None:
+        return None
+    daily_data = queryset.aggregate(
+        avg_price=Avg('close_price'),
+        highest=Max('high_price'),
+        lowest=Min('low_price')
     )
-    
-    if not daily_data:
+    if daily_data['avg_price'] is None:
         return None
-    current_price = float(daily_data['current_price'])
+    current_price = float(latest_close)
     avg_price = float(daily_data['avg_price'])
     price_range = float(daily_data['highest']) - float(daily_data['lowest'])
     
@@ -115,6 +212,7 @@ def get_price_target(ticker, days=28, queryset=None):
         'average_price':  round(avg_price, 4)
     }
 
+@metrics.instrument("services.get_volume_trend")
 def get_volume_trend(ticker, days=28, queryset=None):
     """
     Analyze recent volume trends
@@ -133,11 +231,12 @@ def get_volume_trend(ticker, days=28, queryset=None):
 
     if not data:
         return None
-    vol = data.volume
-    avg_vol = data.avg_volume
-    volume_change = 0
-    if vol is None or avg_vol is None:
+    if data.volume is None or data.avg_volume is None:
         return None
+    # the daily aggregate's sum(volume) comes back as numeric
+    vol = float(data.volume)
+    avg_vol = float(data.avg_volume)
+    volume_change = 0
     if vol > 0 and avg_vol > 0:
         volume_change = (( vol - avg_vol) / avg_vol) * 100
     return {
@@ -146,6 +245,7 @@ def get_volume_trend(ticker, days=28, queryset=None):
         'volume_change_percent': float(volume_change)
     }
 
+@metrics.instrument("services.calculate_rsi")
 def calculate_rsi(ticker, days=28, queryset=None, period=14):
     """
     Calculate Relative Strength Index (RSI) using Django ORM.
@@ -250,44 +350,171 @@ def calculate_rsi(ticker, days=28, queryset=None, period=14):
     }
 
 
+def get_latest_quotes(tickers=None, active=True):
+    """
+    {ticker: latest bar with its day-over-day change} for the universe
+    (or `tickers`) in one read of the LatestQuote table.
+    """
+    qs = LatestQuote.objects.filter(company__active=active)
+    if tickers is not None:
+        qs = qs.filter(company__ticker__in=[f"{ticker}".upper() for ticker in tickers])
+    rows = qs.values(
+        'company__ticker', 'time', 'open_price', 'high_price', 'low_price', 'close_price',
+        'volume', 'previous_close', 'change', 'change_percent'
+    )
+    return {row.pop('company__ticker'): row for row in rows}
+
+
+@metrics.instrument("services.get_stock_indicators")
 def get_stock_indicators(ticker = "AAPL", days=30):
+    bars = get_daily_stock_quotes_arrays(ticker, days=days)
+    if len(bars['close']) == 0:
+        raise Exception(f"Data for {ticker} not found")
+    return market_indicators.compute_stock_indicators(ticker, bars, days=days, period=14)
+
+
+def get_stock_indicators_for_series(ticker, series, days=30):
+    """
+    `get_stock_indicators` for bars already in memory (a `BarSeries`
+    of intraday or daily bars), without touching the database.
+    """
+    start_date, end_date = get_daily_range(days=days)
+    daily = series.to_daily().between(start_date, end_date)
+    if len(daily) == 0:
+        raise Exception(f"Data for {ticker} not found")
+    return market_indicators.compute_stock_indicators(ticker, daily.to_indicator_arrays(), days=days, period=14)
+
+
+@metrics.instrument("services.get_cached_stock_indicators")
+def get_cached_stock_indicators(ticker="AAPL", days=30):
+    """
+    `get_stock_indicators` through the Redis cache. Entries are keyed by
+    ticker, days and the ticker's latest quote version, and go stale as
+    soon as `batch_insert_stock_data` writes new quotes for it.
+    """
+    key, result = market_cache.get_cached(ticker, days)
+    if result is not None:
+        return result
+    result = get_stock_indicators(ticker=ticker, days=days)
+    market_cache.set_cached(key, result)
+    return result
+
+
+async def aget_daily_stock_quotes_arrays(ticker, days=28):
     queryset = get_daily_stock_quotes_queryset(ticker, days=days)
-    if queryset.count() == 0:
+    rows = await aiodb.fetch(queryset.order_by('time').values_list(*market_indicators.BAR_FIELDS))
+    return market_indicators.rows_to_arrays(rows)
+
+
+async def aget_stock_indicators(ticker="AAPL", days=30):
+    bars = await aget_daily_stock_quotes_arrays(ticker, days=days)
+    if len(bars['close']) == 0:
         raise Exception(f"Data for {ticker} not found")
-    averages = get_daily_moving_averages(ticker, days=days, queryset=queryset)
-    price_target = get_price_target(ticker, days=days, queryset=queryset)
-    volume_trend = get_volume_trend(ticker, days=days, queryset=queryset)
-    rsi_data = calculate_rsi(ticker, days=days, period=14)
-    signals = []
-    if averages.get('ma_5') > averages.get('ma_20'):
-        signals.append(1)
-    else:
-        signals.append(-1)
-    if price_target.get('current_price') < price_target.get('conservative_target'):
-        signals.append(1)
-    else:
-        signals.append(-1)
-    if volume_trend.get("volume_change_percent") > 20:
-        signals.append(1)
-    elif volume_trend.get("volume_change_percent") < -20:
-        signals.append(-1)
-    else:
-        signals.append(0)
-    rsi = rsi_data.get('rsi')
-    if rsi > 70:
-        signals.append(-1)  # Overbought
-    elif rsi < 30:
-        signals.append(1) # Oversold
-    else:
-        signals.append(0)
-    return {
-        "score": sum(signals),
-        "ticker": ticker,
-        "indicators": {
-            **averages,
-            **price_target,
-            **volume_trend,
-            **rsi_data,
-        }
-        
-    }
\ No newline at end of file
+    return market_indicators.compute_stock_indicators(ticker, bars, days=days, period=14)
+
+
+async def aget_cached_stock_indicators(ticker="AAPL", days=30):
+    """
+    `get_cached_stock_indicators` for async views: the cache lookups go
+    through `sync_to_async`, the bars through `helpers.aiodb`.
+    """
+    key, result = await sync_to_async(market_cache.get_cached)(ticker, days)
+    if result is not None:
+        return result
+    result = await aget_stock_indicators(ticker=ticker, days=days)
+    await sync_to_async(market_cache.set_cached)(key, result)
+    return result
+
+
+async def ascreen_universe(days=30, limit=None, company_ids=None, period=14):
+    rows = await aiodb.fetch(get_universe_rows_queryset(days=days, company_ids=company_ids))
+    return screen_rows(rows, days=days, limit=limit, period=period)
+
+
+def get_indicator_cache_stats():
+    return market_cache.get_stats()
+
+
+@metrics.instrument("services.screen_universe")
+def screen_universe(days=30, limit=None, company_ids=None, period=14):
+    """
+    Score and indicators for every active company from one query,
+    ranked by score (highest first).
+    """
+    rows = get_universe_rows_queryset(days=days, company_ids=company_ids)
+    return screen_rows(rows.iterator(), days=days, limit=limit, period=period)
+
+
+def get_universe_rows_queryset(days=30, company_ids=None):
+    queryset = get_daily_universe_quotes_queryset(days=days, company_ids=company_ids)
+    return queryset.order_by('company__ticker', 'time').values_list(
+        'company__ticker',
+        *market_indicators.BAR_FIELDS
+    )
+
+
+def screen_rows(rows, days=30, limit=None, period=14):
+    """
+    Ranked indicators from (ticker, *BAR_FIELDS) rows sorted by ticker.
+    """
+    results = []
+    for ticker, ticker_rows in groupby(rows, key=lambda row: row[0]):
+        bars = market_indicators.rows_to_arrays([row[1:] for row in ticker_rows])
+        try:
+            results.append(
+                market_indicators.compute_stock_indicators(ticker, bars, days=days, period=period)
+            )
+        except market_indicators.InsufficientDataError:
+            continue
+        except Exception:
+            logger.exception("Screening %s failed", ticker)
+            continue
+    results.sort(key=lambda x: x['score'], reverse=True)
+    if limit is not None:
+        return results[:limit]
+    return results
+
+
+def get_state_window_bars(state, days=30):
+    """
+    The state's daily bars inside `get_stock_indicators`' `days` window,
+    or None when the window is longer than the kept bars.
+    """
+    if days > market_utils.get_indicator_state_days():
+        return None
+    start_date, _ = get_daily_range(days=days)
+    start_day = start_date.date().isoformat()
+    return [bar for bar in state.daily_bars if bar[0] >= start_day]
+
+
+def compute_state_indicators(state, ticker, days=30, period=14):
+    """
+    `get_stock_indicators` from the state's kept daily bars, or None
+    when the window is longer than them. Runs no queries.
+    """
+    bars = get_state_window_bars(state, days=days)
+    if bars is None:
+        return None
+    if len(bars) == 0:
+        raise market_indicators.InsufficientDataError(f"Data for {ticker} not found")
+    return market_indicators.compute_stock_indicators(
+        ticker, market_indicators.rows_to_arrays(bars), days=days, period=period
+    )
+
+
+@metrics.instrument("services.get_stock_indicators_from_state")
+def get_stock_indicators_from_state(ticker="AAPL", days=30, period=14, state=None):
+    """
+    `get_stock_indicators` from the daily bars kept in the company's
+    IndicatorState, without reading the quotes. Windows longer than the
+    kept bars (`MARKET_INDICATOR_STATE_DAYS`) and companies without a
+    built state fall back to `get_stock_indicators`.
+    """
+    if state is None:
+        state = IndicatorState.objects.filter(company__ticker=ticker).first()
+    result = None
+    if state is not None and len(state.daily_bars) > 0:
+        result = compute_state_indicators(state, ticker, days=days, period=period)
+    if result is None:
+        return get_stock_indicators(ticker=ticker, days=days)
+    return result
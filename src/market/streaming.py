@@ -0,0 +1,377 @@
+"""
+Streaming ingest: trade / quote events to 5 minute bars.
+
+Trades from a stream source are aggregated in memory into one open bar
+per ticker; quotes only move the event time watermark. Completed bars
+are stored in batches with the same insert path as the REST sync, each
+company's IndicatorState is folded forward and the fresh bars and
+indicators are published to Redis.
+
+Streamed bars are provisional: they never overwrite a stored bar, and
+the REST sync of the same interval replaces them with the provider's
+bar (`replace=True` in `market.tasks.sync_company_stock_quotes`).
+
+Events use the Polygon websocket shape:
+
+    {"ev": "T", "sym": "AAPL", "p": 187.2, "s": 100, "t": 1704810600000}
+    {"ev": "Q", "sym": "AAPL", "bp": 187.1, "ap": 187.3, "t": 1704810600000}
+
+    python manage.py ingest_stream --replay trades.jsonl
+"""
+import json
+import logging
+import socket
+import time
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import indicators as market_indicators
+from . import services as market_services
+from .utils import bulk_insert_company_stock_data, refresh_companies_derived_data
+
+logger = logging.getLogger(__name__)
+
+BAR_INTERVAL_MS = 5 * 60 * 1000
+CHANNEL_PREFIX = "market:stream"
+
+
+def parse_event(event):
+    """
+    A Polygon websocket event to (ticker, time_ms, price, size, is_trade),
+    or None for events that are not trades or quotes.
+    """
+    kind = event.get('ev')
+    if kind == 'T':
+        return event['sym'], int(event['t']), float(event['p']), int(event.get('s') or 0), True
+    if kind == 'Q':
+        bid, ask = event.get('bp'), event.get('ap')
+        if not bid or not ask:
+            return None
+        return event['sym'], int(event['t']), (float(bid) + float(ask)) / 2, 0, False
+    return None
+
+
+def parse_line(line):
+    """
+    One line of a replay file or socket: an event or a list of events.
+    """
+    line = line.strip()
+    if not line:
+        return []
+    data = json.loads(line)
+    if isinstance(data, dict):
+        return [data]
+    return data
+
+
+class ReplaySource:
+    """
+    Events from a JSON lines file. With `speed`, the original pacing is
+    replayed (2 = twice as fast); otherwise events come as fast as read.
+    """
+    is_live = False
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+
+    def __iter__(self):
+        first_event_ms = None
+        started = time.monotonic()
+        with open(self.path) as f:
+            for line in f:
+                for event in parse_line(line):
+                    if self.speed and 't' in event:
+                        if first_event_ms is None:
+                            first_event_ms = event['t']
+                        delay = (event['t'] - first_event_ms) / 1000.0 / self.speed - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+                    yield event
+
+
+class SocketSource:
+    """
+    Newline delimited JSON events from a TCP socket (a local stand-in for
+    the provider's websocket). Yields None when idle for `timeout`
+    seconds so the worker can close bars and flush.
+    """
+    is_live = True
+
+    def __init__(self, host="127.0.0.1", port=9009, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __iter__(self):
+        with socket.create_connection((self.host, self.port)) as conn:
+            conn.settimeout(self.timeout)
+            buffer = b""
+            while True:
+                try:
+                    chunk = conn.recv(65536)
+                except socket.timeout:
+                    yield None
+                    continue
+                if not chunk:
+                    break
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    for event in parse_line(line.decode()):
+                        yield event
+
+
+class RedisPublisher:
+    """
+    Publishes JSON messages on `market:stream:<TICKER>`
+    (subscribe to `market:stream:*` for every ticker).
+    """
+
+    def __init__(self, redis_url=None, prefix=CHANNEL_PREFIX):
+        import redis
+        self.client = redis.Redis.from_url(redis_url or settings.REDIS_URL)
+        self.prefix = prefix
+
+    def publish(self, ticker, message):
+        self.client.publish(f"{self.prefix}:{ticker}", json.dumps(message, cls=DjangoJSONEncoder))
+
+
+class BarAggregator:
+    """
+    One open bar per ticker, updated in constant time per trade.
+    Quotes only move the watermark.
+
+    A ticker's bar closes when one of its events falls in a later
+    interval, or when the stream's watermark (latest event time) passes
+    the bar's end plus `grace_ms`, so quiet tickers close too. Events for
+    an interval that was already closed are counted in `late_events`
+    and dropped.
+    """
+
+    def __init__(self, interval_ms=BAR_INTERVAL_MS, grace_ms=2_000):
+        self.interval_ms = interval_ms
+        self.grace_ms = grace_ms
+        # ticker -> [start_ms, open, high, low, close, volume, price x volume, trades]
+        self.bars = {}
+        # start_ms -> tickers with an open bar in that interval
+        self.open_intervals = {}
+        self.completed = []
+        self.watermark = 0
+        self.next_close_ms = None
+        self.late_events = 0
+
+    def add(self, ticker, time_ms, price, size=0, is_trade=True):
+        if not is_trade:
+            if time_ms > self.watermark:
+                self.advance(time_ms)
+            return
+        start = time_ms - time_ms % self.interval_ms
+        bar = self.bars.get(ticker)
+        if bar is not None and bar[0] != start:
+            if start < bar[0]:
+                self.late_events += 1
+                return
+            self.close_bar(ticker)
+            bar = None
+        if bar is None:
+            if start + self.interval_ms + self.grace_ms <= self.watermark:
+                self.late_events += 1
+                return
+            bar = [start, price, price, price, price, 0, 0.0, 0]
+            self.bars[ticker] = bar
+            self.open_intervals.setdefault(start, set()).add(ticker)
+            close_ms = start + self.interval_ms + self.grace_ms
+            if self.next_close_ms is None or close_ms < self.next_close_ms:
+                self.next_close_ms = close_ms
+        if price > bar[2]:
+            bar[2] = price
+        if price < bar[3]:
+            bar[3] = price
+        bar[4] = price
+        bar[5] += size
+        bar[6] += price * size
+        bar[7] += 1
+        if time_ms > self.watermark:
+            self.advance(time_ms)
+
+    def advance(self, watermark):
+        """
+        Move the watermark and close every interval that ended before it.
+        Only runs the scan when an interval is due, so the cost per event
+        stays constant.
+        """
+        self.watermark = max(self.watermark, watermark)
+        if self.next_close_ms is None or self.watermark < self.next_close_ms:
+            return
+        for start in sorted(self.open_intervals.keys()):
+            if start + self.interval_ms + self.grace_ms > self.watermark:
+                break
+            for ticker in list(self.open_intervals[start]):
+                self.close_bar(ticker)
+        self.next_close_ms = None
+        if len(self.open_intervals) > 0:
+            self.next_close_ms = min(self.open_intervals.keys()) + self.interval_ms + self.grace_ms
+
+    def close_bar(self, ticker):
+        bar = self.bars.pop(ticker)
+        tickers = self.open_intervals.get(bar[0])
+        if tickers is not None:
+            tickers.discard(ticker)
+            if len(tickers) == 0:
+                del self.open_intervals[bar[0]]
+        self.completed.append((ticker, bar))
+
+    def close_all(self):
+        for ticker in list(self.bars.keys()):
+            self.close_bar(ticker)
+        self.next_close_ms = None
+
+    def pop_completed(self):
+        completed = self.completed
+        self.completed = []
+        return completed
+
+
+def bar_to_quote(bar):
+    """
+    An aggregated bar to the quote dict `StockQuote(**data)` takes.
+    """
+    start, open_price, high_price, low_price, close_price, volume, price_volume, trades = bar
+    # StockQuote needs a VWAP; only bars of zero size trades lack one
+    return {
+        'open_price': open_price,
+        'close_price': close_price,
+        'high_price': high_price,
+        'low_price': low_price,
+        'number_of_trades': trades,
+        'volume': volume,
+        'volume_weighted_average': round(price_volume / volume, 4) if volume > 0 else close_price,
+        'raw_timestamp': start,
+        'time': datetime.fromtimestamp(start / 1000.0, tz=dt_timezone.utc),
+    }
+
+
+class StreamIngestWorker:
+    """
+    Consume a stream source until it ends (or `max_events`), flushing
+    completed bars every `batch_size` bars or `flush_interval` seconds.
+    A flush stores its bars and refreshes the companies' states in one
+    batch, then publishes indicators computed from the states.
+    """
+
+    def __init__(
+            self,
+            source,
+            aggregator=None,
+            publisher=None,
+            batch_size=500,
+            flush_interval=5.0,
+            indicator_days=30,
+            verbose=False):
+        self.source = source
+        self.aggregator = aggregator or BarAggregator()
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.indicator_days = indicator_days
+        self.verbose = verbose
+        self.companies = self.load_companies()
+        self.last_flush = time.monotonic()
+        # wall clock time the watermark last moved with an event
+        self.watermark_seen_at = None
+        self.stats = {
+            "events": 0,
+            "ignored_events": 0,
+            "bars": 0,
+            "flushes": 0,
+        }
+
+    def load_companies(self):
+        Company = apps.get_model("market", "Company")
+        return {obj.ticker: obj for obj in Company.objects.filter(active=True)}
+
+    def handle_event(self, event):
+        parsed = parse_event(event)
+        if parsed is None or parsed[0] not in self.companies:
+            self.stats["ignored_events"] += 1
+            return
+        self.stats["events"] += 1
+        watermark = self.aggregator.watermark
+        self.aggregator.add(*parsed)
+        if self.aggregator.watermark > watermark:
+            self.watermark_seen_at = time.monotonic()
+
+    def advance_idle(self):
+        """
+        Move the watermark of an idle live source on by the wall clock
+        time since an event last moved it, keeping the event time lag
+        already seen; replayed sources only move with their events.
+        """
+        if not getattr(self.source, "is_live", False) or self.watermark_seen_at is None:
+            return
+        elapsed_ms = int((time.monotonic() - self.watermark_seen_at) * 1000)
+        self.aggregator.advance(self.aggregator.watermark + elapsed_ms)
+        self.watermark_seen_at = time.monotonic()
+
+    def flush_due(self):
+        return (
+            len(self.aggregator.completed) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        completed = self.aggregator.pop_completed()
+        if len(completed) == 0:
+            return 0
+        datasets = {}
+        for ticker, bar in completed:
+            datasets.setdefault(ticker, []).append(bar_to_quote(bar))
+        pairs = [(self.companies[ticker], dataset) for ticker, dataset in datasets.items()]
+        bulk_insert_company_stock_data(pairs, update_state=False, invalidate_cache=False)
+        states = refresh_companies_derived_data(
+            {company_obj: min(data['time'] for data in dataset) for company_obj, dataset in pairs}
+        )
+        if self.publisher is not None:
+            for company_obj, dataset in pairs:
+                self.publish(company_obj.ticker, dataset, states[company_obj.id])
+        self.stats["bars"] += len(completed)
+        self.stats["flushes"] += 1
+        if self.verbose:
+            print("flushed", len(completed), "bars for", len(pairs), "tickers")
+        return len(completed)
+
+    def publish(self, ticker, dataset, state):
+        # from the state's kept bars only, so publishing runs no queries
+        try:
+            indicators = market_services.compute_state_indicators(state, ticker, days=self.indicator_days)
+        except market_indicators.InsufficientDataError:
+            indicators = None
+        except Exception:
+            logger.exception("Indicators for %s failed", ticker)
+            indicators = None
+        self.publisher.publish(ticker, {
+            "ticker": ticker,
+            "bars": dataset,
+            "indicators": indicators,
+        })
+
+    def run(self, max_events=None):
+        for event in self.source:
+            if event is None:
+                self.advance_idle()
+            else:
+                self.handle_event(event)
+            if self.flush_due():
+                self.flush()
+            if max_events is not None and self.stats["events"] >= max_events:
+                break
+        self.aggregator.close_all()
+        self.flush()
+        self.stats["late_events"] = self.aggregator.late_events
+        return self.stats
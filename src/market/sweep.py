@@ -0,0 +1,263 @@
+"""
+Parallel parameter sweep of the backtest thresholds.
+
+Each ticker's daily bars are loaded once and packed into one shared
+memory block that every worker process maps, so only parameter sets
+and small result rows cross process boundaries. Each finished
+combination is appended to a JSON lines file as it arrives; rerunning
+with the same file skips combinations already run over the same
+tickers and date range.
+
+    from market import sweep
+    sweep.run_sweep(
+        ["AAPL", "MSFT"],
+        {"rsi_overbought": [65, 70, 75], "buy_score": [1, 2]},
+        "sweep.jsonl",
+    )
+"""
+import itertools
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields
+from datetime import timedelta
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from django.utils import timezone
+
+from . import backtest as market_backtest
+
+
+SHARED_FIELDS = ('close', 'high', 'low', 'volume')
+
+RANK_METRICS = ('total_return', 'annualized_return', 'max_drawdown', 'hit_rate', 'average_trade_return')
+
+# set in each worker by `init_worker`
+_worker = {}
+
+
+def expand_grid(grid):
+    """
+    {field: [values]} to the list of every `BacktestParams` combination.
+    """
+    names = {field.name for field in fields(market_backtest.BacktestParams)}
+    unknown = set(grid.keys()) - names
+    if unknown:
+        raise Exception(f"Unknown backtest parameters {sorted(unknown)}")
+    keys = sorted(grid.keys())
+    return [
+        market_backtest.BacktestParams(**dict(zip(keys, values)))
+        for values in itertools.product(*[grid[key] for key in keys])
+    ]
+
+
+def get_sweep_scope(tickers, years=10):
+    """
+    The sorted tickers and date range a sweep runs over.
+    """
+    end_date = timezone.now().date()
+    return {
+        "tickers": sorted({f"{ticker}".upper() for ticker in tickers}),
+        "start": (end_date - timedelta(days=365 * years)).isoformat(),
+        "end": end_date.isoformat(),
+    }
+
+
+def get_params_key(params, scope):
+    return json.dumps({"params": params.to_dict(), **scope}, sort_keys=True)
+
+
+def pack_bars(bars_by_ticker):
+    """
+    Copy every ticker's bar arrays into one (fields x days) float64
+    shared memory block. Returns the block and {ticker: (start, stop)}.
+    """
+    index = {}
+    total = 0
+    for ticker, bars in bars_by_ticker.items():
+        index[ticker] = (total, total + len(bars['close']))
+        total += len(bars['close'])
+    shape = (len(SHARED_FIELDS), max(total, 1))
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    packed = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    for ticker, (start, stop) in index.items():
+        for row, name in enumerate(SHARED_FIELDS):
+            packed[row, start:stop] = bars_by_ticker[ticker][name]
+    return shm, shape, index
+
+
+def init_worker(shm_name, shape, index):
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['packed'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker['index'] = index
+
+
+def get_worker_bars(ticker):
+    start, stop = _worker['index'][ticker]
+    packed = _worker['packed']
+    return {name: packed[row, start:stop] for row, name in enumerate(SHARED_FIELDS)}
+
+
+def summarize(params, results):
+    """
+    One row per combination: metrics averaged over the tickers
+    (tickers without trades are left out of the trade metrics).
+    """
+    row = {
+        "params": params.to_dict(),
+        "tickers": len(results),
+        "trades": sum(result['trades'] for result in results),
+    }
+    for metric in RANK_METRICS:
+        values = [result[metric] for result in results if result[metric] is not None]
+        row[metric] = float(np.mean(values)) if len(values) > 0 else None
+    return row
+
+
+def get_worker_indicator_arrays(ticker, params):
+    """
+    Rolling indicators are kept per ticker for the latest indicator
+    parameters; chunks are ordered so threshold-only changes reuse them.
+    """
+    key = (ticker, market_backtest.get_indicator_key(params))
+    cached = _worker.setdefault('indicators', {})
+    if key not in cached:
+        if len(cached) >= len(_worker['index']):
+            cached.clear()
+        cached[key] = market_backtest.compute_indicator_arrays(get_worker_bars(ticker), params=params)
+    return cached[key]
+
+
+def evaluate_chunk(params_list):
+    rows = []
+    for params in params_list:
+        results = [
+            market_backtest.run_backtest(
+                get_worker_bars(ticker),
+                params=params,
+                indicator_arrays=get_worker_indicator_arrays(ticker, params)
+            )
+            for ticker in _worker['index'].keys()
+        ]
+        rows.append(summarize(params, results))
+    return rows
+
+
+def load_sweep_results(path):
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def rank_results(rows, metric="total_return", limit=None):
+    """
+    Rows sorted best first by `metric` (least negative for drawdown).
+    """
+    ranked = sorted(
+        [row for row in rows if row.get(metric) is not None],
+        key=lambda row: row[metric],
+        reverse=True
+    )
+    if limit is not None:
+        ranked = ranked[:limit]
+    return ranked
+
+
+def format_table(rows, metric="total_return", limit=10):
+    ranked = rank_results(rows, metric=metric, limit=limit)
+    if len(ranked) == 0:
+        return ""
+    varying = [
+        key for key in ranked[0]['params'].keys()
+        if len({json.dumps(row['params'][key]) for row in ranked}) > 1
+    ] or list(ranked[0]['params'].keys())
+    header = ["rank", *varying, *RANK_METRICS, "trades"]
+    lines = ["\t".join(header)]
+    for rank, row in enumerate(ranked, start=1):
+        values = [rank, *[row['params'][key] for key in varying]]
+        values += [
+            "" if row[metric_name] is None else f"{row[metric_name]:.4f}"
+            for metric_name in RANK_METRICS
+        ]
+        values.append(row['trades'])
+        lines.append("\t".join(f"{value}" for value in values))
+    return "\n".join(lines)
+
+
+def run_sweep(
+        tickers,
+        grid,
+        output_path,
+        years=10,
+        workers=None,
+        chunk_size=None,
+        metric="total_return",
+        resume=True,
+        verbose=False):
+    """
+    Evaluate every combination of `grid` over `tickers` on a process
+    pool, appending one result row per combination to `output_path`.
+    Returns this sweep's rows in the file, ranked by `metric`.
+    """
+    combinations = expand_grid(grid)
+    scope = get_sweep_scope(tickers, years=years)
+    done = set()
+    if resume:
+        done = {row['key'] for row in load_sweep_results(output_path)}
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+    pending = [params for params in combinations if get_params_key(params, scope) not in done]
+    pending.sort(key=market_backtest.get_indicator_key)
+    if verbose:
+        print(len(combinations), "combinations,", len(pending), "to run")
+    if len(pending) > 0:
+        bars_by_ticker = {}
+        for ticker in tickers:
+            bars = market_backtest.load_daily_bars(ticker, years=years)
+            if len(bars['close']) == 0:
+                raise Exception(f"Data for {ticker} not found")
+            bars_by_ticker[f"{ticker}".upper()] = bars
+        workers = workers or os.cpu_count() or 1
+        if chunk_size is None:
+            # a few chunks per worker keeps them busy until the end
+            chunk_size = max(1, len(pending) // (workers * 4))
+        chunks = [pending[i:i+chunk_size] for i in range(0, len(pending), chunk_size)]
+        shm, shape, index = pack_bars(bars_by_ticker)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(shm.name, shape, index)
+            ) as executor, open(output_path, "a") as f:
+                futures = {executor.submit(evaluate_chunk, chunk): chunk for chunk in chunks}
+                finished = 0
+                for future in as_completed(futures):
+                    for params, row in zip(futures[future], future.result()):
+                        row['key'] = get_params_key(params, scope)
+                        f.write(json.dumps(row) + "\n")
+                    f.flush()
+                    finished += 1
+                    if verbose:
+                        print(f"{finished}/{len(chunks)} chunks done")
+        finally:
+            shm.close()
+            shm.unlink()
+    keys = {get_params_key(params, scope) for params in combinations}
+    rows = [row for row in load_sweep_results(output_path) if row.get('key') in keys]
+    if verbose:
+        print(format_table(rows, metric=metric))
+    return rank_results(rows, metric=metric)
@@ -1,67 +1,403 @@
+from asgiref.sync import async_to_sync, sync_to_async
 from celery import shared_task
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 
 from django.apps import apps 
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 
 import helpers.clients as helper_clients
 
-from .utils import batch_insert_stock_data
+from . import backfill as market_backfill
+from . import locks as market_locks
+from . import policies as market_policies
+from .utils import batch_insert_stock_data, get_latest_quote_time, refresh_company_derived_data, upsert_end_of_day_stock_data
     
 
-@shared_task
-def sync_company_stock_quotes(company_id, days_ago = 32, date_format = "%Y-%m-%d", verbose=False):
-    Company = apps.get_model("market", "Company")
-    try:
-        company_obj = Company.objects.get(id=company_id)
-    except:
-        company_obj = None
-    if company_obj is None:
-        raise Exception(f"Company Id {company_id} invalid")
-    company_ticker = company_obj.ticker
-    if company_ticker is None:
-        raise Exception(f"{company_ticker} invalid")
+def get_sync_overlap_minutes():
+    return getattr(settings, "MARKET_SYNC_OVERLAP_MINUTES", 30)
+
+
+def get_company_watermark(company_obj):
+    """
+    Latest stored quote time for a company (or None).
+    """
+    return get_latest_quote_time(company_obj=company_obj)
+
+
+def get_sync_range(company_obj, days_ago=32, date_format="%Y-%m-%d", use_watermark=True, overlap_minutes=None):
+    """
+    (from_date, to_date) to request for a company: from the stored
+    watermark (minus the overlap) when there is one, else `days_ago`.
+    """
     now = timezone.now()
     start_date = now - timedelta(days=days_ago)
-    to_date = start_date + timedelta(days=days_ago + 1)
-    to_date = to_date.strftime(date_format)
+    to_date = (now + timedelta(days=1)).strftime(date_format)
     from_date = start_date.strftime(date_format)
-    client = helper_clients.PolygonAPIClient(
-        ticker=company_ticker,
-        from_date=from_date,
-        to_date=to_date
-    )
-    dataset = client.get_stock_data()
-    if verbose:
-        print('dataset length', len(dataset))
-    batch_insert_stock_data(dataset=dataset, company_obj=company_obj, verbose=verbose)
-    
-    
+    if use_watermark:
+        watermark = get_company_watermark(company_obj)
+        if watermark is not None:
+            if overlap_minutes is None:
+                overlap_minutes = get_sync_overlap_minutes()
+            start_date = watermark - timedelta(minutes=overlap_minutes)
+            # polygon accepts millisecond timestamps for the range
+            from_date = str(int(start_date.timestamp() * 1000))
+    return from_date, to_date
+
+
+def get_sync_window(days_ago=32, use_watermark=True):
+    """
+    Dedupe key part: all watermark syncs of a company cover the same
+    (latest) window, fixed-window syncs are keyed by their size.
+    """
+    if use_watermark:
+        return "latest"
+    return f"days-{days_ago}"
+
+
+def enqueue_company_sync(company_id, days_ago=32, use_watermark=True, **kwargs):
+    """
+    Queue `sync_company_stock_quotes` unless the same (company, window)
+    sync is already waiting in the queue. Returns True when queued.
+    """
+    window = get_sync_window(days_ago=days_ago, use_watermark=use_watermark)
+    queued_key = market_locks.get_queued_key("company", company_id, window)
+    if not market_locks.mark_queued(queued_key):
+        return False
+    try:
+        sync_company_stock_quotes.delay(company_id, days_ago=days_ago, use_watermark=use_watermark, **kwargs)
+    except Exception:
+        # nothing was queued, so later requests must not be skipped
+        market_locks.clear_queued(queued_key)
+        raise
+    return True
+
+
+@shared_task
+def sync_company_stock_quotes(company_id, days_ago = 32, date_format = "%Y-%m-%d", use_watermark=True, overlap_minutes=None, verbose=False):
+    """
+    Fetch and store quotes for a company. With `use_watermark`, only
+    quotes from the latest stored quote time (minus `overlap_minutes`
+    for late corrections) are requested; `days_ago` is the window used
+    when nothing is stored yet.
+
+    Only one sync per (company, window) runs at a time; a duplicate
+    started meanwhile returns without fetching.
+    """
+    window = get_sync_window(days_ago=days_ago, use_watermark=use_watermark)
+    market_locks.clear_queued(market_locks.get_queued_key("company", company_id, window))
+    with market_locks.lock(market_locks.get_running_key("company", company_id, window)) as acquired:
+        if not acquired:
+            if verbose:
+                print("sync already running for company", company_id, window)
+            return None
+        Company = apps.get_model("market", "Company")
+        try:
+            company_obj = Company.objects.get(id=company_id)
+        except:
+            company_obj = None
+        if company_obj is None:
+            raise Exception(f"Company Id {company_id} invalid")
+        company_ticker = company_obj.ticker
+        if company_ticker is None:
+            raise Exception(f"{company_ticker} invalid")
+        from_date, to_date = get_sync_range(
+            company_obj,
+            days_ago=days_ago,
+            date_format=date_format,
+            use_watermark=use_watermark,
+            overlap_minutes=overlap_minutes
+        )
+        if verbose:
+            print("syncing", company_ticker, from_date, to_date)
+        client = helper_clients.PolygonAPIClient(
+            ticker=company_ticker,
+            from_date=from_date,
+            to_date=to_date
+        )
+        dataset = client.get_stock_data()
+        if verbose:
+            print('dataset length', len(dataset))
+        # provider bars replace streamed ones (see market.streaming)
+        return batch_insert_stock_data(dataset=dataset, company_obj=company_obj, replace=True, verbose=verbose)
+
+
+@shared_task
+def sync_company_batch_stock_quotes(company_ids, days_ago=2, concurrency=8, use_watermark=True, verbose=False):
+    """
+    Sync a batch of companies in one worker slot: downloads run
+    concurrently and each dataset is stored as soon as it arrives.
+    """
+    Company = apps.get_model("market", "Company")
+    window = get_sync_window(days_ago=days_ago, use_watermark=use_watermark)
+    tokens = {}
+    for company_id in company_ids:
+        market_locks.clear_queued(market_locks.get_queued_key("company", company_id, window))
+        # companies with a sync in flight are left to that sync
+        token = market_locks.acquire_lock(market_locks.get_running_key("company", company_id, window))
+        if token is not None:
+            tokens[company_id] = token
+    companies = {obj.ticker: obj for obj in Company.objects.filter(id__in=list(tokens.keys()))}
+    jobs = []
+    for ticker, company_obj in companies.items():
+        from_date, to_date = get_sync_range(company_obj, days_ago=days_ago, use_watermark=use_watermark)
+        jobs.append((ticker, from_date, to_date))
+
+    async def consume():
+        results = {}
+        insert = sync_to_async(batch_insert_stock_data, thread_sensitive=True)
+        async for job, dataset, error in helper_clients.fetch_polygon_jobs(jobs, concurrency=concurrency):
+            ticker = job[0]
+            if error is not None:
+                if verbose:
+                    print(ticker, "failed", error)
+                results[ticker] = None
+                continue
+            if verbose:
+                print(ticker, 'dataset length', len(dataset))
+            results[ticker] = await insert(dataset=dataset, company_obj=companies[ticker], replace=True, verbose=verbose)
+        return results
+
+    try:
+        return async_to_sync(consume)()
+    finally:
+        for company_id, token in tokens.items():
+            market_locks.release_lock(market_locks.get_running_key("company", company_id, window), token)
+
 
 @shared_task
-def sync_stock_data(days_ago=2):
+def sync_company_alpha_vantage_months(company_id, start_month, end_month, interval="5min", concurrency=4, verbose=False):
+    """
+    Backfill a company from Alpha Vantage, one request per "YYYY-MM"
+    month, fetched concurrently and stored as each month arrives.
+    """
     Company = apps.get_model("market", "Company")
-    companies = Company.objects.filter(active=True).values_list('id', flat=True)
-    for company_id in companies:
-        sync_company_stock_quotes.delay(company_id, days_ago=days_ago)
+    company_obj = Company.objects.get(id=company_id)
+
+    async def consume():
+        results = {}
+        insert = sync_to_async(batch_insert_stock_data, thread_sensitive=True)
+        months = helper_clients.fetch_alpha_vantage_months(
+            company_obj.ticker,
+            start_month,
+            end_month,
+            concurrency=concurrency,
+            interval=interval
+        )
+        async for month, dataset, error in months:
+            if error is not None:
+                if verbose:
+                    print(month, "failed", error)
+                results[month] = None
+                continue
+            if verbose:
+                print(month, 'dataset length', len(dataset))
+            results[month] = await insert(dataset=dataset, company_obj=company_obj, verbose=verbose)
+        return results
+
+    return async_to_sync(consume)()
+
+
+@shared_task
+def sync_stock_data(days_ago=2, companies_per_task=None, grouped=False):
+    """
+    Queue a sync for every active company; with `companies_per_task`
+    each task syncs a batch of companies concurrently. Companies whose
+    sync is still queued are skipped, so overlapping beat runs do not
+    pile up duplicates.
+
+    With `grouped`, daily bars of the whole universe are fetched with
+    one request per day instead (see `sync_grouped_daily_stock_data`).
+    """
+    if grouped:
+        return sync_grouped_daily_stock_data.delay(days_ago=days_ago)
+    with market_locks.lock(market_locks.get_running_key("sync_stock_data"), timeout=60) as acquired:
+        if not acquired:
+            return
+        Company = apps.get_model("market", "Company")
+        companies = list(Company.objects.filter(active=True).values_list('id', flat=True))
+        if companies_per_task:
+            window = get_sync_window(days_ago=days_ago)
+            companies = [
+                company_id for company_id in companies
+                if market_locks.mark_queued(market_locks.get_queued_key("company", company_id, window))
+            ]
+            for i in range(0, len(companies), companies_per_task):
+                try:
+                    sync_company_batch_stock_quotes.delay(companies[i:i+companies_per_task], days_ago=days_ago)
+                except Exception:
+                    for company_id in companies[i:]:
+                        market_locks.clear_queued(market_locks.get_queued_key("company", company_id, window))
+                    raise
+            return
+        for company_id in companies:
+            enqueue_company_sync(company_id, days_ago=days_ago)
+
+
+def get_weekdays(start_date, end_date):
+    """
+    Mon-Fri dates from start_date through end_date (holidays
+    are left in; their grouped responses are empty).
+    """
+    days = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+@shared_task
+def sync_grouped_daily_stock_data(days_ago=2, start_date=None, end_date=None, dates_per_batch=20, verbose=False):
+    """
+    Daily bars for every active company with one grouped request per
+    trading day (instead of one request per company), stored in the
+    `EndOfDayStockQuote` table with one bulk upsert per `dates_per_batch`
+    days. Dates are ISO strings; without them the last `days_ago` days
+    are synced.
+    """
+    with market_locks.lock(market_locks.get_running_key("grouped_daily", start_date, end_date, days_ago)) as acquired:
+        if not acquired:
+            return None
+        Company = apps.get_model("market", "Company")
+        today = timezone.now().date()
+        end_date = date.fromisoformat(f"{end_date}") if end_date else today
+        start_date = date.fromisoformat(f"{start_date}") if start_date else end_date - timedelta(days=days_ago)
+        companies = {obj.ticker: obj for obj in Company.objects.filter(active=True)}
+        days = get_weekdays(start_date, end_date)
+        total = 0
+        for i in range(0, len(days), dates_per_batch):
+            datasets = {ticker: [] for ticker in companies.keys()}
+            for day in days[i:i+dates_per_batch]:
+                client = helper_clients.PolygonGroupedDailyClient(date=day.isoformat())
+                bars = client.get_stock_data(tickers=companies)
+                if verbose:
+                    print("grouped daily", day, len(bars), "of", len(companies), "tickers")
+                for ticker, data in bars.items():
+                    datasets[ticker].append(data)
+            total += upsert_end_of_day_stock_data(
+                [(companies[ticker], dataset) for ticker, dataset in datasets.items()]
+            )
+        return total
+
+
+@shared_task
+def sync_company_stock_quotes_window(company_id, from_date, to_date, multiplier=5, timespan="minute", verbose=False):
+    """
+    Fetch (all pages of) one backfill window and record it as done.
+    Dates are ISO strings so the task arguments serialize.
+    """
+    window = f"{from_date}:{to_date}:{multiplier}{timespan}"
+    market_locks.clear_queued(market_locks.get_queued_key("window", company_id, window))
+    try:
+        with market_locks.lock(market_locks.get_running_key("window", company_id, window)) as acquired:
+            if not acquired:
+                return None
+            return sync_window(company_id, from_date, to_date, multiplier=multiplier, timespan=timespan, verbose=verbose)
+    finally:
+        finish_backfill_window(company_id)
+
+
+def finish_backfill_window(company_id):
+    """
+    Windows leave the indicator state alone; the company's last pending
+    window (see `sync_historical_stock_data`) rebuilds it once.
+    """
+    if market_locks.finish_pending(market_locks.get_pending_key("backfill", company_id)) > 0:
+        return None
+    Company = apps.get_model("market", "Company")
+    company_obj = Company.objects.get(id=company_id)
+    return refresh_company_derived_data(company_obj, rebuild_state=True)
+
+
+def sync_window(company_id, from_date, to_date, multiplier=5, timespan="minute", verbose=False):
+    Company = apps.get_model("market", "Company")
+    company_obj = Company.objects.get(id=company_id)
+    from_date = date.fromisoformat(f"{from_date}")
+    to_date = date.fromisoformat(f"{to_date}")
+    client = helper_clients.PolygonAPIClient(
+        ticker=company_obj.ticker,
+        multiplier=multiplier,
+        timespan=timespan,
+        from_date=from_date.isoformat(),
+        to_date=to_date.isoformat()
+    )
+    # windows without trading days (e.g. holidays) come back empty
+    dataset = client.get_stock_data(raise_on_empty=False)
+    if verbose:
+        print(company_obj.ticker, from_date, to_date, 'dataset length', len(dataset))
+    # backfilled bars land before the state's window: rebuilt once at the end
+    batch_insert_stock_data(dataset=dataset, company_obj=company_obj, update_state=False, verbose=verbose)
+    # windows past the raw retention age reach the rollups now or never
+    market_policies.refresh_backfilled_range(
+        connection,
+        datetime.combine(from_date, time.min, tzinfo=dt_timezone.utc),
+        datetime.combine(to_date + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    )
+    market_backfill.mark_window(
+        company_obj,
+        from_date,
+        to_date,
+        rows=len(dataset),
+        multiplier=multiplier,
+        timespan=timespan
+    )
+    return len(dataset)
 
 
 @shared_task
-def sync_historical_stock_data(years_ago=5, company_ids=[], use_celery=True, verbose=False):
+def sync_historical_stock_data(years_ago=5, company_ids=[], use_celery=True, multiplier=5, timespan="minute", verbose=False):
+    """
+    Backfill `years_ago` of quotes in disjoint, row-limit sized windows,
+    skipping windows a previous (possibly interrupted) run completed.
+    Windows older than the raw retention age are rolled up into the
+    hourly / daily aggregates as they land; their raw bars are then
+    dropped by the retention job.
+    """
     Company = apps.get_model("market", "Company")
     qs = Company.objects.filter(active=True)
     if len(company_ids) > 0:
         qs = qs.filter(id__in=company_ids)
-    companies = qs.values_list('id', flat=True)
-    for company_id in companies:
-        days_starting_ago = 30 * 12 * years_ago
-        batch_size = 30
-        for i in range(30, days_starting_ago, batch_size):
+    for company_obj in qs:
+        windows = market_backfill.get_pending_windows(
+            company_obj,
+            years_ago=years_ago,
+            multiplier=multiplier,
+            timespan=timespan
+        )
+        if verbose:
+            print(company_obj.ticker, len(windows), "windows to sync")
+        jobs = []
+        for from_date, to_date in windows:
+            kwargs = {
+                "from_date": from_date.isoformat(),
+                "to_date": to_date.isoformat(),
+                "multiplier": multiplier,
+                "timespan": timespan,
+                "verbose": verbose,
+            }
+            window = f"{kwargs['from_date']}:{kwargs['to_date']}:{multiplier}{timespan}"
+            queued_key = market_locks.get_queued_key("window", company_obj.id, window)
+            if not use_celery or market_locks.mark_queued(queued_key):
+                jobs.append((queued_key, kwargs))
+        if len(jobs) > 0:
+            # the last of these windows to finish rebuilds the indicator state
+            market_locks.add_pending(market_locks.get_pending_key("backfill", company_obj.id), len(jobs))
+        for i, (queued_key, kwargs) in enumerate(jobs):
             if verbose:
-                print("Historical sync days ago", i)
+                print("Historical sync", kwargs["from_date"], kwargs["to_date"])
             if use_celery:
-                sync_company_stock_quotes.delay(company_id, days_ago=i, verbose=verbose)
+                try:
+                    sync_company_stock_quotes_window.delay(company_obj.id, **kwargs)
+                except Exception:
+                    # undo the queued keys and pending count of the windows not sent
+                    for unsent_key, _ in jobs[i:]:
+                        market_locks.clear_queued(unsent_key)
+                        finish_backfill_window(company_obj.id)
+                    raise
             else:
-                sync_company_stock_quotes(company_id, days_ago=i,verbose=verbose)
+                sync_company_stock_quotes_window(company_obj.id, **kwargs)
             if verbose:
-                print(i, "done\n")
\ No newline at end of file
+                print(kwargs["from_date"], kwargs["to_date"], "done\n")
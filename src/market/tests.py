@@ -1,3 +1,749 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
 
-# Create your tests here.
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import numpy as np
+
+from django.db import connection
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from helpers import metrics
+from helpers.bars import BarSeries
+from helpers.clients import _polygon as polygon_client
+
+from market import backfill as market_backfill
+from market import backtest as market_backtest
+from market import indicators as market_indicators
+from market import locks as market_locks
+from market import recommendations as market_recommendations
+from market import policies as market_policies
+from market import services as market_services
+from market import streaming as market_streaming
+from market import sweep as market_sweep
+from market import tasks as market_tasks
+from market import utils as market_utils
+from market.models import Company, IndicatorState, LatestQuote, Recommendation, StockQuote
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# after the day's last bar, so a daily window starting at `now - days`
+# instead of midnight would drop its first day's bars
+NOW = datetime(2024, 3, 1, 21, 10, 30, tzinfo=dt_timezone.utc)
+
+
+def make_quotes(days=60, seed=1, end=NOW):
+    """
+    Three 5 minute bars per weekday for the `days` days before `end`.
+    """
+    rnd = random.Random(seed)
+    price = 100.0
+    quotes = []
+    for offset in range(days, 0, -1):
+        day = (end - timedelta(days=offset)).replace(hour=0, minute=0, second=0)
+        if day.weekday() >= 5:
+            continue
+        for hour, minute in ((14, 30), (15, 0), (20, 55)):
+            open_price = price
+            price = max(1.0, price + rnd.gauss(0, 1.5))
+            quotes.append({
+                'open_price': round(open_price, 4),
+                'close_price': round(price, 4),
+                'high_price': round(max(open_price, price) + 0.25, 4),
+                'low_price': round(min(open_price, price) - 0.25, 4),
+                'number_of_trades': 10,
+                'volume': rnd.randint(1_000, 50_000),
+                'volume_weighted_average': round((open_price + price) / 2, 4),
+                'time': day.replace(hour=hour, minute=minute),
+            })
+    return quotes
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IndicatorStateTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("market.tasks.enqueue_company_sync")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        now_patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+        self.company = Company.objects.create(name="Test", ticker="TEST")
+
+    def insert_by_day(self, quotes):
+        for day_quotes in (quotes[i:i+3] for i in range(0, len(quotes), 3)):
+            market_utils.batch_insert_stock_data(day_quotes, company_obj=self.company, use_copy=False)
+
+    def test_state_indicators_match_full_compute(self):
+        self.insert_by_day(make_quotes(days=90))
+        state = IndicatorState.objects.get(company=self.company)
+        for days in (5, 10, 30, 60):
+            with self.subTest(days=days):
+                with self.assertNumQueries(0):
+                    from_state = market_services.get_stock_indicators_from_state("TEST", days=days, state=state)
+                self.assertEqual(from_state, market_services.get_stock_indicators("TEST", days=days))
+
+    def test_incremental_state_matches_rebuild(self):
+        quotes = make_quotes(days=60)
+        self.insert_by_day(quotes)
+        # a late bar for an earlier day sends the state through a recompute
+        late = dict(quotes[-9], time=quotes[-9]['time'] + timedelta(minutes=5), close_price=123.0)
+        market_utils.batch_insert_stock_data([late], company_obj=self.company, use_copy=False)
+        self.insert_by_day(make_quotes(days=1, seed=2, end=NOW + timedelta(days=1)))
+        incremental = IndicatorState.objects.get(company=self.company)
+        rebuilt = market_utils.update_indicator_state(self.company, rebuild=True)
+        self.assertEqual(incremental.daily_bars, rebuilt.daily_bars)
+
+    @override_settings(MARKET_INDICATOR_STATE_DAYS=30)
+    def test_state_keeps_configured_days(self):
+        self.insert_by_day(make_quotes(days=90))
+        bars = IndicatorState.objects.get(company=self.company).daily_bars
+        newest = datetime.fromisoformat(bars[-1][0])
+        self.assertGreaterEqual(datetime.fromisoformat(bars[0][0]), newest - timedelta(days=30))
+        self.assertLessEqual(datetime.fromisoformat(bars[0][0]), newest - timedelta(days=26))
+
+    @override_settings(MARKET_INDICATOR_STATE_DAYS=30)
+    def test_state_falls_back_past_kept_bars(self):
+        self.insert_by_day(make_quotes(days=90))
+        state = IndicatorState.objects.get(company=self.company)
+        self.assertIsNone(market_services.get_state_window_bars(state, days=60))
+        self.assertEqual(
+            market_services.get_stock_indicators_from_state("TEST", days=60),
+            market_services.get_stock_indicators("TEST", days=60),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IndicatorEngineTests(TestCase):
+    """
+    `get_stock_indicators` (the NumPy engine) against the ORM functions
+    it replaced, on the same stored bars.
+    """
+    # closes with a Wilder RSI (period 2) worked out by hand:
+    # changes +1, -0.5, +1, +0.5; seed gain 0.5, loss 0.25;
+    # gain 0.75 then 0.625, loss 0.125 then 0.0625; RS 10, RSI 100 - 100 / 11
+    rsi_closes = [10.0, 11.0, 10.5, 11.5, 12.0]
+    rsi_expected = 90.9091
+
+    def setUp(self):
+        patcher = mock.patch("market.tasks.enqueue_company_sync")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        now_patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+        self.company = Company.objects.create(name="Test", ticker="TEST")
+
+    def insert(self, quotes):
+        market_utils.batch_insert_stock_data(quotes, company_obj=self.company, use_copy=False)
+
+    def get_rsi_queryset(self, days):
+        # calculate_rsi orders by the time_bucket column, which only
+        # TimescaleDB adds
+        return market_services.get_daily_stock_quotes_queryset("TEST", days=days).annotate(bucket=F('time'))
+
+    def test_engine_matches_orm_functions(self):
+        self.insert(make_quotes(days=60))
+        days = 30
+        indicators = market_services.get_stock_indicators("TEST", days=days)["indicators"]
+        expected = {
+            **market_services.get_daily_moving_averages("TEST", days=days),
+            **market_services.get_price_target("TEST", days=days),
+            **market_services.get_volume_trend("TEST", days=days),
+            **market_services.calculate_rsi("TEST", days=days, queryset=self.get_rsi_queryset(days)),
+        }
+        self.assertEqual(set(indicators.keys()), set(expected.keys()))
+        for name, value in expected.items():
+            with self.subTest(name=name):
+                self.assertAlmostEqual(indicators[name], value, places=3)
+
+    def test_rsi_matches_hand_computed_wilder(self):
+        start = NOW - timedelta(days=len(self.rsi_closes))
+        self.insert([
+            {**make_quotes(days=1)[0], 'close_price': close, 'time': start + timedelta(days=i)}
+            for i, close in enumerate(self.rsi_closes)
+        ])
+        days = len(self.rsi_closes) + 1
+        engine = market_indicators.compute_rsi(
+            market_services.get_daily_stock_quotes_arrays("TEST", days=days)['close'], days=days, period=2
+        )
+        orm = market_services.calculate_rsi("TEST", days=days, queryset=self.get_rsi_queryset(days), period=2)
+        self.assertEqual(engine['rsi'], self.rsi_expected)
+        self.assertAlmostEqual(orm['rsi'], self.rsi_expected, places=3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BackfillPlanTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("market.tasks.enqueue_company_sync")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        now_patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+        self.company = Company.objects.create(name="Test", ticker="TEST")
+
+    def test_skips_windows_already_stored(self):
+        windows = market_backfill.get_pending_windows(self.company, years_ago=2)
+        from_date, to_date = windows[1]
+        end = datetime.combine(to_date, datetime.min.time(), tzinfo=dt_timezone.utc) + timedelta(days=1)
+        quotes = make_quotes(days=(to_date - from_date).days + 1, end=end)
+        market_utils.batch_insert_stock_data(quotes, company_obj=self.company, use_copy=False, update_state=False)
+        pending = market_backfill.get_pending_windows(self.company, years_ago=2)
+        self.assertNotIn(windows[1], pending)
+        self.assertEqual(len(pending), len(windows) - 1)
+
+    def test_keeps_partly_stored_windows(self):
+        windows = market_backfill.get_pending_windows(self.company, years_ago=2)
+        from_date, to_date = windows[1]
+        end = datetime.combine(from_date, datetime.min.time(), tzinfo=dt_timezone.utc) + timedelta(days=60)
+        market_utils.batch_insert_stock_data(make_quotes(days=60, end=end), company_obj=self.company, use_copy=False, update_state=False)
+        self.assertEqual(market_backfill.get_pending_windows(self.company, years_ago=2), windows)
+
+
+class ScreenRowsTests(TestCase):
+    def get_rows(self, ticker, days):
+        return [(ticker, quote['time'], quote['open_price'], quote['high_price'], quote['low_price'], quote['close_price'], quote['volume']) for quote in make_quotes(days=days)[::3]]
+
+    def test_skips_tickers_without_enough_data(self):
+        rows = self.get_rows("AAA", days=60)
+        rows += [(*row[:5], 0.0, row[6]) for row in self.get_rows("BBB", days=60)]
+        with self.assertNoLogs("market.services"):
+            results = market_services.screen_rows(rows, days=30)
+        self.assertEqual([result['ticker'] for result in results], ["AAA"])
+
+    def test_logs_unexpected_errors(self):
+        rows = self.get_rows("AAA", days=60)
+        with mock.patch("market.indicators.compute_stock_indicators", side_effect=ValueError("bad")):
+            with self.assertLogs("market.services", level="ERROR"):
+                self.assertEqual(market_services.screen_rows(rows, days=30), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SyncQueueTests(TestCase):
+    def setUp(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            self.company = Company.objects.create(name="Test", ticker="TEST")
+
+    def test_lock_release_keeps_other_token(self):
+        key = market_locks.get_running_key("test", self.company.id)
+        token = market_locks.acquire_lock(key)
+        market_locks.release_lock(key, "other")
+        self.assertIsNone(market_locks.acquire_lock(key))
+        market_locks.release_lock(key, token)
+        self.assertIsNotNone(market_locks.acquire_lock(key))
+
+    def test_failed_enqueue_clears_queued_key(self):
+        with mock.patch("market.tasks.sync_company_stock_quotes.delay", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                market_tasks.enqueue_company_sync(self.company.id)
+        with mock.patch("market.tasks.sync_company_stock_quotes.delay") as delay:
+            self.assertTrue(market_tasks.enqueue_company_sync(self.company.id))
+        delay.assert_called_once()
+
+    def test_failed_backfill_dispatch_clears_unsent_windows(self):
+        windows = [(date(2024, 1, 1), date(2024, 1, 10)), (date(2024, 1, 11), date(2024, 1, 20))]
+        pending_key = market_locks.get_pending_key("backfill", self.company.id)
+        with mock.patch("market.backfill.get_pending_windows", return_value=windows), \
+                mock.patch("market.tasks.refresh_company_derived_data"):
+            with mock.patch("market.tasks.sync_company_stock_quotes_window.delay", side_effect=[None, ConnectionError]):
+                with self.assertRaises(ConnectionError):
+                    market_tasks.sync_historical_stock_data(company_ids=[self.company.id])
+            self.assertEqual(market_locks.get_cache().get(pending_key), 1)
+            with mock.patch("market.tasks.sync_company_stock_quotes_window.delay") as delay:
+                market_tasks.sync_historical_stock_data(company_ids=[self.company.id])
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(delay.call_args.kwargs["from_date"], "2024-01-11")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LatestQuoteTests(TestCase):
+    def setUp(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            self.company = Company.objects.create(name="Test", ticker="TEST")
+        self.quotes = make_quotes(days=10)
+
+    def insert(self, quotes):
+        market_utils.batch_insert_stock_data(quotes, company_obj=self.company, use_copy=False, update_state=False)
+
+    def test_older_bars_keep_latest_quote(self):
+        self.insert(self.quotes[:-6])
+        self.insert(self.quotes[-3:])
+        latest = LatestQuote.objects.get(company=self.company)
+        self.assertEqual(float(latest.previous_close), self.quotes[-7]['close_price'])
+        self.insert(self.quotes[-6:-3])
+        latest = LatestQuote.objects.get(company=self.company)
+        self.assertEqual(latest.time, self.quotes[-1]['time'])
+        self.assertEqual(float(latest.close_price), self.quotes[-1]['close_price'])
+        self.assertEqual(float(latest.previous_close), self.quotes[-7]['close_price'])
+
+    def test_newest_dataset_wins_within_a_call(self):
+        older = self.quotes[:3]
+        newer = self.quotes[-3:]
+        market_utils.upsert_latest_quotes([(self.company, newer), (self.company, older)])
+        self.assertEqual(LatestQuote.objects.get(company=self.company).time, newer[-1]['time'])
+        self.assertEqual(market_utils.upsert_latest_quotes([(self.company, older)]), 0)
+        self.assertEqual(LatestQuote.objects.get(company=self.company).time, newer[-1]['time'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InsertStatsTests(TestCase):
+    def test_orm_insert_reports_unknown_inserted(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            company_obj = Company.objects.create(name="Test", ticker="TEST")
+        quotes = make_quotes(days=5)
+        with mock.patch("market.utils.metrics.inc") as inc:
+            stats = market_utils.batch_insert_stock_data(quotes, company_obj=company_obj, use_copy=False, update_state=False)
+        self.assertEqual(stats["total"], len(quotes))
+        self.assertIsNone(stats["inserted"])
+        self.assertIsNone(stats["skipped"])
+        inc.assert_any_call("market_insert_rows_total", len(quotes), method="orm", result="attempted")
+
+
+    def test_metrics_follow_the_setting(self):
+        with mock.patch("helpers.metrics.get_store") as get_store:
+            with override_settings(METRICS_ENABLED=False):
+                metrics.inc("market_insert_rows_total", 5, method="orm", result="attempted")
+                metrics.observe("market_insert_seconds", 0.1, method="orm")
+            get_store.assert_not_called()
+            metrics.inc("market_insert_rows_total", 5, method="orm", result="attempted")
+            get_store.assert_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EndOfDayTests(TestCase):
+    def setUp(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            self.companies = [Company.objects.create(name=f"E{i}", ticker=f"E{i}") for i in range(6)]
+
+    def upsert_queries(self, companies, day):
+        datasets = [
+            (company_obj, [{**make_quotes(days=3)[0], 'time': day}])
+            for company_obj in companies
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            market_utils.upsert_end_of_day_stock_data(datasets)
+        return len(queries.captured_queries)
+
+    def test_queries_do_not_grow_with_companies(self):
+        # the first upsert creates the IndicatorState rows
+        self.upsert_queries(self.companies, NOW - timedelta(days=3))
+        few = self.upsert_queries(self.companies[:2], NOW - timedelta(days=2))
+        many = self.upsert_queries(self.companies, NOW - timedelta(days=1))
+        self.assertEqual(few, many)
+
+
+class FailingRecommendationClient(market_recommendations.StubRecommendationClient):
+    """
+    Fails batches holding `fail_ticker`, leaves `drop_ticker` out of answers.
+    """
+
+    def __init__(self, fail_ticker=None, drop_ticker=None):
+        super().__init__()
+        self.fail_ticker = fail_ticker
+        self.drop_ticker = drop_ticker
+
+    def recommend(self, items):
+        if any(item["ticker"] == self.fail_ticker for item in items):
+            self.calls += 1
+            raise Exception("model unavailable")
+        return [answer for answer in super().recommend(items) if answer["ticker"] != self.drop_ticker]
+
+
+class RecommendationTests(TestCase):
+    tickers = ["R0", "R1", "R2", "R3", "R4", "R5", "R6"]
+
+    def setUp(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            for ticker in self.tickers:
+                Company.objects.create(name=ticker, ticker=ticker)
+        patcher = mock.patch(
+            "market.recommendations.market_services.get_cached_stock_indicators",
+            side_effect=self.get_indicators
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_indicators(self, ticker, days=30):
+        score = self.tickers.index(ticker) - 3
+        return {"score": score, "ticker": ticker, "indicators": {"rsi": 50.0 + score, "ma_5": 101.234}}
+
+    def test_batches_by_batch_size(self):
+        client = market_recommendations.StubRecommendationClient()
+        results = market_recommendations.get_recommendations(self.tickers, client=client, batch_size=3)
+        self.assertEqual([result["ticker"] for result in results], self.tickers)
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(sorted(Recommendation.objects.values_list("batch_size", flat=True)), [1, 3, 3, 3, 3, 3, 3])
+        self.assertEqual([result["buy"] for result in results], [False, False, False, False, False, True, True])
+
+    def test_reuses_matching_fingerprints(self):
+        client = market_recommendations.StubRecommendationClient()
+        first = market_recommendations.get_recommendations(self.tickers[:3], client=client)
+        calls = client.calls
+        second = market_recommendations.get_recommendations(self.tickers[:3], client=client)
+        self.assertEqual(client.calls, calls)
+        self.assertTrue(all(result["cached"] for result in second))
+        self.assertEqual(
+            [result["recommendation_id"] for result in second],
+            [result["recommendation_id"] for result in first]
+        )
+        self.assertEqual(set(Recommendation.objects.values_list("hits", flat=True)), {1})
+
+    def test_failed_batch_gets_error_entries(self):
+        client = FailingRecommendationClient(fail_ticker="R1")
+        results = market_recommendations.get_recommendations(self.tickers[:4], client=client, batch_size=2)
+        self.assertEqual([result.get("error") for result in results[:2]], ["model unavailable"] * 2)
+        self.assertTrue(all("error" not in result for result in results[2:]))
+        self.assertEqual(Recommendation.objects.count(), 2)
+
+    def test_missing_answers_and_companies(self):
+        client = FailingRecommendationClient(drop_ticker="R2")
+        results = market_recommendations.get_recommendations(["R1", "R2", "NOPE"], client=client)
+        self.assertNotIn("error", results[0])
+        self.assertEqual(results[1]["error"], "Missing from the model response")
+        self.assertEqual(results[2]["error"], "Company NOPE not found")
+        self.assertEqual(Recommendation.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BarsViewTests(TestCase):
+    def setUp(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            self.company = Company.objects.create(name="Test", ticker="TEST")
+        self.quotes = make_quotes(days=10)
+        market_utils.batch_insert_stock_data(self.quotes, company_obj=self.company, use_copy=False, update_state=False)
+
+    def test_cursor_pages_cover_every_bar_once(self):
+        url = "/market/TEST/bars?from=2024-02-01&to=2024-03-01&limit=7"
+        times = []
+        pages = 0
+        while url is not None:
+            data = self.client.get(url).json()
+            self.assertLessEqual(data["count"], 7)
+            times += [row["time"] for row in data["results"]]
+            pages += 1
+            url = None
+            if data["next_cursor"] is not None:
+                url = f"/market/TEST/bars?from=2024-02-01&to=2024-03-01&limit=7&cursor={data['next_cursor']}"
+        expected = [quote['time'] for quote in self.quotes]
+        self.assertEqual([datetime.fromisoformat(value.replace("Z", "+00:00")) for value in times], expected)
+        self.assertEqual(pages, -(-len(expected) // 7))
+
+
+class ListPublisher:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, ticker, message):
+        self.messages.append((ticker, message))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StreamIngestTests(TestCase):
+    def setUp(self):
+        now_patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            self.companies = [Company.objects.create(name=f"T{i}", ticker=f"T{i}") for i in range(6)]
+
+    def get_worker(self, tickers, start_ms):
+        events = [
+            {"ev": "T", "sym": ticker, "p": 100.0 + i, "s": 10, "t": start_ms + i * 1000}
+            for ticker in tickers
+            for i in range(3)
+        ]
+        return market_streaming.StreamIngestWorker(iter(events), publisher=ListPublisher())
+
+    def flush_queries(self, tickers, start_ms):
+        worker = self.get_worker(tickers, start_ms)
+        for event in worker.source:
+            worker.handle_event(event)
+        worker.aggregator.close_all()
+        with CaptureQueriesContext(connection) as queries:
+            worker.flush()
+        return len(queries.captured_queries), worker.publisher.messages
+
+    def test_flush_queries_do_not_grow_with_tickers(self):
+        day_ms = int((NOW - timedelta(hours=9)).timestamp() * 1000)
+        tickers = [obj.ticker for obj in self.companies]
+        # the first flush creates the LatestQuote and IndicatorState rows
+        self.flush_queries(tickers, day_ms)
+        few, _ = self.flush_queries(tickers[:2], day_ms + market_streaming.BAR_INTERVAL_MS)
+        many, messages = self.flush_queries(tickers, day_ms + 2 * market_streaming.BAR_INTERVAL_MS)
+        self.assertEqual(few, many)
+        self.assertEqual(sorted(ticker for ticker, _ in messages), sorted(tickers))
+        self.assertTrue(all(message["indicators"] is not None for _, message in messages))
+
+    def test_idle_live_source_advances_from_event_time(self):
+        # the start of a 5 minute interval
+        start_ms = int((NOW - timedelta(hours=9, seconds=30)).timestamp() * 1000)
+        worker = market_streaming.StreamIngestWorker(market_streaming.SocketSource())
+        with mock.patch("market.streaming.time.monotonic", side_effect=[100.0, 400.0, 400.0]):
+            worker.handle_event({"ev": "T", "sym": "T0", "p": 10.0, "s": 5, "t": start_ms})
+            worker.advance_idle()
+        self.assertEqual(worker.aggregator.watermark, start_ms + 300_000)
+        self.assertEqual(len(worker.aggregator.completed), 0)
+        with mock.patch("market.streaming.time.monotonic", side_effect=[410.0, 410.0]):
+            worker.advance_idle()
+        self.assertEqual([ticker for ticker, _ in worker.aggregator.completed], ["T0"])
+
+    def test_idle_replay_source_keeps_watermark(self):
+        start_ms = int((NOW - timedelta(hours=9)).timestamp() * 1000)
+        worker = market_streaming.StreamIngestWorker(market_streaming.ReplaySource("unused.jsonl"))
+        worker.handle_event({"ev": "T", "sym": "T0", "p": 10.0, "s": 5, "t": start_ms})
+        worker.advance_idle()
+        self.assertEqual(worker.aggregator.watermark, start_ms)
+
+
+class MigrationRoundTripTests(TransactionTestCase):
+    """
+    Unapply and reapply the rollup and policy migrations (0006 - 0013).
+    Without TimescaleDB they only create and drop the tables; run the
+    suite against the compose database (DATABASE_URL) to execute the
+    continuous aggregate, compression and retention SQL.
+    """
+    before_rollups = [("market", "0005_stockquote_raw_timestamp")]
+    rollup_views = [
+        "market_combineddailystockquote",
+        "market_dailystockquote",
+        "market_hourlystockquote",
+    ]
+
+    def migrate(self, targets=None):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets or executor.loader.graph.leaf_nodes())
+
+    def get_relations(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.table_names(cursor, include_views=True))
+
+    def test_round_trip(self):
+        with mock.patch("market.tasks.enqueue_company_sync"):
+            company_obj = Company.objects.create(name="Apple", ticker="AAPL")
+        StockQuote.objects.bulk_create([StockQuote(company=company_obj, **data) for data in make_quotes(days=60)])
+        timescale = market_policies.has_timescaledb(connection)
+        if timescale:
+            # so unapplying 0010 has chunks to decompress
+            self.assertGreater(market_policies.compress_chunks(connection), 0)
+        self.migrate(self.before_rollups)
+        relations = self.get_relations()
+        self.assertNotIn("market_indicatorstate", relations)
+        self.assertEqual(relations & set(self.rollup_views), set())
+        self.assertEqual(StockQuote.objects.count(), len(make_quotes(days=60)))
+        self.migrate()
+        relations = self.get_relations()
+        self.assertIn("market_indicatorstate", relations)
+        self.assertIn("market_latestquote", relations)
+        if not timescale:
+            return
+        self.assertEqual(relations & set(self.rollup_views), set(self.rollup_views))
+        jobs = {job["proc_name"] for job in market_policies.get_policy_status(connection)["jobs"]}
+        self.assertIn("policy_compression", jobs)
+        self.assertIn("policy_refresh_continuous_aggregate", jobs)
+        if market_policies.get_raw_retention_days():
+            self.assertIn("policy_retention", jobs)
+
+
+class BarAggregatorTests(SimpleTestCase):
+    start_ms = 1_704_810_600_000  # 2024-01-09 14:30 UTC, an interval start
+
+    def test_ticker_closes_on_next_interval(self):
+        aggregator = market_streaming.BarAggregator(grace_ms=0)
+        aggregator.add("AAPL", self.start_ms, 10.0, 100)
+        aggregator.add("AAPL", self.start_ms + 60_000, 12.0, 50)
+        aggregator.add("AAPL", self.start_ms + 120_000, 9.0, 50)
+        self.assertEqual(aggregator.completed, [])
+        aggregator.add("AAPL", self.start_ms + market_streaming.BAR_INTERVAL_MS, 11.0, 10)
+        [(ticker, bar)] = aggregator.pop_completed()
+        self.assertEqual(ticker, "AAPL")
+        self.assertEqual(bar, [self.start_ms, 10.0, 12.0, 9.0, 9.0, 200, 10.0 * 100 + 12.0 * 50 + 9.0 * 50, 3])
+
+    def test_watermark_closes_quiet_tickers(self):
+        aggregator = market_streaming.BarAggregator(grace_ms=2_000)
+        aggregator.add("AAPL", self.start_ms, 10.0, 100)
+        aggregator.add("MSFT", self.start_ms + market_streaming.BAR_INTERVAL_MS, 20.0, 100)
+        # within the grace period AAPL's bar stays open
+        self.assertEqual(aggregator.completed, [])
+        # a quote moves the watermark but never a bar
+        aggregator.add("MSFT", self.start_ms + market_streaming.BAR_INTERVAL_MS + 2_000, 99.0, 0, is_trade=False)
+        self.assertEqual([ticker for ticker, _ in aggregator.pop_completed()], ["AAPL"])
+        self.assertEqual(aggregator.bars["MSFT"][4], 20.0)
+
+    def test_late_events_are_dropped(self):
+        aggregator = market_streaming.BarAggregator(grace_ms=0)
+        aggregator.add("AAPL", self.start_ms + market_streaming.BAR_INTERVAL_MS, 10.0, 100)
+        # an older interval of an open ticker
+        aggregator.add("AAPL", self.start_ms, 11.0, 100)
+        # a new ticker in an interval the watermark already closed
+        aggregator.add("AAPL", self.start_ms + 2 * market_streaming.BAR_INTERVAL_MS, 10.0, 100)
+        aggregator.add("MSFT", self.start_ms, 20.0, 100)
+        self.assertEqual(aggregator.late_events, 2)
+        self.assertNotIn("MSFT", aggregator.bars)
+
+    def test_bar_to_quote_vwap(self):
+        quote = market_streaming.bar_to_quote([self.start_ms, 10.0, 12.0, 9.0, 11.0, 200, 2_100.0, 3])
+        self.assertEqual(quote['volume_weighted_average'], 10.5)
+        self.assertEqual(quote['time'], datetime(2024, 1, 9, 14, 30, tzinfo=dt_timezone.utc))
+        # zero size trades only: the close stands in
+        quote = market_streaming.bar_to_quote([self.start_ms, 10.0, 12.0, 9.0, 11.0, 0, 0.0, 3])
+        self.assertEqual(quote['volume_weighted_average'], 11.0)
+
+
+class BarSeriesTests(SimpleTestCase):
+    def setUp(self):
+        self.dataset = [
+            {
+                **data,
+                'raw_timestamp': int(data['time'].timestamp() * 1000),
+                'number_of_trades': None if i == 1 else data['number_of_trades'],
+            }
+            for i, data in enumerate(make_quotes(days=3))
+        ]
+        self.series = BarSeries.from_dataset(self.dataset)
+
+    def test_slices_are_views(self):
+        view = self.series[1:4]
+        self.assertEqual(len(view), 3)
+        for name, column in view.columns.items():
+            self.assertTrue(np.shares_memory(column, self.series.columns[name]))
+        self.assertEqual(view[0].time, self.dataset[1]['time'])
+        self.assertEqual(self.series[-1].close, self.dataset[-1]['close_price'])
+        with self.assertRaises(IndexError):
+            self.series[len(self.series)]
+
+    def test_dataset_round_trip(self):
+        self.assertEqual(self.series.to_dataset(), self.dataset)
+        self.assertIsNone(self.series[1].trades)
+
+    def test_between_is_inclusive(self):
+        start, end = self.dataset[1]['time'], self.dataset[3]['time']
+        self.assertEqual([bar.time for bar in self.series.between(start, end)], [data['time'] for data in self.dataset[1:4]])
+        self.assertEqual(len(self.series.between(end + timedelta(days=30), end + timedelta(days=31))), 0)
+
+    def test_to_daily(self):
+        daily = self.series.to_daily()
+        self.assertEqual(len(daily), len(self.dataset) // 3)
+        for bar, day in zip(daily, (self.dataset[i:i+3] for i in range(0, len(self.dataset), 3))):
+            volume = sum(data['volume'] for data in day)
+            self.assertEqual(bar.time, day[0]['time'].replace(hour=0, minute=0))
+            self.assertEqual(bar.open, day[0]['open_price'])
+            self.assertEqual(bar.high, max(data['high_price'] for data in day))
+            self.assertEqual(bar.low, min(data['low_price'] for data in day))
+            self.assertEqual(bar.close, day[-1]['close_price'])
+            self.assertEqual(bar.volume, volume)
+            # unknown trade counts add nothing
+            self.assertEqual(bar.trades, sum(data['number_of_trades'] or 0 for data in day))
+            self.assertAlmostEqual(
+                bar.vwap, sum(data['volume_weighted_average'] * data['volume'] for data in day) / volume
+            )
+
+
+class BacktestTests(SimpleTestCase):
+    def test_rolling_scores_match_window_indicators(self):
+        bars = BarSeries.from_dataset(make_quotes(days=120)).to_daily().to_indicator_arrays()
+        params = market_backtest.BacktestParams()
+        window = params.window
+        signal_arrays = market_backtest.compute_signal_arrays(bars, params=params)
+        self.assertFalse(signal_arrays['valid'][:window - 1].any())
+        for end in range(window, len(bars['close']) + 1):
+            window_bars = {name: values[end - window:end] for name, values in bars.items()}
+            expected = market_indicators.compute_stock_indicators("TEST", window_bars, days=window, period=params.rsi_period)
+            with self.subTest(day=end - 1):
+                self.assertEqual(int(signal_arrays['score'][end - 1]), expected['score'])
+                self.assertAlmostEqual(signal_arrays['rsi'][end - 1], expected['indicators']['rsi'], places=3)
+
+    def test_entries_exits_and_drawdown(self):
+        close = np.array([10.0, 10.0, 11.0, 9.9, 10.0, 12.0])
+        score = np.array([0, 2, 0, -2, 0, 3])
+        valid = np.ones(len(close), dtype=bool)
+        # long from the BUY close of day 1 to the SELL close of day 3,
+        # then again from day 5 (still open, marked to the last close)
+        positions = market_backtest.get_positions(score, valid)
+        self.assertEqual(positions.tolist(), [0, 1, 1, 0, 0, 1])
+        result = market_backtest.simulate(close, score, valid)
+        self.assertEqual(result['trades'], 2)
+        self.assertAlmostEqual(result['total_return'], 9.9 / 10.0 - 1)
+        # equity peaks at 1.1 after day 2 and falls to 0.99
+        self.assertAlmostEqual(result['max_drawdown'], 0.99 / 1.1 - 1)
+        self.assertEqual(result['hit_rate'], 0.0)
+        self.assertAlmostEqual(result['exposure'], 0.5)
+
+
+class SweepTests(SimpleTestCase):
+    grid = {"rsi_overbought": [65, 70], "buy_score": [1, 2]}
+
+    def setUp(self):
+        now_patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+        handle, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write_rows(self, tickers, combinations):
+        scope = market_sweep.get_sweep_scope(tickers)
+        with open(self.path, "a") as f:
+            for i, params in enumerate(combinations):
+                f.write(json.dumps({
+                    "key": market_sweep.get_params_key(params, scope),
+                    "params": params.to_dict(),
+                    "total_return": i / 10,
+                }) + "\n")
+
+    def test_expand_grid_rejects_unknown_keys(self):
+        self.assertEqual(len(market_sweep.expand_grid(self.grid)), 4)
+        with self.assertRaises(Exception):
+            market_sweep.expand_grid({"rsi_overbought": [70], "rsi_overbougth": [75]})
+
+    def test_resume_skips_rows_of_the_same_scope(self):
+        combinations = market_sweep.expand_grid(self.grid)
+        self.write_rows(["AAPL", "MSFT"], combinations)
+        # same combinations over other tickers: not done for this sweep
+        self.write_rows(["AAPL"], combinations)
+        with mock.patch("market.backtest.load_daily_bars") as load_daily_bars:
+            rows = market_sweep.run_sweep(["msft", "AAPL"], self.grid, self.path)
+        load_daily_bars.assert_not_called()
+        self.assertEqual(len(rows), 4)
+        with mock.patch("market.backtest.load_daily_bars", side_effect=Exception("loaded")):
+            with self.assertRaisesMessage(Exception, "loaded"):
+                market_sweep.run_sweep(["AAPL", "NVDA"], self.grid, self.path)
+
+    def test_rank_max_drawdown_least_negative_first(self):
+        rows = [
+            {"max_drawdown": -0.3},
+            {"max_drawdown": None},
+            {"max_drawdown": -0.05},
+            {"max_drawdown": -0.12},
+        ]
+        ranked = market_sweep.rank_results(rows, metric="max_drawdown")
+        self.assertEqual([row["max_drawdown"] for row in ranked], [-0.05, -0.12, -0.3])
+        self.assertEqual(len(market_sweep.rank_results(rows, metric="max_drawdown", limit=1)), 1)
+
+
+class PolygonTransformTests(SimpleTestCase):
+    page = [
+        {"t": 1704810600000, "o": 187.15, "h": 187.9, "l": 186.8, "c": 187.6, "v": 52_340, "vw": 187.4012, "n": 812},
+        {"t": 1704810900000, "o": 187.6, "h": 188.05, "l": 187.3, "c": 187.35, "v": 31_008, "vw": 187.7011, "n": 455},
+    ]
+
+    def test_columnar_matches_dicts(self):
+        dataset = [polygon_client.transform_polygon_result(result) for result in self.page]
+        series = BarSeries(polygon_client.transform_polygon_results_columnar(self.page))
+        self.assertEqual(series.to_dataset(), dataset)
+
+    def test_missing_fields_fail_on_both_paths(self):
+        for field in ("vw", "n"):
+            page = [{key: value for key, value in result.items() if key != field} for result in self.page]
+            with self.assertRaises(KeyError):
+                polygon_client.transform_polygon_result(page[0])
+            with self.assertRaises(KeyError):
+                polygon_client.transform_polygon_results_columnar(page)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("indicators", views.universe_indicators_view, name="market-indicators"),
+    path("async/indicators", views.auniverse_indicators_view, name="market-async-indicators"),
+    path("async/<str:ticker>/indicators", views.aindicators_view, name="market-async-ticker-indicators"),
+    path("<str:ticker>/bars", views.bars_view, name="market-bars"),
+    path("<str:ticker>/indicators", views.indicators_view, name="market-ticker-indicators"),
+]
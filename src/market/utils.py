@@ -1,26 +1,707 @@
-from django.apps import apps 
+import time
+
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from helpers import metrics
+from helpers.bars import BarSeries
+
+from . import cache as market_cache
+
+
+COPY_FIELDS = [
+    'open_price',
+    'close_price',
+    'high_price',
+    'low_price',
+    'number_of_trades',
+    'volume',
+    'volume_weighted_average',
+    'raw_timestamp',
+    'time',
+]
 
 
 def batch_insert_stock_data(
-        dataset, 
-        company_obj=None, 
+        dataset,
+        company_obj=None,
         batch_size=1000,
+        use_copy=None,
+        update_state=True,
+        invalidate_cache=True,
+        replace=False,
         verbose=False):
+    """
+    Insert quotes for a company, skipping (company, time) conflicts
+    (with `replace`, stored bars that differ are overwritten).
+    `dataset` is a list of quote dicts, a `BarSeries` or polygon columns.
+    `use_copy` streams rows through PostgreSQL COPY (the default on
+    PostgreSQL); otherwise the ORM `bulk_create` path is used.
+    Returns the insert stats (see `get_insert_stats`).
+    """
+    if company_obj is None:
+        raise Exception(f"Batch failed. Company Object {company_obj} invalid")
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    if isinstance(dataset, BarSeries):
+        dataset = dataset.columns
+    is_columns = isinstance(dataset, dict)
+    if is_columns and not use_copy:
+        dataset = columns_to_dataset(dataset)
+        is_columns = False
+    with transaction.atomic():
+        if is_columns:
+            stats = copy_insert_stock_columns(dataset, company_obj=company_obj, replace=replace, verbose=verbose)
+        elif use_copy:
+            stats = copy_insert_stock_data(dataset, company_obj=company_obj, replace=replace, verbose=verbose)
+        else:
+            stats = orm_insert_company_stock_data(
+                [(company_obj, dataset)], batch_size=batch_size, replace=replace, verbose=verbose
+            )
+        upsert_latest_quotes([(company_obj, dataset)])
+    if stats["total"] > 0:
+        if is_columns:
+            since = datetime.fromtimestamp(int(dataset['time_ms'].min()) / 1000.0, tz=dt_timezone.utc)
+        else:
+            since = min(data['time'] for data in dataset)
+        refresh_company_derived_data(
+            company_obj,
+            since=since,
+            update_state=update_state,
+            invalidate_cache=invalidate_cache
+        )
+    return stats
+
+
+def bulk_insert_company_stock_data(
+        datasets,
+        batch_size=1000,
+        use_copy=None,
+        update_state=True,
+        invalidate_cache=True,
+        replace=False,
+        verbose=False):
+    """
+    Insert quotes for many companies in one batch, skipping
+    (company, time) conflicts (with `replace`, stored bars that differ
+    are overwritten). `datasets` is a list of
+    (company_obj, dataset) pairs where each dataset is a list of quote dicts.
+    Returns the insert stats (see `get_insert_stats`).
+    """
+    datasets = [(company_obj, dataset) for company_obj, dataset in datasets if len(dataset) > 0]
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    with transaction.atomic():
+        if use_copy:
+            stats = copy_insert_company_stock_data(datasets, replace=replace, verbose=verbose)
+        else:
+            stats = orm_insert_company_stock_data(datasets, batch_size=batch_size, replace=replace, verbose=verbose)
+        upsert_latest_quotes(datasets)
+    refresh_companies_derived_data(
+        {company_obj: min(data['time'] for data in dataset) for company_obj, dataset in datasets},
+        update_state=update_state,
+        invalidate_cache=invalidate_cache
+    )
+    return stats
+
+
+END_OF_DAY_FIELDS = [
+    'open_price',
+    'close_price',
+    'high_price',
+    'low_price',
+    'number_of_trades',
+    'volume',
+    'volume_weighted_average',
+    'raw_timestamp',
+]
+
+
+def upsert_end_of_day_stock_data(datasets, batch_size=1000, update_state=True, invalidate_cache=True):
+    """
+    Store provider daily bars ((company_obj, dataset) pairs of quote
+    dicts) in `EndOfDayStockQuote`, one row per company and UTC day;
+    re-sent days replace the stored bar. They stay out of the intraday
+    `StockQuote` table, and so out of the rollups and `LatestQuote`.
+    """
+    EndOfDayStockQuote = apps.get_model('market', 'EndOfDayStockQuote')
+    LatestQuote = apps.get_model('market', 'LatestQuote')
+    datasets = [(company_obj, dataset) for company_obj, dataset in datasets if len(dataset) > 0]
+    start = time.perf_counter()
+    quotes = [
+        EndOfDayStockQuote(
+            company=company_obj,
+            time=data['time'].replace(hour=0, minute=0, second=0, microsecond=0),
+            **{field: data.get(field) for field in END_OF_DAY_FIELDS}
+        )
+        for company_obj, dataset in datasets
+        for data in dataset
+    ]
+    with transaction.atomic():
+        EndOfDayStockQuote.objects.bulk_create(
+            quotes,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['company', 'time'],
+            update_fields=[*END_OF_DAY_FIELDS, 'updated']
+        )
+        # no new bar, but the daily reads changed: move the ETags on
+        LatestQuote.objects.filter(
+            company_id__in=[company_obj.id for company_obj, _ in datasets]
+        ).update(updated=timezone.now())
+    record_insert_metrics("end_of_day", time.perf_counter() - start, attempted=len(quotes))
+    refresh_companies_derived_data(
+        {company_obj: min(data['time'] for data in dataset) for company_obj, dataset in datasets},
+        update_state=update_state,
+        invalidate_cache=invalidate_cache
+    )
+    return len(quotes)
+
+
+def refresh_company_derived_data(company_obj, since=None, update_state=True, invalidate_cache=True, rebuild_state=False):
+    """
+    After an insert: fold the new bars into the indicator state (or
+    rebuild it with `rebuild_state`) and invalidate the company's cached
+    indicators. Returns the state (None without `update_state`).
+    """
+    return refresh_companies_derived_data(
+        {company_obj: since},
+        update_state=update_state,
+        invalidate_cache=invalidate_cache,
+        rebuild_state=rebuild_state
+    ).get(company_obj.id)
+
+
+def refresh_companies_derived_data(since_by_company, update_state=True, invalidate_cache=True, rebuild_state=False):
+    """
+    `refresh_company_derived_data` for many companies ({company_obj: since})
+    in one batch of state updates and one cache marker write.
+    Returns {company_id: state} (empty without `update_state`).
+    """
+    states = {}
+    if len(since_by_company) == 0:
+        return states
+    if update_state:
+        states = update_indicator_states(since_by_company, rebuild=rebuild_state)
+    if invalidate_cache:
+        market_cache.bump_indicator_caches({
+            company_obj.ticker: states[company_obj.id].last_bar_time if company_obj.id in states else None
+            for company_obj in since_by_company.keys()
+        })
+    return states
+
+
+LATEST_QUOTE_FIELDS = [
+    'open_price',
+    'close_price',
+    'high_price',
+    'low_price',
+    'number_of_trades',
+    'volume',
+    'volume_weighted_average',
+]
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def get_latest_bars(dataset):
+    """
+    (newest quote dict, close of the newest bar on an earlier UTC day)
+    in a list of quote dicts or polygon columns; (None, None) when empty.
+    """
+    if isinstance(dataset, dict):
+        time_ms = dataset['time_ms']
+        if len(time_ms) == 0:
+            return None, None
+        i = int(time_ms.argmax())
+        day_start_ms = int(time_ms[i]) - int(time_ms[i]) % DAY_MS
+        earlier = (time_ms < day_start_ms).nonzero()[0]
+        previous_close = None
+        if len(earlier) > 0:
+            previous_close = float(dataset['close'][earlier[time_ms[earlier].argmax()]])
+        latest = columns_to_dataset({key: values[i:i+1] for key, values in dataset.items()})[0]
+        return latest, previous_close
+    if len(dataset) == 0:
+        return None, None
+    latest = max(dataset, key=lambda data: data['time'])
+    day = latest['time'].date()
+    previous = None
+    for data in dataset:
+        if data['time'].date() < day and (previous is None or data['time'] > previous['time']):
+            previous = data
+    return latest, None if previous is None else previous['close_price']
+
+
+def upsert_latest_quotes(datasets):
+    """
+    Move each company's LatestQuote forward to the newest bar of its
+    (company_obj, dataset) pair, in one statement. Datasets older than
+    the stored bar (backfills) leave it alone; the statement itself
+    checks the stored time, so concurrent writers can't move it back.
+    Call inside the insert's transaction.
+    """
+    Company = apps.get_model('market', 'Company')
+    LatestQuote = apps.get_model('market', 'LatestQuote')
+    StockQuote = apps.get_model('market', 'StockQuote')
+    candidates = {}
+    for company_obj, dataset in datasets:
+        latest, previous_close = get_latest_bars(dataset)
+        if latest is None:
+            continue
+        current = candidates.get(company_obj.id)
+        if current is not None and current[0]['time'] >= latest['time']:
+            continue
+        candidates[company_obj.id] = (latest, previous_close)
+    if len(candidates) == 0:
+        return 0
+    stored = LatestQuote.objects.in_bulk(list(candidates.keys()))
+    now = timezone.now()
+    previous_closes = {}
+    missing = {}
+    for company_id, (latest, previous_close) in list(candidates.items()):
+        obj = stored.get(company_id)
+        if obj is not None and latest['time'] < obj.time:
+            del candidates[company_id]
+            continue
+        day = latest['time'].date()
+        if previous_close is None and obj is not None:
+            previous_close = obj.close_price if obj.time.date() < day else obj.previous_close
+        if previous_close is None:
+            missing.setdefault(day, []).append(company_id)
+        previous_closes[company_id] = previous_close
+    for day, company_ids in missing.items():
+        # one query per day for the companies without a known previous close
+        day_start = datetime.combine(day, datetime.min.time(), tzinfo=dt_timezone.utc)
+        previous_closes.update(
+            Company.objects.filter(id__in=company_ids).annotate(previous_close=Subquery(
+                StockQuote.objects.filter(company=OuterRef('pk'), time__lt=day_start)
+                .order_by('-time')
+                .values('close_price')[:1]
+            )).values_list('id', 'previous_close')
+        )
+    rows = []
+    for company_id, (latest, _) in candidates.items():
+        previous_close = previous_closes[company_id]
+        change = None
+        change_percent = None
+        if previous_close:
+            change = round(float(latest['close_price']) - float(previous_close), 4)
+            change_percent = change / float(previous_close) * 100
+        rows.append(LatestQuote(
+            company_id=company_id,
+            time=latest['time'],
+            previous_close=previous_close,
+            change=change,
+            change_percent=change_percent,
+            updated=now,
+            **{field: latest.get(field) for field in LATEST_QUOTE_FIELDS}
+        ))
+    return insert_latest_quote_rows(rows)
+
+
+def insert_latest_quote_rows(rows, batch_size=500):
+    """
+    INSERT ... ON CONFLICT (company_id) DO UPDATE of LatestQuote
+    objects, skipping the update where the stored bar is newer.
+    Returns the number of rows written.
+    """
+    LatestQuote = apps.get_model('market', 'LatestQuote')
+    table = LatestQuote._meta.db_table
+    quote_name = connection.ops.quote_name
+    fields = [LatestQuote._meta.get_field(name) for name in [
+        'company', *LATEST_QUOTE_FIELDS, 'time', 'previous_close', 'change', 'change_percent', 'updated'
+    ]]
+    columns = ", ".join(quote_name(field.column) for field in fields)
+    updates = ", ".join(
+        f"{quote_name(field.column)} = EXCLUDED.{quote_name(field.column)}"
+        for field in fields if field.name != 'company'
+    )
+    placeholders = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    written = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i+batch_size]
+            params = [
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for obj in batch
+                for field in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({quote_name('company_id')}) DO UPDATE SET {updates} "
+                f"WHERE {table}.{quote_name('time')} <= EXCLUDED.{quote_name('time')}",
+                params
+            )
+            written += cursor.rowcount
+    return written
+
+
+def rebuild_latest_quotes(companies=None):
+    """
+    Recreate LatestQuote rows from the stored quotes
+    (every company by default).
+    """
+    Company = apps.get_model('market', 'Company')
+    StockQuote = apps.get_model('market', 'StockQuote')
+    if companies is None:
+        companies = Company.objects.all()
+    datasets = []
+    for company_obj in companies:
+        latest = (
+            StockQuote.objects.filter(company=company_obj)
+            .order_by('-time')
+            .values(*LATEST_QUOTE_FIELDS, 'time')
+            .first()
+        )
+        if latest is not None:
+            datasets.append((company_obj, [latest]))
+    with transaction.atomic():
+        return upsert_latest_quotes(datasets)
+
+
+def get_latest_quote_time(company_obj=None, ticker=None):
+    """
+    A company's latest stored quote time (or None), from its LatestQuote
+    row, falling back to the quotes for rows written around it.
+    """
+    LatestQuote = apps.get_model('market', 'LatestQuote')
+    StockQuote = apps.get_model('market', 'StockQuote')
+    filters = {"company": company_obj} if company_obj is not None else {"company__ticker": ticker}
+    latest_time = LatestQuote.objects.filter(**filters).values_list('time', flat=True).first()
+    if latest_time is None:
+        latest_time = StockQuote.objects.filter(**filters).order_by('-time').values_list('time', flat=True).first()
+    return latest_time
+
+
+def get_insert_stats(total, inserted, seconds):
+    """
+    {"total", "inserted", "skipped", "seconds", "rows_per_second"}
+    of one insert; skipped rows hit an existing (company, time) and were
+    left as stored, replaced ones count as inserted. `inserted` (and so
+    `skipped`) is None when the insert can't tell.
+    """
+    return {
+        "total": total,
+        "inserted": inserted,
+        "skipped": total - inserted if inserted is not None else None,
+        "seconds": seconds,
+        "rows_per_second": total / seconds if seconds > 0 else 0.0,
+    }
+
+
+def record_insert_metrics(method, seconds, stats=None, attempted=0):
+    """
+    Insert time and row counts: inserted vs skipped when the insert
+    knows them, otherwise what was attempted.
+    """
+    metrics.observe("market_insert_seconds", seconds, method=method)
+    if stats is not None and stats["inserted"] is None:
+        attempted = stats["total"]
+        stats = None
+    if stats is not None:
+        metrics.inc("market_insert_rows_total", stats["inserted"], method=method, result="inserted")
+        metrics.inc("market_insert_rows_total", stats["skipped"], method=method, result="skipped")
+    else:
+        metrics.inc("market_insert_rows_total", attempted, method=method, result="attempted")
+
+
+def orm_insert_company_stock_data(datasets, batch_size=1000, replace=False, verbose=False):
+    """
+    `bulk_create(ignore_conflicts=True)` of (company_obj, dataset) pairs
+    (`update_conflicts` with `replace`). bulk_create doesn't report which
+    rows it wrote, so `inserted` is None.
+    """
     StockQuote = apps.get_model('market', 'StockQuote')
-    batch_size = 1000
+    quotes = [
+        StockQuote(company=company_obj, **data)
+        for company_obj, dataset in datasets
+        for data in dataset
+    ]
+    if len(quotes) == 0:
+        return get_insert_stats(0, 0, 0.0)
+    start = time.perf_counter()
+    with transaction.atomic():
+        for i in range(0, len(quotes), batch_size):
+            if verbose:
+                print("Doing chunk", i)
+            if replace:
+                StockQuote.objects.bulk_create(
+                    quotes[i:i+batch_size],
+                    update_conflicts=True,
+                    unique_fields=['company', 'time'],
+                    update_fields=[field for field in COPY_FIELDS if field != 'time']
+                )
+            else:
+                StockQuote.objects.bulk_create(quotes[i:i+batch_size], ignore_conflicts=True)
+    stats = get_insert_stats(len(quotes), None, time.perf_counter() - start)
+    record_insert_metrics("orm", stats["seconds"], stats=stats)
+    if verbose:
+        print("orm insert", stats)
+    return stats
+
+
+def get_quote_conflict_sql(table, replace=False):
+    """
+    ON CONFLICT clause of the quote merges: keep stored (company, time)
+    bars, or with `replace` overwrite the ones whose values differ.
+    """
+    if not replace:
+        return "ON CONFLICT (company_id, time) DO NOTHING"
+    fields = [field for field in COPY_FIELDS if field != 'time']
+    updates = ", ".join(f"{field} = EXCLUDED.{field}" for field in fields)
+    stored = ", ".join(f"{table}.{field}" for field in fields)
+    excluded = ", ".join(f"EXCLUDED.{field}" for field in fields)
+    return (
+        f"ON CONFLICT (company_id, time) DO UPDATE SET {updates} "
+        f"WHERE ({stored}) IS DISTINCT FROM ({excluded})"
+    )
+
+
+def copy_insert_stock_data(dataset, company_obj=None, replace=False, verbose=False):
+    """
+    Stream rows into a temporary staging table with COPY and merge them
+    into the hypertable with ON CONFLICT (company_id, time) DO NOTHING
+    (or DO UPDATE with `replace`). PostgreSQL (psycopg 3) only.
+    """
     if company_obj is None:
         raise Exception(f"Batch failed. Company Object {company_obj} invalid")
-    for i in range(0, len(dataset), batch_size):
-        if verbose:
-            print("Doing chunk", i)
-        batch_chunk = dataset[i:i+batch_size]
-        chunked_quotes = []
-        for data in batch_chunk:
-            chunked_quotes.append(
-                StockQuote(company=company_obj, **data)
-            )
-        StockQuote.objects.bulk_create(chunked_quotes, ignore_conflicts=True)
-        if verbose:
-            print("finished chunk", i)
-    return len(dataset)
-    
\ No newline at end of file
+    return copy_insert_company_stock_data([(company_obj, dataset)], replace=replace, verbose=verbose)
+
+
+def copy_insert_company_stock_data(datasets, replace=False, verbose=False):
+    """
+    `copy_insert_stock_data` for many (company_obj, dataset) pairs
+    in a single COPY and merge.
+    """
+    StockQuote = apps.get_model('market', 'StockQuote')
+    table = StockQuote._meta.db_table
+    columns = ", ".join(["company_id", *COPY_FIELDS])
+    total = sum(len(dataset) for _, dataset in datasets)
+    start = time.perf_counter()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE market_stockquote_staging ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            with cursor.copy(f"COPY market_stockquote_staging ({columns}) FROM STDIN") as copy:
+                for company_obj, dataset in datasets:
+                    for data in dataset:
+                        copy.write_row([company_obj.id, *[data.get(field) for field in COPY_FIELDS]])
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {columns} FROM market_stockquote_staging "
+                f"{get_quote_conflict_sql(table, replace=replace)}"
+            )
+            inserted = cursor.rowcount
+            # ON COMMIT DROP only fires at the outermost commit
+            cursor.execute("DROP TABLE market_stockquote_staging")
+    stats = get_insert_stats(total, inserted, time.perf_counter() - start)
+    record_insert_metrics("copy", stats["seconds"], stats=stats)
+    if verbose:
+        print("copy insert", stats)
+    return stats
+
+
+def copy_insert_stock_columns(columns, company_obj=None, replace=False, verbose=False):
+    """
+    COPY typed polygon columns (see
+    `helpers.clients.transform_polygon_results_columnar`) into a staging
+    table and merge them into the hypertable. Epoch milliseconds are
+    converted to timestamps by the database, so no Python datetimes
+    are built. PostgreSQL (psycopg 3) only.
+    """
+    StockQuote = apps.get_model('market', 'StockQuote')
+    if company_obj is None:
+        raise Exception(f"Batch failed. Company Object {company_obj} invalid")
+    table = StockQuote._meta.db_table
+    columns_sql = ", ".join(["company_id", *COPY_FIELDS])
+    total = len(columns['time_ms'])
+    start = time.perf_counter()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE market_stockquote_columns_staging ("
+                "time_ms bigint, open numeric, high numeric, low numeric, close numeric, "
+                "vwap numeric, volume bigint, trades bigint"
+                ") ON COMMIT DROP"
+            )
+            rows = zip(
+                columns['time_ms'].tolist(),
+                columns['open'].tolist(),
+                columns['high'].tolist(),
+                columns['low'].tolist(),
+                columns['close'].tolist(),
+                columns['vwap'].tolist(),
+                columns['volume'].tolist(),
+                columns['trades'].tolist(),
+            )
+            with cursor.copy(
+                "COPY market_stockquote_columns_staging "
+                "(time_ms, open, high, low, close, vwap, volume, trades) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            cursor.execute(
+                f"INSERT INTO {table} ({columns_sql}) "
+                f"SELECT %s, open, close, high, low, NULLIF(trades, -1), volume, vwap, "
+                f"time_ms::text, to_timestamp(time_ms / 1000.0) "
+                f"FROM market_stockquote_columns_staging "
+                f"{get_quote_conflict_sql(table, replace=replace)}",
+                [company_obj.id]
+            )
+            inserted = cursor.rowcount
+            # ON COMMIT DROP only fires at the outermost commit
+            cursor.execute("DROP TABLE market_stockquote_columns_staging")
+    stats = get_insert_stats(total, inserted, time.perf_counter() - start)
+    record_insert_metrics("copy_columns", stats["seconds"], stats=stats)
+    if verbose:
+        print("copy insert columns", stats)
+    return stats
+
+
+def columns_to_dataset(columns):
+    """
+    Polygon columns back to the list of dicts `StockQuote(**data)` takes.
+    """
+    dataset = []
+    for time_ms, open_price, high_price, low_price, close_price, vwap, volume, trades in zip(
+        columns['time_ms'].tolist(),
+        columns['open'].tolist(),
+        columns['high'].tolist(),
+        columns['low'].tolist(),
+        columns['close'].tolist(),
+        columns['vwap'].tolist(),
+        columns['volume'].tolist(),
+        columns['trades'].tolist(),
+    ):
+        dataset.append({
+            'open_price': open_price,
+            'close_price': close_price,
+            'high_price': high_price,
+            'low_price': low_price,
+            'number_of_trades': None if trades < 0 else trades,
+            'volume': volume,
+            'volume_weighted_average': vwap,
+            'raw_timestamp': time_ms,
+            'time': datetime.fromtimestamp(time_ms / 1000.0, tz=dt_timezone.utc),
+        })
+    return dataset
+
+
+def get_indicator_state_days():
+    """
+    Calendar days of daily bars kept in an IndicatorState; windows up
+    to this many days are served without reading the quotes.
+    """
+    return getattr(settings, "MARKET_INDICATOR_STATE_DAYS", 365)
+
+
+def reset_indicator_state(state):
+    state.last_bar_time = None
+    state.daily_bars = []
+    return state
+
+
+def fold_daily_bar(state, bar, keep_days=None):
+    """
+    Fold one daily bar [date, open, high, low, close, volume] into the state.
+    A bar for the same date as the last one replaces it (in progress day);
+    bars older than `keep_days` before the newest one are dropped.
+    """
+    bars = state.daily_bars
+    if len(bars) > 0 and bars[-1][0] == bar[0]:
+        bars[-1] = bar
+        return state
+    bars.append(bar)
+    if keep_days is None:
+        keep_days = get_indicator_state_days()
+    oldest = (date.fromisoformat(bar[0]) - timedelta(days=keep_days)).isoformat()
+    if bars[0][0] < oldest:
+        state.daily_bars = [kept for kept in bars if kept[0] >= oldest]
+    return state
+
+
+def update_indicator_state(company_obj, since=None, rebuild=False, verbose=False):
+    """
+    Fold daily bars newer than the state's in progress day into the
+    company's IndicatorState. Bars landing before that day
+    (late or revised data) or `rebuild` trigger a full recompute;
+    backfills skip the state per window and rebuild it once at the end
+    (see `market.tasks.finish_backfill_window`).
+    """
+    return update_indicator_states({company_obj: since}, rebuild=rebuild, verbose=verbose)[company_obj.id]
+
+
+def update_indicator_states(since_by_company, rebuild=False, verbose=False):
+    """
+    `update_indicator_state` for many companies ({company_obj: since})
+    with one locked state read, one daily bar query and one
+    `bulk_update`. Returns {company_id: state}.
+    """
+    from market import services as market_services
+    IndicatorState = apps.get_model('market', 'IndicatorState')
+    LatestQuote = apps.get_model('market', 'LatestQuote')
+    StockQuote = apps.get_model('market', 'StockQuote')
+    company_ids = sorted({company_obj.id for company_obj in since_by_company.keys()})
+    if len(company_ids) == 0:
+        return {}
+    with transaction.atomic():
+        IndicatorState.objects.bulk_create(
+            [IndicatorState(company_id=company_id) for company_id in company_ids],
+            ignore_conflicts=True
+        )
+        # locked in company order, so concurrent batches can't deadlock
+        states = {
+            state.company_id: state
+            for state in IndicatorState.objects.select_for_update().filter(company_id__in=company_ids).order_by('company_id')
+        }
+        bar_filter = Q()
+        for company_obj, since in since_by_company.items():
+            state = states[company_obj.id]
+            start_date = None
+            if len(state.daily_bars) > 0:
+                start_date = state.daily_bars[-1][0]
+                if rebuild or (since is not None and since.date().isoformat() < start_date):
+                    if verbose:
+                        print(company_obj.ticker, "late bar before", start_date, "recomputing state")
+                    reset_indicator_state(state)
+                    start_date = None
+            if start_date is None:
+                bar_filter |= Q(company_id=company_obj.id)
+            else:
+                bar_filter |= Q(company_id=company_obj.id, time__date__gte=start_date)
+        rows = market_services.get_daily_quotes_queryset().filter(bar_filter).order_by('company_id', 'time').values_list(
+            'company_id', 'time', 'open_price', 'high_price', 'low_price', 'close_price', 'volume'
+        )
+        keep_days = get_indicator_state_days()
+        for company_id, bar_time, open_price, high_price, low_price, close_price, volume in rows.iterator():
+            fold_daily_bar(states[company_id], [
+                bar_time.date().isoformat(),
+                float(open_price),
+                float(high_price),
+                float(low_price),
+                float(close_price),
+                int(volume),
+            ], keep_days=keep_days)
+        latest_times = dict(LatestQuote.objects.filter(company_id__in=company_ids).values_list('company_id', 'time'))
+        missing_ids = [company_id for company_id in company_ids if company_id not in latest_times]
+        if len(missing_ids) > 0:
+            # quotes written without a LatestQuote row
+            latest_times.update(
+                StockQuote.objects.filter(company_id__in=missing_ids)
+                .values('company_id')
+                .annotate(latest_time=Max('time'))
+                .values_list('company_id', 'latest_time')
+            )
+        now = timezone.now()
+        for company_id, state in states.items():
+            state.last_bar_time = latest_times.get(company_id)
+            state.updated = now
+        IndicatorState.objects.bulk_update(list(states.values()), ['daily_bars', 'last_bar_time', 'updated'])
+    return states
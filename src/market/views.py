@@ -1,3 +1,391 @@
-from django.shortcuts import render
+"""
+Read API for bars and indicators.
 
-# Create your views here.
+    GET /market/<ticker>/bars?from=2024-01-01&to=2024-02-01&interval=5m&limit=1000
+    GET /market/<ticker>/bars?interval=1d&format=ndjson   (or csv, arrow)
+    GET /market/<ticker>/indicators?days=30
+    GET /market/indicators?days=30&limit=100
+    GET /market/indicators?days=30&tickers=AAPL,MSFT,NVDA
+    GET /market/async/<ticker>/indicators, /market/async/indicators
+
+JSON responses are pages: `next_cursor` (a (company, time) keyset,
+never an OFFSET) is passed back as `cursor` for the next page.
+`ndjson` / `csv` / `arrow` stream the whole range in keyset chunks.
+Every response carries an ETag made from the latest quote time, so
+polling clients sending If-None-Match get a 304 until new bars land.
+
+The `async/` indicator views do the same work with `helpers.aiodb`, so
+on an ASGI worker (`uvicorn cfehome.asgi:application`) concurrent
+requests, and the tickers of one request, run their queries at once
+instead of each holding a thread.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.db.models import Max, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition, require_GET
+
+from helpers import aiodb
+
+from . import exports
+from . import services as market_services
+from .models import Company, HourlyStockQuote, LatestQuote, StockQuote
+
+
+INTERVALS = ["5m", "1h", "1d"]
+DEFAULT_RANGE_DAYS = 30
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10_000
+STREAM_CHUNK_SIZE = 5_000
+DEFAULT_UNIVERSE_LIMIT = 100
+MAX_UNIVERSE_LIMIT = 500
+MAX_TICKERS = 50
+
+BAR_FIELDS = ['time', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'volume_weighted_average', 'number_of_trades']
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error_response(message, status=400):
+    return JsonResponse({"detail": message}, status=status)
+
+
+def encode_cursor(company_id, bar_time=None):
+    data = [company_id, None if bar_time is None else bar_time.isoformat()]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        company_id, bar_time = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(company_id), None if bar_time is None else datetime.fromisoformat(bar_time)
+    except Exception:
+        raise BadRequest("Invalid cursor")
+
+
+def parse_time_param(value, end_of_day=False):
+    """
+    An ISO datetime or date (UTC); a bare `to` date includes that day.
+    """
+    try:
+        parsed = parse_datetime(value)
+        day = parse_date(value) if parsed is None else None
+    except ValueError:
+        raise BadRequest(f"Invalid date {value}")
+    if parsed is None:
+        if day is None:
+            raise BadRequest(f"Invalid date {value}")
+        parsed = datetime.combine(day, dt_time.max if end_of_day else dt_time.min)
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def get_int_param(request, name, default, maximum=None):
+    value = request.GET.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if value < 1:
+        raise BadRequest(f"{name} must be positive")
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+def get_bars_queryset(company_obj, interval):
+    if interval == "5m":
+        return StockQuote.objects.filter(company=company_obj)
+    if interval == "1h":
+        if not market_services.use_daily_aggregate():
+            raise BadRequest("interval 1h needs the TimescaleDB hourly aggregate")
+        return HourlyStockQuote.objects.filter(company=company_obj)
+    return market_services.get_daily_quotes_queryset(company_id=company_obj.id)
+
+
+def keyset_filter(queryset, cursor):
+    """
+    Rows after the (company, time) cursor, in (company, time) order.
+    """
+    if cursor is None:
+        return queryset
+    company_id, bar_time = cursor
+    return queryset.filter(Q(company_id__gt=company_id) | Q(company_id=company_id, time__gt=bar_time))
+
+
+def read_bars(queryset, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    One keyset page of (company_id, *BAR_FIELDS) rows.
+    """
+    qs = keyset_filter(queryset, cursor).order_by('company_id', 'time')
+    return list(qs.values_list('company_id', *BAR_FIELDS)[:limit])
+
+
+def iter_bar_chunks(queryset, cursor=None, limit=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Lists of BAR_FIELDS rows, one keyset query per chunk, so a large
+    range never needs a long running cursor or a materialized queryset.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        rows = read_bars(queryset, cursor=cursor, limit=size)
+        if len(rows) == 0:
+            return
+        yield [row[1:] for row in rows]
+        cursor = (rows[-1][0], rows[-1][1])
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+def get_bars_request(request, ticker):
+    interval = request.GET.get("interval", "5m")
+    if interval not in INTERVALS:
+        raise BadRequest(f"interval must be one of {', '.join(INTERVALS)}")
+    output = request.GET.get("format", "json")
+    if output not in exports.CONTENT_TYPES:
+        raise BadRequest(f"format must be one of {', '.join(exports.CONTENT_TYPES.keys())}")
+    end = parse_time_param(request.GET["to"], end_of_day=True) if request.GET.get("to") else timezone.now()
+    start = parse_time_param(request.GET["from"]) if request.GET.get("from") else end - timedelta(days=DEFAULT_RANGE_DAYS)
+    cursor = decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    return interval, output, start, end, cursor
+
+
+def get_etag(*parts):
+    return hashlib.sha1("|".join(f"{part}" for part in parts).encode()).hexdigest()
+
+
+def get_ticker_etag(request, ticker):
+    latest = (
+        LatestQuote.objects.filter(company__ticker=ticker.upper())
+        .values_list('time', 'updated')
+        .first()
+    )
+    if latest is None:
+        return None
+    return get_etag(request.path, request.GET.urlencode(), *latest)
+
+
+def get_universe_etag(request):
+    latest = LatestQuote.objects.filter(company__active=True).aggregate(
+        time=Max('time'),
+        updated=Max('updated')
+    )
+    if latest['time'] is None:
+        return None
+    return get_etag(request.path, request.GET.urlencode(), latest['time'], latest['updated'])
+
+
+@require_GET
+@condition(etag_func=get_ticker_etag)
+def bars_view(request, ticker):
+    company_obj = Company.objects.filter(ticker=ticker.upper()).first()
+    if company_obj is None:
+        return error_response(f"Company {ticker} not found", status=404)
+    try:
+        interval, output, start, end, cursor = get_bars_request(request, ticker)
+        queryset = get_bars_queryset(company_obj, interval).filter(time__range=(start, end))
+        if output == "json":
+            limit = get_int_param(request, "limit", DEFAULT_LIMIT, maximum=MAX_LIMIT)
+        else:
+            limit = get_int_param(request, "limit", None)
+    except BadRequest as e:
+        return error_response(f"{e}")
+    if output != "json":
+        if output == "arrow" and not exports.has_arrow():
+            return error_response("Arrow output needs pyarrow installed", status=406)
+        chunks = iter_bar_chunks(queryset, cursor=cursor, limit=limit)
+        response = StreamingHttpResponse(exports.ENCODERS[output](chunks), content_type=exports.CONTENT_TYPES[output])
+        if output == "csv":
+            response["Content-Disposition"] = f'attachment; filename="{company_obj.ticker}-{interval}.csv"'
+        return response
+    rows = read_bars(queryset, cursor=cursor, limit=limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+    return JsonResponse({
+        "ticker": company_obj.ticker,
+        "interval": interval,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "count": len(rows),
+        "results": [exports.row_to_dict(row[1:]) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+def get_ticker_indicators(ticker, days):
+    try:
+        return market_services.get_cached_stock_indicators(ticker=ticker, days=days)
+    except Exception as e:
+        return {"ticker": ticker, "error": f"{e}"}
+
+
+async def aget_ticker_indicators(ticker, days):
+    try:
+        return await market_services.aget_cached_stock_indicators(ticker=ticker, days=days)
+    except Exception as e:
+        return {"ticker": ticker, "error": f"{e}"}
+
+
+def get_universe_request(request):
+    days = get_int_param(request, "days", 30, maximum=365)
+    limit = get_int_param(request, "limit", DEFAULT_UNIVERSE_LIMIT, maximum=MAX_UNIVERSE_LIMIT)
+    cursor = decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    tickers = None
+    if request.GET.get("tickers"):
+        tickers = list(dict.fromkeys(
+            ticker.strip().upper() for ticker in request.GET["tickers"].split(",") if ticker.strip()
+        ))
+        if len(tickers) > MAX_TICKERS:
+            raise BadRequest(f"At most {MAX_TICKERS} tickers")
+    return days, limit, cursor, tickers
+
+
+def get_companies_page_queryset(cursor, limit):
+    companies = Company.objects.filter(active=True).order_by('id')
+    if cursor is not None:
+        companies = companies.filter(id__gt=cursor[0])
+    return companies.values_list('id', 'ticker')[:limit + 1]
+
+
+def universe_page_response(days, page, limit, results):
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1][0])
+    by_ticker = {result["ticker"]: result for result in results}
+    return JsonResponse({
+        "days": days,
+        "count": len(page),
+        "results": [by_ticker[ticker] for _, ticker in page if ticker in by_ticker],
+        "next_cursor": next_cursor,
+    })
+
+
+@require_GET
+@condition(etag_func=get_ticker_etag)
+def indicators_view(request, ticker):
+    try:
+        days = get_int_param(request, "days", 30, maximum=365)
+    except BadRequest as e:
+        return error_response(f"{e}")
+    data = get_ticker_indicators(ticker.upper(), days)
+    if "error" in data:
+        return error_response(data["error"], status=404)
+    return JsonResponse(data)
+
+
+@require_GET
+@condition(etag_func=get_universe_etag)
+def universe_indicators_view(request):
+    """
+    Indicators for `tickers`, or for active companies a page at a time.
+    """
+    try:
+        days, limit, cursor, tickers = get_universe_request(request)
+    except BadRequest as e:
+        return error_response(f"{e}")
+    if tickers is not None:
+        return JsonResponse({
+            "days": days,
+            "count": len(tickers),
+            "results": [get_ticker_indicators(ticker, days) for ticker in tickers],
+        })
+    page = list(get_companies_page_queryset(cursor, limit))
+    results = market_services.screen_universe(days=days, company_ids=[company_id for company_id, _ in page[:limit]])
+    return universe_page_response(days, page, limit, results)
+
+
+# Async versions for ASGI workers. `condition()` would call the ETag
+# function synchronously, so these check If-None-Match themselves.
+
+def get_not_modified(request, etag):
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=quote_etag(etag))
+
+
+def set_etag(response, etag):
+    if etag is not None:
+        response.headers.setdefault("ETag", quote_etag(etag))
+    return response
+
+
+async def aget_ticker_etag(request, ticker):
+    latest = await aiodb.fetch_one(
+        LatestQuote.objects.filter(company__ticker=ticker.upper()).values_list('time', 'updated')
+    )
+    if latest is None:
+        return None
+    return get_etag(request.path, request.GET.urlencode(), *latest)
+
+
+async def aget_universe_etag(request):
+    # `updated` moves with every upsert, so the newest row identifies the state
+    latest = await aiodb.fetch_one(
+        LatestQuote.objects.filter(company__active=True).order_by('-updated').values_list('time', 'updated')
+    )
+    if latest is None:
+        return None
+    return get_etag(request.path, request.GET.urlencode(), *latest)
+
+
+@require_GET
+async def aindicators_view(request, ticker):
+    try:
+        days = get_int_param(request, "days", 30, maximum=365)
+    except BadRequest as e:
+        return error_response(f"{e}")
+    etag = await aget_ticker_etag(request, ticker)
+    response = get_not_modified(request, etag)
+    if response is not None:
+        return response
+    data = await aget_ticker_indicators(ticker.upper(), days)
+    if "error" in data:
+        return error_response(data["error"], status=404)
+    return set_etag(JsonResponse(data), etag)
+
+
+@require_GET
+async def auniverse_indicators_view(request):
+    """
+    `universe_indicators_view` with each ticker's indicators
+    computed concurrently.
+    """
+    try:
+        days, limit, cursor, tickers = get_universe_request(request)
+    except BadRequest as e:
+        return error_response(f"{e}")
+    etag = await aget_universe_etag(request)
+    response = get_not_modified(request, etag)
+    if response is not None:
+        return response
+    if tickers is not None:
+        results = await asyncio.gather(*[aget_ticker_indicators(ticker, days) for ticker in tickers])
+        return set_etag(JsonResponse({
+            "days": days,
+            "count": len(tickers),
+            "results": results,
+        }), etag)
+    page = await aiodb.fetch(get_companies_page_queryset(cursor, limit))
+    results = await market_services.ascreen_universe(days=days, company_ids=[company_id for company_id, _ in page[:limit]])
+    return set_etag(universe_page_response(days, page, limit, results), etag)